@@ -0,0 +1,101 @@
+#%% README
+
+# Registry of parcellation atlases and the DEAPext dep vars measured on them
+
+# An Atlas holds the dep var prefix -> column mapping (compiled once into a longest-prefix lookup, so a prefix can never
+# be shadowed by a shorter one) and the heatmap column labels. ROI labels are not part of it: they are read from the
+# tables by every load and returned with its array, so the number and names of ROIs always come from the data.
+
+# Built-in atlases: ATLASES["desikan"], ATLASES["fiber.at"], ATLASES["aseg"], ATLASES["destrieux"]
+# To add another one:
+#     register_atlas(Atlas("name", {"dep var prefix" : 0, ...}, ["column label", ...], roi_prefix="name_", suffix="_NAME"))
+
+#%% Housekeeping
+import numpy as np
+
+#%% Function def
+
+def prefix_lookup(vars_dict): # longest-prefix match of a filename against the dep var prefixes, one dict probe per prefix length
+    lengths = sorted({len(x) for x in vars_dict}, reverse=True)
+    def match(filename):
+        for n in lengths:
+            column = vars_dict.get(filename[:n])
+            if column is not None:
+                return column
+        return None
+    return match
+
+class Atlas:
+    def __init__(self, name, vars_dict, xlabels=None, roi_prefix=None, suffix=''): # roi_prefix = text stripped up to in dep_var, suffix = output file tag
+        self.name = name
+        self.vars_dict = dict(vars_dict)
+        self.measures = sorted(self.vars_dict, key=self.vars_dict.get) # dep var prefixes in column order
+        self.xlabels = list(xlabels) if xlabels is not None else list(self.measures)
+        if len(self.xlabels) != len(self.measures):
+            raise ValueError("atlas %s has %d dep vars but %d xlabels" % (name, len(self.measures), len(self.xlabels)))
+        self.roi_prefix = roi_prefix
+        self.suffix = suffix
+        self.match = prefix_lookup(self.vars_dict)
+
+    def __repr__(self):
+        return "Atlas(%r, %d measures)" % (self.name, len(self.measures))
+
+    def __getstate__(self): # the lookup is a closure, rebuilt on unpickling so atlases can be sent to worker processes
+        return {k: v for (k, v) in self.__dict__.items() if k != 'match'}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.match = prefix_lookup(self.vars_dict)
+
+    def clean_rois(self, dep_var): # drop everything up to and including roi_prefix, e.g. "..._cort.desikan_ifpllh" -> "ifpllh"
+        dep_var = np.asarray(dep_var, dtype=str)
+        if self.roi_prefix is None:
+            return dep_var
+        return np.char.partition(dep_var, self.roi_prefix)[:, 2]
+
+ATLASES = {}
+
+def register_atlas(atlas):
+    ATLASES[atlas.name] = atlas
+    return atlas
+
+def as_atlas(atlas): # accept a registered name, an Atlas, or a bare {dep var prefix : column} dictionary
+    if isinstance(atlas, Atlas):
+        return atlas
+    if isinstance(atlas, str):
+        return ATLASES[atlas]
+    return Atlas(None, atlas)
+
+#%% Built-in atlases
+
+register_atlas(Atlas("desikan",
+                     {"dmri_dti.full.fa.gm_cort.desikan" : 0, "dmri_dti.full.fa.wm_cort.desikan" : 1, "dmri_dti.full.fa.gwc_cort.desikan" : 2,
+                      "dmri_dti.full.md.gm_cort.desikan" : 3, "dmri_dti.full.md.wm_cort.desikan" : 4, "dmri_dti.full.md.gwc_cort.desikan" : 5,
+                      "dmri_dti.full.ld.gm_cort.desikan" : 6, "dmri_dti.full.ld.wm_cort.desikan" : 7, "dmri_dti.full.ld.gwc_cort.desikan" : 8,
+                      "dmri_rsi.nd.gm_cort.desikan" : 9, "dmri_rsi.nd.wm_cort.desikan" : 10, "dmri_rsi.nd.gwc_cort.desikan" : 11,
+                      "dmri_rsi.n0.gm_cort.desikan" : 12, "dmri_rsi.n0.wm_cort.desikan" : 13, "dmri_rsi.n0.gwc_cort.desikan" : 14,
+                      "smri_thick_cort.desikan" : 15, "smri_area_cort.desikan" : 16, "smri_vol_cort.desikan" : 17},
+                     ["FA (GM)", "FA (WM)", "FA (GWC)",
+                      "MD (GM)", "MD (WM)", "MD (GWC)",
+                      "LD (GM)", "LD (WM)", "LD (GWC)",
+                      "ND (GM)", "ND (WM)", "ND (GWC)",
+                      "N0 (GM)", "N0 (WM)", "N0 (GWC)",
+                      "Thick", "Area", "Volume"],
+                     roi_prefix="desikan_"))
+
+register_atlas(Atlas("fiber.at",
+                     {"dmri_rsi.vol_fiber" : 0, "dmri_dti.fa_fiber.at" : 1, "dmri_dti.md_fiber.at" : 2,
+                      "dmri_dti.ld_fiber.at" : 3, "dmri_dti.td_fiber.at" : 4, "dmri_rsi.n0_fiber.at" : 5, "dmri_rsi.nd_fiber.at": 6},
+                     ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"],
+                     roi_prefix="fiber.at_", suffix="_AT"))
+
+register_atlas(Atlas("aseg",
+                     {"smri_vol_subcort.aseg" : 0, "dmri_dti.fa_subcort.aseg" : 1, "dmri_dti.md_subcort.aseg" : 2,
+                      "dmri_dti.ld_subcort.aseg" : 3, "dmri_dti.td_subcort.aseg" : 4, "dmri_rsi.n0_subcort.aseg" : 5, "dmri_rsi.nd_subcort.aseg": 6},
+                     ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"],
+                     roi_prefix="aseg_", suffix="_ASEG"))
+
+register_atlas(Atlas("destrieux",
+                     {"smri_thick_cort.destrieux" : 0, "smri_area_cort.destrieux" : 1, "smri_vol_cort.destrieux" : 2},
+                     ["Thick", "Area", "Volume"],
+                     roi_prefix="destrieux_", suffix="_DESTRIEUX"))
@@ -0,0 +1,111 @@
+#%% README
+
+# Batch rendering of heatmap PDFs over a process pool, so a whole study is rendered in roughly total time / n cores
+
+# Scripts collect one plot job per output file instead of rendering as they go, then hand the full list over at the end:
+#     jobs = []
+#     jobs.append(plot_job(save_dir, xlabels, [t1, t2]))                 # unmasked
+#     jobs.append(plot_job(save_dir, xlabels, [t1, t2], [p1, p2]))       # cells with p > alpha hidden
+#     failures = render_jobs(jobs, workers=None)                        # None = all cores, 1 = serial in this process
+#     failures = render_jobs(jobs, raster=True)                         # raster fast path, see heatmap_render.py
+
+# Jobs are drawn on bare matplotlib Figures through heatmap_render, so rendering in this process (workers=1 or a book)
+# never switches the pyplot backend of an interactive session; pool workers are set to the headless Agg backend. Each
+# worker builds a figure once per layout and reuses it for every job it is given. Every job is isolated: an exception
+# while rendering is recorded against its save path and the remaining jobs still render (if a worker process dies
+# outright, the jobs it left unfinished are reported as failed too). A summary of failures is printed at the end and the failures are returned as
+# [(save_path, traceback text)]. As with parallel ingest, on spawn platforms (Windows/macOS) a parallel render has to
+# be started from under `if __name__ == "__main__":`. Render and save spans (see instrument.py) timed in a worker are
+# sent back with its result and reported by this process.
+
+# Given book = path of a .pdf, every job becomes one page of that single multi-page PDF instead of a file of its own,
+# with <book>_index.csv listing page -> name (the file the job would otherwise have written, which carries the study,
+# atlas and masked tag), masked, and ROI/measure counts. Pages go through one PdfPages writer, so a book is rendered in
+# this process; failed jobs are left out of the book and the index.
+
+#%% Housekeeping
+import os
+import csv
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import instrument
+
+#%% Function def
+
+def plot_job(save_path, xlabels, tvalues, pvalues=None, figsize=(15,10), alpha=0.05): # tvalues = one (ROI x measure) array per panel, pvalues = per-panel p arrays (or None) to mask
+    return {"save_path": save_path, "xlabels": list(xlabels), "tvalues": list(tvalues),
+            "pvalues": None if pvalues is None else list(pvalues), "figsize": tuple(figsize), "alpha": alpha}
+
+def layout_order(job): # sort key grouping jobs that share a layout, so neighbouring jobs reuse one figure in a worker
+    return repr((job["tvalues"][0].shape, tuple(job["xlabels"]), len(job["tvalues"]), job["figsize"]))
+
+def init_worker(): # pool workers only: the renderer draws on bare Figures, so this process keeps whatever backend it has
+    import matplotlib
+    matplotlib.use("Agg") # headless, nothing is ever shown
+
+def init_pool_worker():
+    init_worker()
+    instrument.worker_mode()
+
+def render_job(job, raster=False, **savefig_kw): # (save_path, None) on success, (save_path, traceback text) on failure
+    try:
+        from heatmap_render import get_renderer
+        directory = os.path.dirname(job["save_path"]) if isinstance(job["save_path"], str) else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        renderer = get_renderer(job["tvalues"][0].shape, job["xlabels"], n_panels=len(job["tvalues"]), figsize=job["figsize"], raster=raster)
+        renderer.render(job["tvalues"], job["pvalues"], alpha=job["alpha"], save_path=job["save_path"], **savefig_kw)
+        return job["save_path"], None
+    except Exception:
+        return job["save_path"], traceback.format_exc()
+
+def render_pooled(job, raster=False): # render_job in a pool worker, with the spans it timed
+    return render_job(job, raster) + (instrument.drain(),)
+
+def page_name(job):
+    return os.path.splitext(os.path.basename(job["save_path"]))[0]
+
+def render_book(jobs, book, raster=False): # every job as one page of a single PDF in job order, [(save_path, error)] per job
+    from matplotlib.backends.backend_pdf import PdfPages
+    directory = os.path.dirname(book)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    results, index = [], []
+    with PdfPages(book) as pdf:
+        for job in jobs:
+            page = dict(job, save_path=pdf)
+            error = render_job(page, raster, format="pdf")[1]
+            results.append((job["save_path"], error))
+            if error is None:
+                index.append([len(index) + 1, page_name(job), job["pvalues"] is not None] + list(job["tvalues"][0].shape))
+    with open(os.path.splitext(book)[0] + '_index.csv', 'w', newline='') as csvfile:
+        wr = csv.writer(csvfile)
+        wr.writerow(["page", "name", "masked", "rois", "measures"])
+        wr.writerows(index)
+    return results
+
+def render_jobs(jobs, workers=None, book=None, raster=False): # render every job (into one multi-page book if given, raster = fast path of heatmap_render), returns [(save_path, traceback text)] for the ones that failed
+    start = time.perf_counter()
+    if book is not None:
+        results = render_book(jobs, book, raster)
+    elif workers == 1 or len(jobs) < 2:
+        results = [render_job(job, raster) for job in sorted(jobs, key=layout_order)]
+    else:
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker) as pool:
+            ordered = sorted(jobs, key=layout_order)
+            futures = [pool.submit(render_pooled, job, raster) for job in ordered]
+            results = []
+            for (job, future) in zip(ordered, futures):
+                try:
+                    (path, error, spans) = future.result()
+                    instrument.merge(spans)
+                    results.append((path, error))
+                except Exception: # worker died mid-job (e.g. killed or out of memory), the pool reports it here
+                    results.append((job["save_path"], traceback.format_exc()))
+    failures = [(path, error) for (path, error) in results if error is not None]
+    print("rendered %d of %d heatmaps in %.1f s" % (len(jobs) - len(failures), len(jobs), time.perf_counter() - start))
+    for (path, error) in failures:
+        print("FAILED %s: %s" % (path, error.strip().splitlines()[-1]))
+    return failures
@@ -0,0 +1,149 @@
+#%% README
+
+# Benchmark of the pipeline stages on synthetic DEAPext tables (see synthetic_coefs.py), no ABCD data needed
+
+# Times ingest (serial, process pool, cold and warm .npz cache), multiple-comparison correction, sig_rois export and
+# heatmap rendering (vector and raster) separately. Each stage is timed over --repeat runs, then run once more under
+# tracemalloc for its peak Python-side allocation (NumPy arrays included). Results go to a JSON file so runs on
+# different versions can be compared:
+#     {"meta": {commit, python, numpy, matplotlib, platform, cpus}, "params": {...},
+#      "stages": {stage: {"seconds": [...], "best": s, "median": s, "peak_bytes": n, "items": n}}, "max_rss_bytes": n}
+
+#     python benchmark.py --ind-vars 200 --levels exposuresone exposurestwo+ --out bench.json
+#     python benchmark.py --root analyses --ind-vars 50 --keep    # reuse / keep the generated tree
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from atlases import as_atlas
+from deap_coefs import coef_dirs, load_coefs, T, P
+from correction import correct
+from roi_lists import sig_rois
+from synthetic_coefs import write_tree
+
+#%% Function def
+
+def measure(func, repeat=3): # wall times of repeat runs, then the tracemalloc peak of one more
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": seconds, "best": min(seconds), "median": float(np.median(seconds)), "peak_bytes": peak}
+
+def max_rss(): # peak resident set size of this process, None where resource is unavailable (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024 # bytes on macOS, KiB on Linux
+
+def meta():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import matplotlib
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__, "matplotlib": matplotlib.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count()}
+
+def run_benchmark(root_dir, ind_vars, levels=None, atlases=("desikan", "fiber.at", "aseg"), repeat=3, workers=None,
+                  n_figures=6, scratch=None): # {stage : result}, tables already written under root_dir
+    scratch = scratch or tempfile.mkdtemp(prefix="bench_")
+    directories = coef_dirs(root_dir, ind_vars)
+    category = levels[0] if levels else None
+    n_files = sum(len(os.listdir(d)) for d in directories)
+    stages = {}
+
+    load = lambda **kw: [load_coefs(directories, atlas, category, **kw) for atlas in atlases]
+    stages["ingest_serial"] = measure(lambda: load(workers=1), repeat)
+    stages["ingest_parallel"] = measure(lambda: load(workers=workers), repeat)
+    cache_dir = os.path.join(scratch, "cache")
+    def cold():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return load(workers=workers, cache_dir=cache_dir)
+    stages["ingest_cache_cold"] = measure(cold, repeat)
+    stages["ingest_cache_warm"] = measure(lambda: load(workers=workers, cache_dir=cache_dir), repeat)
+    for stage in ("ingest_serial", "ingest_parallel", "ingest_cache_cold", "ingest_cache_warm"):
+        stages[stage]["items"] = n_files
+
+    loaded = load(workers=workers, cache_dir=cache_dir)
+    pvalues = [coefs[...,P] for (coefs, rois) in loaded]
+    n_tests = sum(p.size for p in pvalues)
+    for family in ("atlas", "study"):
+        stages["correct_bh_" + family] = dict(measure(lambda: correct(pvalues, "bh", family), repeat), items=n_tests)
+
+    names = [folder + '.csv' for folder in ind_vars]
+    lists_dir = os.path.join(scratch, "lists")
+    def export():
+        for (atlas, (coefs, rois)) in zip(atlases, loaded):
+            sig_rois(coefs[...,T], coefs[...,P], as_atlas(atlas).xlabels, rois, os.path.join(lists_dir, atlas), names)
+    stages["sig_rois"] = dict(measure(export, repeat), items=len(names) * len(atlases))
+
+    from heatmap_render import get_renderer # plotting is imported only for the render stages
+    coefs, rois = loaded[0]
+    xlabels = as_atlas(atlases[0]).xlabels
+    figures = [(coefs[k % len(coefs),:,:,T], coefs[k % len(coefs),:,:,P]) for k in range(n_figures)]
+    for (stage, raster, ext) in (("render_vector_pdf", False, ".pdf"), ("render_raster_pdf", True, ".pdf"), ("render_raster_png", True, ".png")):
+        renderer = get_renderer(coefs.shape[1:3], xlabels, raster=raster)
+        renderer.render([figures[0][0], figures[0][0]], [None, figures[0][1]], save_path=os.path.join(scratch, "warmup" + ext)) # layout / background built once
+        def render():
+            for (k, (t, p)) in enumerate(figures):
+                renderer.render([t, t], [None, p], save_path=os.path.join(scratch, "figure_%d%s" % (k, ext)))
+        stages[stage] = dict(measure(render, repeat), items=n_figures)
+    return stages
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingest, correction, list export and rendering on synthetic tables")
+    parser.add_argument("--ind-vars", type=int, default=20, help="number of synthetic ind_var folders")
+    parser.add_argument("--levels", nargs="+", help="factor levels of a categorical ind_var (default continuous)")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="processes for parallel ingest, 0 = all cores")
+    parser.add_argument("--figures", type=int, default=6, help="heatmaps per render stage")
+    parser.add_argument("--root", help="dir for the synthetic tree (default a temporary dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic tree and scratch outputs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="benchmark_results.json")
+    args = parser.parse_args(argv)
+
+    work = tempfile.mkdtemp(prefix="bench_")
+    root_dir = args.root or os.path.join(work, "analyses")
+    start = time.perf_counter()
+    ind_vars = write_tree(root_dir, args.ind_vars, args.levels, args.atlas, seed=args.seed)
+    generate = time.perf_counter() - start
+    try:
+        stages = run_benchmark(root_dir, ind_vars, args.levels, args.atlas, args.repeat, args.workers or None,
+                               args.figures, os.path.join(work, "scratch"))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+            if args.root:
+                for folder in ind_vars:
+                    shutil.rmtree(os.path.join(root_dir, folder), ignore_errors=True)
+    results = {"meta": meta(), "params": dict(vars(args), generate_seconds=generate), "stages": stages, "max_rss_bytes": max_rss()}
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=1)
+    for (stage, r) in stages.items():
+        print("%-20s best %8.4f s  median %8.4f s  peak %8.1f MB  (%d items)" % (stage, r["best"], r["median"], r["peak_bytes"] / 1e6, r["items"]))
+    print("results written to %s" % args.out)
+
+if __name__ == "__main__":
+    main()
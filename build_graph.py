@@ -0,0 +1,79 @@
+#%% README
+
+# Build manifest for incremental runs of run_studies.py (--incremental / --watch)
+
+# Every output (heatmap PDF, masked PDF, sig_rois list) is recorded with a key hashed from the content hashes of the
+# table_coefs files it was made from and the parameters it was made with. On a rerun an output is rebuilt only if it
+# is missing or its key changed; a study with nothing stale is not even loaded. Input files are re-hashed only when
+# their size or mtime changed, so checking an unchanged tree costs one stat per table.
+
+# The manifest is a JSON file, <plots_dir>/.build_manifest.json by default:
+#     {"inputs": {path : [size, mtime_ns, digest]}, "outputs": {output : key}}
+# where output is a file path, or "<archive>::<name>" for a list written into a .zip.
+
+#%% Housekeeping
+import hashlib
+import json
+import os
+import zipfile
+from coef_cache import file_digest, read_bytes
+from coef_archive import archive_index, split_source
+
+#%% Function def
+
+def output_exists(output):
+    if '::' in output: # list inside an archive
+        archive, name = output.split('::', 1)
+        if not os.path.exists(archive):
+            return False
+        with zipfile.ZipFile(archive) as zf:
+            return name in zf.namelist()
+    return os.path.exists(output)
+
+class BuildState:
+    def __init__(self, path):
+        self.path = path
+        self.inputs, self.outputs = {}, {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    manifest = json.load(f)
+                self.inputs, self.outputs = manifest["inputs"], manifest["outputs"]
+            except (OSError, ValueError, KeyError): # unreadable manifest, everything is rebuilt
+                pass
+
+    def digests(self, paths): # {path : content hash}, hashing only files whose size or mtime changed
+        result = {}
+        for path in paths:
+            archive, member = split_source(path)
+            if archive is not None: # archive member: its zip CRC, or tar size + mtime, stand in for the content hash
+                size, mtime, digest = archive_index(archive).stat(member)
+                self.inputs[path] = [size, mtime, digest or "tar:%d:%d" % (size, mtime)]
+                result[path] = self.inputs[path][2]
+                continue
+            st = os.stat(path)
+            entry = self.inputs.get(path)
+            if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                entry = self.inputs[path] = [st.st_size, st.st_mtime_ns, file_digest(read_bytes(path))]
+            result[path] = entry[2]
+        return result
+
+    @staticmethod
+    def key(digests, params): # one hash over the input hashes and the parameters an output is made with
+        blob = json.dumps([sorted(digests.items()), params], sort_keys=True, default=str)
+        return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+    def stale(self, output, key):
+        return self.outputs.get(output) != key or not output_exists(output)
+
+    def record(self, output, key):
+        self.outputs[output] = key
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f: # write then rename so an interrupted run never leaves a half-written manifest
+            json.dump({"inputs": self.inputs, "outputs": self.outputs}, f)
+        os.replace(tmp, self.path)
@@ -0,0 +1,165 @@
+#%% README
+
+# DEAPext results read straight out of .zip / .tar(.gz/.bz2/.xz) archives of the analyses tree, without extracting them
+
+# Give the archive as root_dir, optionally followed by "::" and the folder inside it that plays the part of analyses:
+#     coefs, rois = load_coefs(coef_dirs("deap_outputs.zip::analyses", ind_vars), "desikan")
+#     root_dir = os.path.join(os.getcwd(), 'deap_outputs.tar.gz')         # in a script, members at the archive root
+# Table directories and files inside an archive are written "<archive>::<dir inside it>[/<file>]". The member list is
+# read once per archive (and again only if the archive file changes) into an index of directory -> files, which serves
+# every listing. Zip members and members of an uncompressed .tar are read by offset, so a process pool parses them in
+# parallel with each worker opening the archive itself; a compressed tar can only be read front to back, so the tables
+# a load needs are pulled out in one sequential pass and then parsed in the pool. The .npz cache (coef_cache.py) is not
+# used for archive members; build manifests (build_graph.py) key them by the zip CRC, or by size and mtime for a tar.
+
+#%% Housekeeping
+import io
+import os
+import tarfile
+import zipfile
+
+EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+#%% Function def
+
+def is_archive(path):
+    return path.lower().endswith(EXTENSIONS)
+
+def member_name(name): # "./analyses/x/" -> "analyses/x", as tar members are often written
+    name = name.strip('/')
+    while name.startswith('./'):
+        name = name[2:]
+    return name
+
+def split_source(path): # (archive, member path inside it), or (None, path) for a plain file or directory
+    if '::' in path:
+        archive, member = path.split('::', 1)
+        return archive, member_name(member)
+    if is_archive(path):
+        return path, ''
+    return None, path
+
+def join_source(root, *parts): # os.path.join that stays inside an archive
+    archive, inner = split_source(root)
+    if archive is None:
+        return os.path.join(root, *parts)
+    return archive + '::' + '/'.join(p for p in (inner,) + parts if p)
+
+class ArchiveIndex:
+    def __init__(self, path):
+        self.path = path
+        self.kind = 'zip' if path.lower().endswith('.zip') else 'tar'
+        self.seekable = self.kind == 'zip' or path.lower().endswith('.tar') # members can be read by offset
+        self.dirs = {} # directory : {filename : ZipInfo or TarInfo}
+        if self.kind == 'zip':
+            with zipfile.ZipFile(path) as zf:
+                infos = [(member_name(info.filename), info) for info in zf.infolist() if not info.is_dir()]
+        else:
+            with tarfile.open(path, 'r:*') as tf: # one pass, a compressed tar has no central directory
+                infos = [(member_name(info.name), info) for info in tf if info.isfile()]
+        self.children = {} # directory : set of subdirectories
+        for (name, info) in infos:
+            directory, _, filename = name.rpartition('/')
+            self.dirs.setdefault(directory, {})[filename] = info
+            while directory:
+                parent, _, child = directory.rpartition('/')
+                self.children.setdefault(parent, set()).add(child)
+                directory = parent
+        self._zip = None
+
+    def listdir(self, directory): # filenames directly in directory, like os.listdir for the files
+        if directory not in self.dirs and directory not in self.children:
+            raise FileNotFoundError("no directory %s in %s" % (directory, self.path))
+        return list(self.dirs.get(directory, {}))
+
+    def subdirs(self, directory):
+        return sorted(self.children.get(directory, ()))
+
+    def isdir(self, directory):
+        return directory in self.dirs or directory in self.children
+
+    def info(self, member):
+        directory, _, filename = member.rpartition('/')
+        try:
+            return self.dirs[directory][filename]
+        except KeyError:
+            raise FileNotFoundError("no member %s in %s" % (member, self.path)) from None
+
+    def stat(self, member): # (size, mtime_ns, digest or None) without reading the member
+        info = self.info(member)
+        if self.kind == 'zip':
+            return info.file_size, 0, "crc32:%08x" % info.CRC # date_time is only to the 2 s, the CRC says more
+        return info.size, int(info.mtime * 1e9), None
+
+    def read(self, member):
+        info = self.info(member)
+        if self.kind == 'zip':
+            if self._zip is None or self._zip[0] != os.getpid(): # kept open, one handle per process (a forked worker must not share the parent's file offset)
+                self._zip = (os.getpid(), zipfile.ZipFile(self.path))
+            return self._zip[1].read(info)
+        if self.seekable:
+            with open(self.path, 'rb') as f:
+                f.seek(info.offset_data)
+                return f.read(info.size)
+        return self.read_many([member])[0]
+
+    def read_many(self, members): # every member in the given order, a compressed tar in one pass over the archive
+        if self.seekable:
+            return [self.read(member) for member in members]
+        wanted = {member: k for (k, member) in enumerate(members)}
+        blobs = [None] * len(members)
+        with tarfile.open(self.path, 'r:*') as tf:
+            for info in tf:
+                k = wanted.get(member_name(info.name))
+                if k is not None:
+                    blobs[k] = tf.extractfile(info).read()
+        return blobs
+
+_indexes = {} # archive path : (size, mtime_ns, ArchiveIndex)
+def archive_index(path):
+    st = os.stat(path)
+    cached = _indexes.get(path)
+    if cached is None or cached[:2] != (st.st_size, st.st_mtime_ns):
+        cached = _indexes[path] = (st.st_size, st.st_mtime_ns, ArchiveIndex(path))
+    return cached[2]
+
+def listdir(directory):
+    archive, inner = split_source(directory)
+    return os.listdir(directory) if archive is None else archive_index(archive).listdir(inner)
+
+def subdirs(directory): # sorted subdirectory names, hidden ones (e.g. .coef_cache) left out
+    archive, inner = split_source(directory)
+    if archive is None:
+        names = [entry.name for entry in os.scandir(directory) if entry.is_dir()]
+    else:
+        names = archive_index(archive).subdirs(inner)
+    return sorted(name for name in names if not name.startswith('.'))
+
+def isdir(directory):
+    archive, inner = split_source(directory)
+    return os.path.isdir(directory) if archive is None else archive_index(archive).isdir(inner)
+
+def source_size(path):
+    archive, inner = split_source(path)
+    return os.path.getsize(path) if archive is None else archive_index(archive).stat(inner)[0]
+
+def parse_member(path): # parse_coefs of one archive member, for the process pool
+    from deap_coefs import parse_coefs
+    archive, inner = split_source(path)
+    return parse_coefs(io.BytesIO(archive_index(archive).read(inner)))
+
+def parse_blob(data):
+    from deap_coefs import parse_coefs
+    return parse_coefs(io.BytesIO(data))
+
+def archive_coefs(paths, workers=1): # parse_coefs over archive members, results keep path order
+    from deap_coefs import map_coefs
+    sources = [split_source(path) for path in paths]
+    if all(archive_index(archive).seekable for archive in {archive for (archive, inner) in sources}):
+        return map_coefs(parse_member, paths, workers) # every worker reads its own members
+    blobs = [None] * len(paths)
+    for archive in {archive for (archive, inner) in sources}: # one pass per compressed archive, then parse in the pool
+        ks = [k for (k, (a, inner)) in enumerate(sources) if a == archive]
+        for (k, data) in zip(ks, archive_index(archive).read_many([sources[k][1] for k in ks])):
+            blobs[k] = data
+    return map_coefs(parse_blob, blobs, workers)
@@ -0,0 +1,93 @@
+#%% README
+
+# On-disk cache of parsed DEAPext coefficient tables, used by load_coefs(..., cache_dir=...)
+
+# Each table_coefs folder gets one uncompressed .npz in cache_dir holding the parsed dep_var, parameter_comp and stat
+# columns of every file, keyed by filename, size, mtime and content hash:
+#     - size + mtime unchanged -> cached arrays are used without opening the .csv
+#     - mtime changed but contents hash the same (e.g. a copy or touch) -> cached arrays are used, entry refreshed
+#     - anything else -> file is re-parsed (in the process pool if workers != 1) and the entry replaced
+
+#%% Housekeeping
+import numpy as np
+import hashlib
+import io
+import os
+from deap_coefs import STATS, map_coefs, parse_coefs
+
+#%% Function def
+
+def file_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def parse_hashed(path): # one read per file: hash the raw bytes, then parse them
+    data = read_bytes(path)
+    return file_digest(data), parse_coefs(io.BytesIO(data))
+
+def cache_path(cache_dir, directory): # one cache file per table_coefs folder
+    key = hashlib.blake2b(os.path.abspath(directory).encode(), digest_size=8).hexdigest()
+    return os.path.join(cache_dir, key + '.npz')
+
+def read_cache(path): # {filename : (size, mtime_ns, digest, parsed)}
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            files, size, mtime, digest, offsets = npz["files"], npz["size"], npz["mtime"], npz["digest"], npz["offsets"]
+            dep_var, level, stats = npz["dep_var"], npz["level"], npz["stats"]
+    except (OSError, ValueError, KeyError): # unreadable or older cache layout, rebuild it
+        return {}
+    entries = {}
+    for (k, filename) in enumerate(files):
+        a, b = offsets[k], offsets[k + 1]
+        entries[str(filename)] = (int(size[k]), int(mtime[k]), str(digest[k]), (dep_var[a:b], level[a:b], stats[a:b]))
+    return entries
+
+def write_cache(path, entries):
+    files = sorted(entries)
+    parsed = [entries[f][3] for f in files]
+    offsets = np.cumsum([0] + [len(p[0]) for p in parsed])
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f: # write then rename so an interrupted run never leaves a half-written cache
+        np.savez(f, files=np.array(files, dtype=str),
+                 size=np.array([entries[x][0] for x in files], dtype=np.int64),
+                 mtime=np.array([entries[x][1] for x in files], dtype=np.int64),
+                 digest=np.array([entries[x][2] for x in files], dtype=str), offsets=offsets,
+                 dep_var=np.concatenate([p[0] for p in parsed]), level=np.concatenate([p[1] for p in parsed]),
+                 stats=np.concatenate([p[2] for p in parsed]).reshape(-1, len(STATS)))
+    os.replace(tmp, path)
+
+def cached_coefs(paths, cache_dir, workers=1): # parse_coefs over paths, served from cache_dir where the file is unchanged
+    os.makedirs(cache_dir, exist_ok=True)
+    caches = {} # directory : cache entries
+    changed = set()
+    results = [None] * len(paths)
+    misses = []
+    for (k, path) in enumerate(paths):
+        directory, filename = os.path.split(path)
+        if directory not in caches:
+            caches[directory] = read_cache(cache_path(cache_dir, directory))
+        st = os.stat(path)
+        entry = caches[directory].get(filename)
+        if entry is not None and entry[0] == st.st_size and entry[1] == st.st_mtime_ns:
+            results[k] = entry[3]
+        elif entry is not None and entry[0] == st.st_size and entry[2] == file_digest(read_bytes(path)):
+            results[k] = entry[3] # touched but identical, keep the parse and remember the new mtime
+            caches[directory][filename] = (st.st_size, st.st_mtime_ns, entry[2], entry[3])
+            changed.add(directory)
+        else:
+            misses.append((k, directory, filename, st))
+
+    parsed = map_coefs(parse_hashed, [paths[k] for (k, directory, filename, st) in misses], workers)
+    for ((k, directory, filename, st), (digest, result)) in zip(misses, parsed):
+        results[k] = result
+        caches[directory][filename] = (st.st_size, st.st_mtime_ns, digest, result)
+        changed.add(directory)
+
+    for directory in changed:
+        write_cache(cache_path(cache_dir, directory), caches[directory])
+    return results
@@ -0,0 +1,77 @@
+#%% README
+
+# Multiple-comparison correction of p-values over whole result arrays
+
+# Methods: 'bh' (Benjamini-Hochberg FDR), 'by' (Benjamini-Yekutieli FDR), 'bonferroni', 'holm'
+# Families, for (ind_var x ROI x measure) p-value arrays such as coefs[...,P], or a list of them (one per atlas):
+#     'measure' - each ind_var x measure column, across ROIs
+#     'atlas'   - each ind_var, across every ROI x measure of one atlas
+#     'study'   - each ind_var, across every atlas passed together
+#     'tensor'  - everything passed, all ind_vars and atlases pooled
+# Every family is corrected at once: families become rows of a 2D array, sorted with one argsort, and the step-up /
+# step-down adjustments are cumulative min/max along the rows. NaN (measures with no file) are left out of the
+# family size and stay NaN.
+
+#     qvalues = correct(coefs[...,P], 'bh', 'atlas') # same shape, use in place of p-values for masks and sig_rois
+
+#%% Housekeeping
+import numpy as np
+from instrument import span
+
+METHODS = ("bh", "by", "bonferroni", "holm")
+FAMILIES = ("measure", "atlas", "study", "tensor")
+
+#%% Function def
+
+def adjust_rows(p, method="bh"): # p = 2D array, each row one family corrected on its own
+    if method not in METHODS:
+        raise ValueError("unknown correction %r, expected one of %s" % (method, ", ".join(METHODS)))
+    p = np.asarray(p, dtype=float)
+    valid = ~np.isnan(p)
+    m = valid.sum(axis=1, keepdims=True) # family size excludes NaN
+    if method == "bonferroni":
+        return np.minimum(p * m, 1) # no ordering needed
+    order = np.argsort(np.where(valid, p, np.inf), axis=1, kind="stable") # NaN sorted to the end of each row
+    ps = np.take_along_axis(p, order, axis=1)
+    rank = np.arange(1, p.shape[1] + 1)
+    if method == "holm": # step-down: running max of (m - i + 1) * p_(i)
+        qs = np.fmax.accumulate((m - rank + 1) * ps, axis=1)
+    else: # step-up: running min from the largest p of m / i * p_(i)
+        qs = ps * m / rank
+        if method == "by": # scale by the harmonic number c(m) for arbitrary dependence
+            harmonic = np.concatenate([[1.0], np.cumsum(1.0 / rank)])
+            qs = qs * harmonic[m]
+        qs = np.fmin.accumulate(qs[:, ::-1], axis=1)[:, ::-1] # fmin skips the trailing NaN
+    q = np.empty_like(qs)
+    np.put_along_axis(q, order, np.minimum(qs, 1), axis=1) # back to the original cell order
+    q[~valid] = np.nan
+    return q
+
+def adjust(pvalues, method="bh", axis=None): # correct over the given axes (a family per combination of the others), None = all
+    p = np.asarray(pvalues, dtype=float)
+    axes = tuple(range(p.ndim)) if axis is None else tuple(a % p.ndim for a in np.atleast_1d(axis))
+    keep = [a for a in range(p.ndim) if a not in axes]
+    moved = np.transpose(p, keep + list(axes))
+    size = int(np.prod(moved.shape[len(keep):]))
+    q = adjust_rows(moved.reshape(-1, size), method).reshape(moved.shape)
+    return np.transpose(q, np.argsort(keep + list(axes)))
+
+def correct(pvalues, method="bh", family="atlas"): # q-values shaped like pvalues (an array or a list of per-atlas arrays), method None = no correction
+    if method is None:
+        return pvalues
+    if family not in FAMILIES:
+        raise ValueError("unknown family %r, expected one of %s" % (family, ", ".join(FAMILIES)))
+    with span("correct", method=method, family=family): # nested calls for a list of arrays are folded into this span
+        if not isinstance(pvalues, (list, tuple)):
+            if family == "measure":
+                return adjust(pvalues, method, axis=-2) # ROI axis
+            if family == "tensor":
+                return adjust(pvalues, method)
+            return adjust(pvalues, method, axis=(-2, -1)) # 'atlas' and 'study' agree for a single atlas
+        if family in ("measure", "atlas"):
+            return [correct(p, method, family) for p in pvalues]
+        arrays = [np.asarray(p, dtype=float) for p in pvalues]
+        flat = np.concatenate([p.reshape(p.shape[:-2] + (-1,)) for p in arrays], axis=-1) # (ind_var x every ROI/measure of every atlas)
+        q = adjust(flat, method, axis=None if family == "tensor" else -1)
+        splits = np.cumsum([p.shape[-2] * p.shape[-1] for p in arrays])[:-1]
+        return [part.reshape(p.shape) for (part, p) in zip(np.split(q, splits, axis=-1), arrays)]
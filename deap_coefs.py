@@ -0,0 +1,162 @@
+#%% README
+
+# Shared loader for the .csv outputs of DEAPext.R, found in analyses/<folder>/<var>/tables/table_coefs
+
+# Each coefficient file is parsed exactly once and t-value, p-value, estimate and standard error are pulled together
+# into a single array per atlas (see atlases.py) with axes (ind_var x ROI x measure x stat); index the last axis with
+# T/P/EST/SE, e.g.
+#     coefs, rois = load_coefs(coef_dirs(root_dir, ind_vars), "desikan")
+#     tvalues_one, pvalues_one = coefs[0,:,:,T], coefs[0,:,:,P]
+
+# Files are independent, so parsing can be fanned out to a process pool with workers=N (None = all cores); results are
+# assembled in sorted file order so the array is identical to a serial run. On spawn platforms (Windows/macOS) a
+# parallel ingest has to be started from under `if __name__ == "__main__":`
+
+# Passing cache_dir keeps parsed tables in a binary .npz cache (see coef_cache.py) so re-running a cell only re-parses
+# files whose size, mtime or contents changed
+
+# root_dir can also be a .zip / .tar.gz archive of the analyses tree, read without extracting it (see coef_archive.py)
+
+# Each load is timed as discover / parse / assemble spans (see instrument.py) instead of printing every filename
+
+# For a categorical ind_var, load_levels pivots parameter_comp once per file into a levels axis, so any number of
+# factor levels costs one parse and one sort of each file:
+#     coefs, rois = load_levels(coef_dirs(root_dir, ind_vars), "desikan", ["exposuresone", "exposurestwo+"])
+#     tvalues_one, tvalues_two = coefs[0,0,:,:,T], coefs[1,0,:,:,T]     # (level x ind_var x ROI x measure x stat)
+# load_coefs without a category raises ValueError for a table with more than one level, rather than reading the rows
+# of every level as extra ROIs.
+
+#%% Housekeeping
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from atlases import as_atlas
+from instrument import span
+from coef_archive import archive_coefs, join_source, listdir, source_size, split_source
+
+STATS = ["t value", "Pr(>|t|)", "Estimate", "Std. Error"] # order of the stat axis
+T, P, EST, SE = range(len(STATS))
+COLUMNS = ["dep_var", "parameter_comp"] + STATS
+
+#%% Function def
+
+def coef_dirs(root_dir, ind_vars): # ind_vars = {folder : var name}, or a list of folders holding tables directly
+    if isinstance(ind_vars, dict):
+        return [join_source(root_dir, folder, var, "tables", "table_coefs") for folder, var in ind_vars.items()]
+    return [join_source(root_dir, folder, "tables", "table_coefs") for folder in ind_vars]
+
+def list_coefs(directory, atlas): # [(filename, column)] for every file matching a dep var of the atlas, sorted so column order is deterministic
+    atlas = as_atlas(atlas)
+    files = []
+    for file in sorted(listdir(directory)): # a directory, or one inside an archive (see coef_archive.py)
+        filename = os.fsdecode(file)
+        column = atlas.match(filename)
+        if column is not None:
+            files.append((filename, column))
+    return files
+
+def parse_coefs(source): # every row of one file (path or file object): (dep_var, parameter_comp, rows x STATS array)
+    import pandas as pd # imported on first parse, so runs served from the cache never load it
+    df = pd.read_csv(source, usecols=lambda c: c in COLUMNS).reindex(columns=COLUMNS) # missing columns come back as NaN
+    stats = df[STATS].to_numpy(dtype=float)
+    return df["dep_var"].to_numpy(dtype=str), df["parameter_comp"].to_numpy(dtype=str), stats
+
+def select_level(parsed, category=None, path="table"): # pick the factor level to compare for a categorical ind_var, all rows of a single-level table otherwise
+    dep_var, level, stats = parsed
+    if category is None:
+        levels = np.unique(level)
+        if len(levels) > 1: # the rows of every level would otherwise be read as extra ROIs
+            raise ValueError("%s has %d factor levels (%s), pass category= one of them or use load_levels"
+                             % (path, len(levels), ", ".join(levels)))
+        return dep_var, stats
+    rows = level == category
+    return dep_var[rows], stats[rows]
+
+def read_coefs(path, category=None): # single parse per file, returns (dep_var labels, rows x STATS array)
+    return select_level(parse_coefs(path), category, path)
+
+def map_coefs(func, paths, workers=1): # func over paths, in a process pool unless workers == 1, results keep path order
+    if workers == 1 or len(paths) < 2:
+        return [func(path) for path in paths]
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    chunksize = max(1, len(paths) // (4 * workers)) # a few chunks per worker to amortize pickling without starving the pool
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, paths, chunksize=chunksize))
+
+def pivot_levels(parsed, levels): # (dep_var, level x rows x STATS array) from one parse, NaN for a level the file lacks
+    dep_var, level, stats = parsed
+    names, inverse = np.unique(level, return_inverse=True)
+    index = {name: k for (k, name) in enumerate(levels)}
+    codes = np.array([index.get(name, -1) for name in names], dtype=np.intp)[inverse.ravel()] # -1 = level not asked for
+    order = np.argsort(codes, kind="stable") # rows grouped by level, ROI order kept within each
+    order = order[codes[order] >= 0]
+    counts = np.bincount(codes[order], minlength=len(levels))
+    n_rows = counts.max() if len(order) else 0
+    if np.any((counts != 0) & (counts != n_rows)):
+        raise ValueError("factor levels have different numbers of rows: %s" % dict(zip(levels, counts.tolist())))
+    pivoted = np.full((len(levels), n_rows, stats.shape[1]), np.nan)
+    labels = None
+    for (k, start) in enumerate(np.cumsum(counts) - counts):
+        if counts[k]:
+            rows = order[start:start + counts[k]]
+            if labels is None:
+                labels = dep_var[rows]
+            elif not np.array_equal(dep_var[rows], labels):
+                raise ValueError("factor level %s lists its ROIs in a different order" % levels[k])
+            pivoted[k] = stats[rows]
+    return (labels if labels is not None else dep_var[:0]), pivoted
+
+def table_rois(atlas, dep_var, rois, path): # cleaned ROI labels of one table, which must be the ones the other tables of the load list
+    labels = atlas.clean_rois(dep_var)
+    if rois is not None and not np.array_equal(labels, rois):
+        raise ValueError("%s lists %d ROIs that differ from the %d of the other %s tables" % (path, len(labels), len(rois), atlas.name))
+    return labels
+
+def read_tables(directories, atlas, workers=1, cache_dir=None): # [(ind_var index, column, path)] and the parse of each file
+    with span("discover", atlas=atlas.name, dirs=len(directories)) as counts:
+        jobs = [(i, column, join_source(directory, filename)) for (i, directory) in enumerate(directories)
+                for (filename, column) in list_coefs(directory, atlas)]
+        counts["files"] = len(jobs)
+    paths = [path for (i, column, path) in jobs]
+    in_archive = any(split_source(path)[0] is not None for path in paths)
+    with span("parse", atlas=atlas.name, files=len(paths), bytes=sum(map(source_size, paths)), cached=cache_dir is not None and not in_archive):
+        if in_archive: # members streamed out of the archive, never extracted
+            results = archive_coefs(paths, workers)
+        elif cache_dir is None:
+            results = map_coefs(parse_coefs, paths, workers)
+        else:
+            from coef_cache import cached_coefs # only re-parses files that changed since the last run
+            results = cached_coefs(paths, cache_dir, workers)
+    return jobs, results
+
+def load_coefs(directories, atlas, category=None, workers=1, cache_dir=None): # returns (ind_var x ROI x measure x stat array, cleaned ROI labels)
+    atlas = as_atlas(atlas) # registered name, Atlas or bare vars_dict
+    jobs, results = read_tables(directories, atlas, workers, cache_dir)
+    with span("assemble", atlas=atlas.name, files=len(jobs)) as counts:
+        coefs, rois = None, None
+        for ((i, column, path), parsed) in zip(jobs, results):
+            dep_var, stats = select_level(parsed, category, path)
+            rois = table_rois(atlas, dep_var, rois, path) # ordered parcellations are the same in every file of one load
+            if coefs is None: # number of ROIs comes from the data
+                coefs = np.full((len(directories), len(rois), len(atlas.measures), len(STATS)), np.nan) # NaN marks measures with no file
+            coefs[i,:,column,:] = stats
+        if coefs is None:
+            coefs, rois = np.full((len(directories), 0, len(atlas.measures), len(STATS)), np.nan), np.empty(0, dtype=str)
+        counts["bytes"] = coefs.nbytes
+    return coefs, rois
+
+def load_levels(directories, atlas, levels, workers=1, cache_dir=None): # returns (level x ind_var x ROI x measure x stat array, cleaned ROI labels), one parse per file for every level
+    atlas = as_atlas(atlas)
+    jobs, results = read_tables(directories, atlas, workers, cache_dir)
+    with span("assemble", atlas=atlas.name, files=len(jobs), levels=len(levels)) as counts:
+        coefs, rois = None, None
+        for ((i, column, path), parsed) in zip(jobs, results):
+            dep_var, stats = pivot_levels(parsed, levels)
+            rois = table_rois(atlas, dep_var, rois, path)
+            if coefs is None:
+                coefs = np.full((len(levels), len(directories), len(rois), len(atlas.measures), len(STATS)), np.nan)
+            coefs[:,i,:,column,:] = stats
+        if coefs is None:
+            coefs, rois = np.full((len(levels), len(directories), 0, len(atlas.measures), len(STATS)), np.nan), np.empty(0, dtype=str)
+        counts["bytes"] = coefs.nbytes
+    return coefs, rois
@@ -0,0 +1,247 @@
+#%% README
+
+# Reusable two-panel (+ colorbar) heatmap figure, replacing a new plt.subplots / sns.heatmap / diverging_palette per plot
+
+# A HeatmapRenderer lays out the panels, meshes and colorbar once for a given (ROI x measure) shape and set of column
+# labels; each render() only swaps the mesh data and mask, saves, and blanks the meshes again. Figures are built on
+# matplotlib.figure.Figure directly so they never register with pyplot, and get_renderer() keeps one renderer per
+# layout, up to the MAX_RENDERERS most recently used (an older one is dropped and freed), so memory stays flat however
+# many heatmaps or colour ranges a process goes through. The look matches sns.heatmap with the
+# diverging_palette(220, 20, sep=20) colormap used throughout the scripts.
+
+#     renderer = get_renderer(tvalues.shape, atlas.xlabels)
+#     renderer.render([t1, t2], save_path=save_dir)                 # unmasked
+#     renderer.render([t1, t2], [p1, p2], save_path=save_dir)       # cells with p > alpha hidden
+#     renderer.render([t1, t1], [None, p1], save_path=save_dir)     # unmasked | masked
+
+# Raster fast path, get_renderer(..., raster=True): t-values are mapped to colours through an RGBA lookup table of the
+# same colormap with NumPy indexing, and hidden cells get alpha 0. Labels, ticks and colorbar are drawn once per dpi
+# (the MAX_BACKGROUNDS most recent are kept) into a background image; a .png or .pdf save then only scatters the cell colours into the panel areas of a copy of
+# that background and writes it out directly (the PDF holds the image as a single page), so matplotlib never draws
+# per plot. Any other target (another format, extra savefig options, a PdfPages book) draws the figure as usual, with
+# the cells as one image per panel instead of a QuadMesh.
+
+# Each render() is timed as a render span (filling in the cells) and a save span (drawing and writing the file, see
+# instrument.py); for vector output the draw happens inside savefig, so it is counted under save.
+
+#%% Housekeeping
+import seaborn as sns
+from seaborn.utils import axis_ticklabels_overlap
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize
+from PIL import Image
+import numpy as np
+import io
+import os
+import struct
+import zlib
+from instrument import span
+
+MAX_BACKGROUNDS = 4 # raster backgrounds (one per dpi) kept per renderer
+
+#%% Function def
+
+_cmap = None
+def diverging_cmap(): # built once per process
+    global _cmap
+    if _cmap is None:
+        _cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
+    return _cmap
+
+_lut = None
+def diverging_lut(): # (N x 4) uint8 RGBA table of diverging_cmap
+    global _lut
+    if _lut is None:
+        cmap = diverging_cmap()
+        _lut = cmap(np.arange(cmap.N), bytes=True)
+    return _lut
+
+def cell_colors(tvalues, pvalues=None, alpha=0.05, vmin=-4, vmax=4): # (ROI x measure x RGBA) uint8, alpha 0 where the cell is hidden
+    lut = diverging_lut()
+    t = np.asarray(tvalues, dtype=float)
+    scaled = (t - vmin) * (len(lut) / (vmax - vmin)) # same binning as Normalize + Colormap, out of range clipped to the ends
+    index = np.clip(np.nan_to_num(scaled), 0, len(lut) - 1).astype(np.intp)
+    rgba = lut[index]
+    hide = np.isnan(t) if pvalues is None else np.isnan(t) | (np.asarray(pvalues) > alpha)
+    rgba[hide, 3] = 0
+    return rgba
+
+def png_stream(rgb): # zlib stream of the image rows, each with the PNG 'Sub' filter (also valid as PDF FlateDecode /Predictor 15)
+    rows = rgb.reshape(rgb.shape[0], -1)
+    sub = rows.copy()
+    sub[:, 3:] -= rows[:, :-3] # uint8 wraps around, as the filter expects
+    return zlib.compress(np.concatenate([np.ones((len(rows), 1), np.uint8), sub], axis=1).tobytes(), 3)
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+def png_bytes(rgb, dpi=100):
+    height, width = rgb.shape[:2]
+    ppm = int(round(dpi / 0.0254))
+    return (b"\x89PNG\r\n\x1a\n" + png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + png_chunk(b"pHYs", struct.pack(">IIB", ppm, ppm, 1)) + png_chunk(b"IDAT", png_stream(rgb))
+            + png_chunk(b"IEND", b""))
+
+def write_png(path, rgb, dpi=100):
+    with open(path, 'wb') as f:
+        f.write(png_bytes(rgb, dpi))
+
+def write_pdf(path, rgb, dpi=100): # one page holding the image at its size in inches
+    height, width = rgb.shape[:2]
+    w, h = width * 72 / dpi, height * 72 / dpi
+    data = png_stream(rgb)
+    content = b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (w, h)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] /Resources << /XObject << /Im0 4 0 R >> >> /Contents 5 0 R >>" % (w, h),
+               b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB /BitsPerComponent 8 /Filter /FlateDecode "
+               b"/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >> /Length %d >>\nstream\n" % (width, height, width, len(data))
+               + data + b"\nendstream",
+               b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"]
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for (k, obj) in enumerate(objects):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % (k + 1) + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1) + b"".join(b"%010d 00000 n \n" % o for o in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, 'wb') as f:
+        f.write(out)
+
+class HeatmapRenderer:
+    def __init__(self, shape, xlabels, n_panels=2, figsize=(15,10), vmin=-4, vmax=4, raster=False):
+        n_rows, n_cols = shape
+        self.shape = (n_rows, n_cols)
+        self.vmin, self.vmax = vmin, vmax
+        self.raster = raster
+        self.fig = Figure(figsize=figsize)
+        axes = self.fig.subplots(1, n_panels, sharey=True, squeeze=False)[0]
+        self.fig.tight_layout()
+        self.cax = self.fig.add_axes([1, 0.0275, 0.05, 0.95]) # axes for cbar [horizontal, vertical, width, height]
+        self.axes = list(axes)
+        self.meshes = []
+        for ax in axes:
+            if raster: # one RGBA image per panel, filled from the lookup table
+                mesh = ax.imshow(np.zeros(self.shape + (4,), np.uint8), extent=(0, n_cols, n_rows, 0), interpolation='nearest', aspect='auto')
+            else:
+                mesh = ax.pcolormesh(np.ma.masked_all(self.shape), cmap=diverging_cmap(), vmin=vmin, vmax=vmax)
+            ax.set(xlim=(0, n_cols), ylim=(0, n_rows))
+            ax.invert_yaxis() # first ROI on top, as in sns.heatmap
+            ax.set_xticks(np.arange(n_cols) + 0.5)
+            ax.set_xticklabels(xlabels)
+            ax.set_yticks([])
+            ax.tick_params(labelsize=14, size=0, rotation=45)
+            if axis_ticklabels_overlap(ax.get_xticklabels()): # same fallback as sns.heatmap
+                ax.tick_params(axis='x', rotation=90)
+            for spine in ax.spines.values():
+                spine.set_visible(False)
+            self.meshes.append(mesh)
+        mappable = ScalarMappable(Normalize(vmin, vmax), diverging_cmap()) if raster else self.meshes[-1]
+        cbar = self.fig.colorbar(mappable, cax=self.cax)
+        cbar.outline.set_linewidth(0)
+        self.cax.tick_params(labelsize=16, size=0, rotation=270)
+        if raster: # the layout never changes, so the tight bounding box is measured once instead of on every save
+            self.bbox = self.fig.get_tightbbox(FigureCanvasAgg(self.fig).get_renderer()).padded(0.1)
+            self.backgrounds = {} # dpi : (background RGB, [(row slice, col slice, pixels per row, pixels per column, empty colour)] per panel)
+
+    def background(self, dpi): # labels and colorbar drawn once per dpi, with where each panel's cells land in the image
+        if dpi in self.backgrounds:
+            self.backgrounds[dpi] = self.backgrounds.pop(dpi) # most recently used last
+        else:
+            while len(self.backgrounds) >= MAX_BACKGROUNDS:
+                self.backgrounds.pop(next(iter(self.backgrounds)))
+            self.clear()
+            buf = io.BytesIO()
+            self.fig.savefig(buf, format='png', dpi=dpi, bbox_inches=self.bbox)
+            rgb = np.array(Image.open(buf).convert("RGB"))
+            fig_w, fig_h = self.fig.get_size_inches()
+            panels = []
+            for ax in self.axes:
+                pos = ax.get_position()
+                rows, row_counts = self.pixel_cells((self.bbox.y1 - pos.y1 * fig_h) * dpi, (self.bbox.y1 - pos.y0 * fig_h) * dpi, rgb.shape[0], self.shape[0]) # from the top
+                cols, col_counts = self.pixel_cells((pos.x0 * fig_w - self.bbox.x0) * dpi, (pos.x1 * fig_w - self.bbox.x0) * dpi, rgb.shape[1], self.shape[1])
+                panels.append((rows, cols, row_counts, col_counts, rgb[rows.start, cols.start].copy()))
+            self.backgrounds[dpi] = (rgb, panels)
+        return self.backgrounds[dpi]
+
+    @staticmethod
+    def pixel_cells(start, stop, size, n): # pixels whose centres fall inside [start, stop), and how many of them each cell covers
+        centres = np.arange(size) + 0.5
+        inside = np.nonzero((centres >= start) & (centres < stop))[0]
+        index = np.minimum(((centres[inside] - start) * (n / (stop - start))).astype(np.intp), n - 1)
+        return slice(inside[0], inside[-1] + 1), np.bincount(index, minlength=n)
+
+    def raster_image(self, tvalues, pvalues, alpha=0.05, dpi=100): # (height x width x RGB) uint8 of the whole figure, nothing drawn by matplotlib
+        with span("render", raster=True):
+            rgb, panels = self.background(dpi)
+            out = rgb.copy()
+            for ((rows, cols, row_counts, col_counts, blank), t, p) in zip(panels, tvalues, pvalues):
+                cells = cell_colors(t, p, alpha, self.vmin, self.vmax)
+                colors = np.where(cells[..., 3:] > 0, cells[..., :3], blank) # hidden cells show the empty panel
+                out[rows, cols] = np.repeat(np.repeat(colors, row_counts, axis=0), col_counts, axis=1) # nearest-neighbour upscale
+        return out
+
+    def write_raster(self, tvalues, pvalues, alpha, save_path, dpi):
+        out = self.raster_image(tvalues, pvalues, alpha, dpi)
+        with span("save", files=1) as counts:
+            (write_pdf if save_path.lower().endswith('.pdf') else write_png)(save_path, out, dpi)
+            counts["bytes"] = os.path.getsize(save_path)
+
+    def render(self, tvalues, pvalues=None, alpha=0.05, save_path=None, **savefig_kw): # one t array per panel, pvalues = per-panel p arrays (or None) to mask p > alpha
+        if pvalues is None:
+            pvalues = [None] * len(tvalues)
+        if (self.raster and isinstance(save_path, str) and save_path.lower().endswith(('.png', '.pdf'))
+                and set(savefig_kw) <= {'dpi'}):
+            self.write_raster(tvalues, pvalues, alpha, save_path, savefig_kw.get('dpi', self.fig.dpi))
+            return self.fig
+        with span("render", raster=self.raster):
+            for (mesh, t, p) in zip(self.meshes, tvalues, pvalues):
+                if self.raster:
+                    mesh.set_data(cell_colors(t, p, alpha, self.vmin, self.vmax))
+                else:
+                    hide = np.isnan(t) if p is None else np.isnan(t) | (p > alpha)
+                    mesh.set_array(np.ma.array(t, mask=hide))
+        if save_path is not None:
+            with span("save", files=1) as counts:
+                self.fig.savefig(save_path, bbox_inches=self.bbox if self.raster else 'tight', **savefig_kw)
+                if isinstance(save_path, str):
+                    counts["bytes"] = os.path.getsize(save_path)
+            self.clear()
+        return self.fig
+
+    def clear(self): # blank every panel so no data outlives its plot
+        for mesh in self.meshes:
+            if self.raster:
+                mesh.set_data(np.zeros(self.shape + (4,), np.uint8))
+            else:
+                mesh.set_array(np.ma.masked_all(self.shape))
+
+    def close(self):
+        self.fig.clear()
+        self.meshes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+MAX_RENDERERS = 16 # layouts kept at once, the least recently used one is dropped beyond that
+_renderers = {} # key : renderer, in order of last use
+def get_renderer(shape, xlabels, n_panels=2, figsize=(15,10), vmin=-4, vmax=4, raster=False): # one cached renderer per layout
+    key = (tuple(shape), tuple(xlabels), n_panels, tuple(figsize), vmin, vmax, raster)
+    renderer = _renderers.pop(key, None)
+    if renderer is None:
+        renderer = HeatmapRenderer(shape, xlabels, n_panels, figsize, vmin, vmax, raster)
+        while len(_renderers) >= MAX_RENDERERS:
+            _renderers.pop(next(iter(_renderers))) # not closed, a caller may still hold it
+    _renderers[key] = renderer # re-inserted, so it moves to the most recently used end
+    return renderer
+
+def close_renderers():
+    for renderer in _renderers.values():
+        renderer.close()
+    _renderers.clear()
@@ -0,0 +1,187 @@
+#%% README
+
+# Local heatmap server: the studies of a spec (see run_studies.py) loaded once, heatmaps rendered on request
+
+# Parsed t/p arrays stay in memory, so changing the threshold, correction or colour range never re-reads a table.
+# Heatmaps go through the raster fast path of heatmap_render straight to PNG bytes. Rendered images are kept in an LRU
+# cache keyed by (study, atlas, ind_var, alpha, correction, family, vmin, vmax, masked, dpi), and q-values in one keyed
+# by (study, correction, family). A new threshold or correction only recolours the cells (tens of ms); a new colour
+# range redraws the colorbar once for that layout. Each response carries X-Cache (hit/miss) and X-Render-Ms headers.
+
+#     python heatmap_server.py studies.yaml --port 8050            # then open http://127.0.0.1:8050/
+#     GET /heatmap.png?study=reading&atlas=desikan&masked=1&alpha=0.01&correction=bh&vmin=-3&vmax=3
+#     GET /heatmap.png?study=reading&atlas=aseg&ind_var=reading_hours      # one panel, all panels side by side if omitted
+#     GET /list.csv?study=reading&atlas=aseg&ind_var=reading_hours&alpha=0.01  # sig_rois list for the same settings
+
+# Only for use on your own machine: it binds to 127.0.0.1 by default and has no authentication.
+
+#%% Housekeeping
+import argparse
+import functools
+import html
+import io
+import math
+import time
+import traceback
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+from atlases import as_atlas
+from deap_coefs import T, P
+from correction import correct, METHODS, FAMILIES
+from roi_lists import sig_table, write_table
+from run_studies import load_spec, spec_atlas, study_settings
+from tables_only import load_study, panel_names
+
+MAX_DPI = 300 # larger images are refused, one is held in memory per cached response
+
+#%% Function def
+
+class HeatmapService:
+    def __init__(self, spec, only=None, cache_size=256):
+        self.studies = {} # name : (settings, panel names, {atlas name : (atlas, coefs, rois)})
+        memo = {}
+        for study in spec["studies"]:
+            if only is not None and study.get("name") not in only:
+                continue
+            s = study_settings(spec, study)
+            atlases = [as_atlas(spec_atlas(a)) for a in s["atlases"]]
+            loaded = load_study(s["root_dir"], s["ind_vars"], atlases, s["category"], None, workers=s["workers"], cache_dir=s["cache_dir"], memo=memo)
+            self.studies[s["name"]] = (s, panel_names(s["ind_vars"], s["category"]),
+                                       {atlas.name: (atlas, coefs, rois) for (atlas, coefs, rois, q) in loaded})
+        self.qvalues = functools.lru_cache(maxsize=64)(self.qvalues)
+        self.heatmap = functools.lru_cache(maxsize=cache_size)(self.heatmap)
+
+    def panels(self, study, atlas, ind_var=None): # (atlas, coefs, rois, [panel index])
+        s, names, atlases = self.studies[study]
+        atlas, coefs, rois = atlases[atlas]
+        return atlas, coefs, rois, (list(range(len(names))) if ind_var is None else [names.index(ind_var)])
+
+    def qvalues(self, study, correction, family): # {atlas : q-values}, one correction per study shared by every image
+        s, names, atlases = self.studies[study]
+        q = correct([coefs[...,P] for (atlas, coefs, rois) in atlases.values()], correction, family) # family may span the atlases
+        return dict(zip(atlases, q))
+
+    def heatmap(self, study, atlas, ind_var=None, alpha=0.05, correction=None, family="atlas", vmin=-4, vmax=4, masked=False, dpi=100): # PNG bytes
+        from heatmap_render import get_renderer, png_bytes
+        atlas, coefs, rois, panels = self.panels(study, atlas, ind_var)
+        q = self.qvalues(study, correction, family)[atlas.name]
+        tvalues = [coefs[k,:,:,T] for k in panels]
+        pvalues = [q[k] for k in panels] if masked else [None] * len(panels)
+        figsize = tuple(self.studies[study][0]["figsize"])
+        renderer = get_renderer(tvalues[0].shape, atlas.xlabels, n_panels=len(panels), figsize=figsize, vmin=vmin, vmax=vmax, raster=True)
+        return png_bytes(renderer.raster_image(tvalues, pvalues, alpha, dpi), dpi)
+
+    def sig_list(self, study, atlas, ind_var, alpha=0.05, correction=None, family="atlas"): # csv text of sig_rois for one panel
+        atlas, coefs, rois, [k] = self.panels(study, atlas, ind_var)
+        q = self.qvalues(study, correction, family)[atlas.name]
+        text = io.StringIO(newline='')
+        write_table(text, atlas.xlabels, sig_table(coefs[k,:,:,T], coefs[k,:,:,P], rois, alpha, None if correction is None else q[k]))
+        return text.getvalue()
+
+    def settings(self, study, query, image=False): # request parameters, falling back on the study's own settings; ValueError for any out of range
+        s = self.studies[study][0]
+        get = lambda key, default: query.get(key, [default])[0]
+        correction = get("correction", s["correction"])
+        if correction in ("", "none", None):
+            correction = None
+        elif correction not in METHODS:
+            raise ValueError("unknown correction %r, expected none or one of %s" % (correction, ", ".join(METHODS)))
+        family = get("family", s["family"])
+        if family not in FAMILIES:
+            raise ValueError("unknown family %r, expected one of %s" % (family, ", ".join(FAMILIES)))
+        alpha = float(get("alpha", s["alpha"]))
+        if not 0 < alpha <= 1:
+            raise ValueError("alpha must be in (0, 1], got %r" % alpha)
+        settings = {"alpha": alpha, "correction": correction, "family": family}
+        if image:
+            vmin, vmax, dpi = float(get("vmin", -4)), float(get("vmax", 4)), int(get("dpi", 100))
+            if not (math.isfinite(vmin) and math.isfinite(vmax) and vmin < vmax):
+                raise ValueError("need finite vmin < vmax, got %r, %r" % (vmin, vmax))
+            if not 0 < dpi <= MAX_DPI:
+                raise ValueError("dpi must be in 1..%d, got %d" % (MAX_DPI, dpi))
+            settings.update(vmin=vmin, vmax=vmax, dpi=dpi, masked=get("masked", "0") not in ("0", ""))
+        return settings
+
+    def warm(self): # draw the default layout of every study and atlas before the first request
+        for study in self.studies:
+            settings = self.settings(study, {}, image=True) # same arguments as a request without parameters, so lru_cache serves it
+            for atlas in self.studies[study][2]:
+                self.heatmap(study, atlas, None, **settings)
+
+    def index_page(self):
+        rows = []
+        for (study, (s, names, atlases)) in self.studies.items():
+            for atlas in atlases:
+                links = [('heatmap', {"study": study, "atlas": atlas}), ('masked', {"study": study, "atlas": atlas, "masked": 1})]
+                links += [(name + ' list', {"study": study, "atlas": atlas, "ind_var": name}) for name in names]
+                rows.append("<li>%s / %s: %s</li>" % (html.escape(study), html.escape(atlas), ' '.join(
+                    '<a href="/%s?%s">%s</a>' % ('list.csv' if label.endswith(' list') else 'heatmap.png', html.escape(urlencode(query)), html.escape(label))
+                    for (label, query) in links)))
+        return ("<html><body><h3>Heatmaps</h3><p>add alpha, correction (%s or none), family, vmin, vmax, masked=1, ind_var, dpi "
+                "to any link</p><ul>%s</ul></body></html>" % (', '.join(METHODS), ''.join(rows))).encode()
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            start = time.perf_counter()
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            try:
+                if url.path == '/':
+                    body, kind, cache = service.index_page(), 'text/html; charset=utf-8', None
+                elif url.path in ('/heatmap.png', '/list.csv'):
+                    study, atlas = query["study"][0], query["atlas"][0]
+                    ind_var = query.get("ind_var", [None])[0]
+                    settings = service.settings(study, query, image=url.path == '/heatmap.png')
+                    if url.path == '/list.csv':
+                        if ind_var is None:
+                            raise ValueError("list.csv needs an ind_var")
+                        body, kind, cache = service.sig_list(study, atlas, ind_var, **settings).encode("ISO-8859-1"), 'text/csv', None
+                    else:
+                        hits = service.heatmap.cache_info().hits
+                        body = service.heatmap(study, atlas, ind_var, **settings)
+                        kind, cache = 'image/png', 'hit' if service.heatmap.cache_info().hits > hits else 'miss'
+                else:
+                    self.send_error(404)
+                    return
+            except (KeyError, ValueError) as err: # unknown study / atlas / ind_var, or a malformed parameter
+                self.send_error(400, explain=str(err))
+                return
+            except Exception as err: # anything else is a bug, reported to the client instead of dropping the connection
+                traceback.print_exc()
+                self.send_error(500, explain="%s: %s" % (type(err).__name__, err))
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", kind)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("X-Render-Ms", "%.1f" % ((time.perf_counter() - start) * 1000))
+            if cache is not None:
+                self.send_header("X-Cache", cache)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args): # one short line per request instead of the default access log
+            print("%s %s" % (self.command, self.path))
+    return Handler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the heatmaps of a study spec with live thresholds")
+    parser.add_argument("spec", help="study spec, .yaml/.yml, .toml or .json (see run_studies.py)")
+    parser.add_argument("--only", nargs="+", help="names of the studies to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8050)
+    parser.add_argument("--cache-size", type=int, default=256, help="rendered images kept in memory")
+    args = parser.parse_args(argv)
+    service = HeatmapService(load_spec(args.spec), args.only, args.cache_size)
+    service.warm()
+    server = HTTPServer((args.host, args.port), make_handler(service))
+    print("serving %d studies on http://%s:%d/" % (len(service.studies), args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,12 @@
 #%% Housekeeping
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import pandas as pd
-import numpy as np
 import os
+from atlases import Atlas
+from batch_render import plot_job, render_jobs
+import instrument
+from deap_coefs import coef_dirs, load_coefs, T, P
 #%% Import t-scores and p-values
 root_dir = os.path.join(os.getcwd(),'analyses')
+jobs = [] # heat maps are queued here and rendered together below
 
 folders = ["psych_total", "psych_severity"]
 
@@ -20,68 +20,43 @@ vars_dict = {"dmri_dti.full.fa.gm_cort.desikan" : 0, "dmri_dti.full.fa.wm_cort.d
              "dmri_rsi.nds2.wm_cort.desikan" : 3, "smri_t2w.gray02_cort.desikan" : 4, "smri_t2w.white02_cort.desikan" : 5, 
              "smri_vol_cort.desikan" : 6}
 
-# initialize dataframes
-# df_total = pd.DataFrame(data=None, columns=dep_vars)
-# df_severity = pd.DataFrame(data=None, columns=dep_vars)
-df_total = np.zeros((71,7), dtype=float)
-df_severity = np.zeros((71,7), dtype=float)
-total_pvalues = np.zeros((71,7), dtype=float)
-severity_pvalues = np.zeros((71,7), dtype=float)
-
-# iterate through folders and build dataframe
-for names in folders:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in dep_vars:
-            if filename.startswith(x):
-                if names == "psych_total":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_total[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    total_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "psych_severity":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_severity[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    severity_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
+xlabels = ["FA (GM)", "FA (WM)", "NODDI (GM)", "NODDI (WM)", "T2 (GM)", "T2 (WM)", "Volume"]
 
-#%% Generate heat maps
+atlas = Atlas("desikan_psychosis", vars_dict, xlabels, roi_prefix="desikan_") # custom set of Desikan dep vars, not in the registry
 
-cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas)
+df_total, df_severity = coefs[0,:,:,T], coefs[1,:,:,T] # views into coefs, no copies
+total_pvalues, severity_pvalues = coefs[0,:,:,P], coefs[1,:,:,P]
 
-xlabels = ["FA (GM)", "FA (WM)", "NODDI (GM)", "NODDI (WM)", "T2 (GM)", "T2 (WM)", "Volume"]
-
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-spec = gridspec.GridSpec(ncols=2, nrows=1, figure=fig)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, cbar=True, cbar_ax=ax3)
+#%% Generate heat maps
 
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis_heatmaps.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], figsize=(15,10)))
 
 #%% Generate masked heat maps
 
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False, mask=(total_pvalues>0.05))
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, 
-            mask=(severity_pvalues>0.05), cbar=True, cbar_ax=ax3)
-
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis_heatmaps_masked.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], [total_pvalues, severity_pvalues], figsize=(15,10)))
+
+#%% Render heat maps
+render = True # {False = SKIP RENDERING THE HEAT MAPS}
+render_workers = 1 # {NUMBER OF PROCESSES FOR RENDERING, 1 = SERIAL, None = ALL CORES (ON macOS/WINDOWS ONLY FROM UNDER if __name__ == "__main__":)}
+book = None # {OR os.path.join(os.getcwd(), 'plots', 'psychosis_heatmaps_all.pdf') TO WRITE EVERY HEAT MAP AS A PAGE OF ONE .pdf, PLUS A PAGE INDEX}
+raster = False # {True = FAST RASTER HEAT MAPS, CELLS AND LABELS AS ONE IMAGE, SEE heatmap_render.py}
+if render:
+    failures = render_jobs(jobs, render_workers, book, raster) # both heat maps, failures are summarized rather than stopping the run
+instrument.print_summary() # time, CPU and memory per stage (discover, parse, ..., save), SEE instrument.py
 
 #%% 2D histograms for FA WM vs. NODDI GM
+import seaborn as sns # only this cell plots directly
 
 sns.scatterplot(x=df_total[:,2], y=df_total[:,3])
             
+
+#%% Similarity of every t-map (each ind_var x measure) to every other, see tmap_similarity.py
+from tmap_similarity import tmaps, similarity, render_similarity
+
+maps, map_labels = tmaps(coefs, list(ind_vars), xlabels)
+map_similarity = similarity(maps, "pearson") # {OR "spearman"}
+render_similarity(map_similarity, map_labels, os.path.join(os.getcwd(), 'plots', 'psychosis_similarity.pdf'))
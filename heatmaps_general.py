@@ -18,185 +18,87 @@
 # Specify each custom input whereever there are curly brackets with capslock text
 
 #%% Housekeeping
-import seaborn as sns
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
 import os
-import csv
-from itertools import zip_longest
+from atlases import ATLASES
+from deap_coefs import coef_dirs, load_coefs, T, P
+from roi_lists import sig_rois
+from batch_render import plot_job, render_jobs
+import instrument
+from correction import correct
 
 #%% Function def
 
-def substr_after(s, delim): # partition finds the matchand splits the string into a tuple of [0/1/2] = before/match/after, s = string, delim = 
-    return s.partition(delim)[2] # return everything afterwards
-
-def sig_rois(tvalues, pvalues, columns, rois, filepath, filename): # inputs: columns = list of structural parameter ind_var, rois = list of parcellations
-    output = [[] for i in range(len(columns))] # initialize list of lists
-    #
-    for (i,row) in enumerate(tvalues):
-        for (j,value) in enumerate(row):
-            if pvalues[i,j] < 0.05:
-                string = rois[i] + ', ' + str(round(tvalues[i,j],5)) + ', ' + str(round(pvalues[i,j],5))
-                output[j].append(string)
-        
-    export_data = zip_longest(*output, fillvalue = '') # transpose to vertical columns
-    with open(os.path.join(filepath, filename), 'w', encoding="ISO-8859-1", newline='') as csvfile:
-      wr = csv.writer(csvfile)
-      wr.writerow((columns))
-      wr.writerows(export_data)
-      
-def heatmap(t1, p1, save_dir, xlabels):
-    cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
-    fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-    fig.tight_layout()
-    ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-    ax1.tick_params(labelsize=14, size=0, rotation=45)
-    ax2.tick_params(labelsize=14, size=0, rotation=45)
-    ax3.tick_params(labelsize=16, size=0, rotation=270)
-    sns.heatmap(t1, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-    sns.heatmap(t1, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, mask=(p1>0.05), cbar=True, cbar_ax=ax3)
-
-    fig.savefig(save_dir, bbox_inches='tight')
+def heatmap(t1, p1, save_dir, xlabels): # plot job for render_jobs, unmasked | masked
+    return plot_job(save_dir, xlabels, [t1, t1], [None, p1])
     
 #%% Import t-scores and p-values (DESIKAN)
 root_dir = os.path.join(os.getcwd(), "analyses") # {ENTER DIR OF ANALYSIS FOLDERS}
+workers = 1 # {NUMBER OF PROCESSES FOR PARSING .CSV FILES, None = ALL CORES, 1 = SERIAL}
+correction = None # {None = MASK/LIST ON RAW p < 0.05, OR 'bh', 'by', 'bonferroni', 'holm' TO USE CORRECTED q-values}
+family = 'atlas' # {'measure' OR 'atlas', FAMILY OF TESTS TO CORRECT OVER, SEE correction.py}
+jobs = [] # heat maps are queued here and rendered together in the last cell
+archive = None # {OR os.path.join(os.getcwd(), 'plots', ind_var, 'lists.zip') TO WRITE EVERY LIST INTO ONE .zip}
 
 ind_var = 'affected' # {VAR NAME}
 category = 'affectedYes' # {NAME OF THE ACTUAL VARIABLE IN .CSV (pick the factor level you want to compare for a categorical, otherwise same as ind_var)}
 
-vars_dict = {"dmri_dti.full.fa.gm_cort.desikan" : 0, "dmri_dti.full.fa.wm_cort.desikan" : 1, "dmri_dti.full.fa.gwc_cort.desikan" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.full.md.gm_cort.desikan" : 3, "dmri_dti.full.md.wm_cort.desikan" : 4, "dmri_dti.full.md.gwc_cort.desikan" : 5, 
-             "dmri_dti.full.ld.gm_cort.desikan" : 6, "dmri_dti.full.ld.wm_cort.desikan" : 7, "dmri_dti.full.ld.gwc_cort.desikan" : 8, 
-             "dmri_rsi.nd.gm_cort.desikan" : 9, "dmri_rsi.nd.wm_cort.desikan" : 10, "dmri_rsi.nd.gwc_cort.desikan" : 11,  
-             "dmri_rsi.n0.gm_cort.desikan" : 12, "dmri_rsi.n0.wm_cort.desikan" : 13, "dmri_rsi.n0.gwc_cort.desikan" : 14,             
-             "smri_thick_cort.desikan" : 15, "smri_area_cort.desikan" : 16, "smri_vol_cort.desikan" : 17}
-
-xlabels = ["FA (GM)", "FA (WM)", "FA (GWC)", # {CHANGE THESE TO MATCH DEP VAR ind_var}
-           "MD (GM)", "MD (WM)", "MD (GWC)", 
-           "LD (GM)", "LD (WM)", "LD (GWC)", 
-           "ND (GM)", "ND (WM)", "ND (GWC)", 
-           "N0 (GM)", "N0 (WM)", "N0 (GWC)", 
-           "Thick", "Area", "Volume"]
-
-tvalues_one = np.zeros((71,18), dtype=float) # {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-pvalues_one = np.zeros((71,18), dtype=float)
-run_once = 0
-roi_parc = []
-# iterate through folders and build dataframe
-for file in os.listdir(os.path.join(root_dir, ind_var, "tables", "table_coefs")): # iterate through a file list in dir
-    filename = os.fsdecode(file)
-    for x in vars_dict:
-        if "desikan" in filename and run_once == 0:
-            roi_parc = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["dep_var"])
-            roi_parc = roi_parc["dep_var"].values # convert to np array
-            run_once = 1 # only grab ROIs once
-        if filename.startswith(x):
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "t value"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"t value"] # need to slice x:x+1 rather than x
-            tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "Pr(>|t|)"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"Pr(>|t|)"] # need to slice x:x+1 rather than x
-            pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            print(filename)
-                
+atlas = ATLASES["desikan"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over the table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, [ind_var]), atlas, category, workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, str(ind_var) + '_heatmaps.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, pvalues_one, save_dir, xlabels)
+jobs.append(heatmap(coefs[0,:,:,T], qvalues[0], save_dir, xlabels))
 
-# partition ordered parcellation ind_var
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "desikan_")
-    i = i + 1
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, str(ind_var) + '.csv')
+sig_rois(coefs[0,:,:,T], coefs[0,:,:,P], xlabels, roi_parc, save_dir, str(ind_var) + '.csv',
+         qvalues=None if correction is None else qvalues[0], archive=archive)
 
 #%% Import t-scores and p-values (DTI ATLAS)
 
-vars_dict = {"dmri_rsi.vol_fiber" : 0, "dmri_dti.fa_fiber.at" : 1, "dmri_dti.md_fiber.at" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.ld_fiber.at" : 3, "dmri_dti.td_fiber.at" : 4, "dmri_rsi.n0_fiber.at" : 5, "dmri_rsi.nd_fiber.at": 6}
-
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
-# {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-tvalues_one = np.zeros((42,7), dtype=float)
-pvalues_one = np.zeros((42,7), dtype=float)
-run_once = 0
-roi_parc = []
-# iterate through folders and build dataframe
-for file in os.listdir(os.path.join(root_dir, ind_var, "tables", "table_coefs")): # iterate through a file list in dir
-    filename = os.fsdecode(file)
-    for x in vars_dict:
-        if "fiber.at" in filename and run_once == 0:
-            roi_parc = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["dep_var"])
-            roi_parc = roi_parc["dep_var"].values # convert to np array
-            run_once = 1 # only grab ROIs once
-        if filename.startswith(x):
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "t value"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"t value"] # need to slice x:x+1 rather than x
-            tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "Pr(>|t|)"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"Pr(>|t|)"] # need to slice x:x+1 rather than x
-            pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            print(filename)
-        
+atlas = ATLASES["fiber.at"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over the table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, [ind_var]), atlas, category, workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, str(ind_var) + '_heatmaps_AT.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, pvalues_one, save_dir, xlabels)
+jobs.append(heatmap(coefs[0,:,:,T], qvalues[0], save_dir, xlabels))
 
-# partition ordered parcellation ind_var
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "fiber.at_")
-    i = i + 1
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, str(ind_var) + '_AT.csv')
+sig_rois(coefs[0,:,:,T], coefs[0,:,:,P], xlabels, roi_parc, save_dir, str(ind_var) + '_AT.csv',
+         qvalues=None if correction is None else qvalues[0], archive=archive)
 
 #%% Import t-scores and p-values (ASEG)
 
-vars_dict = {"smri_vol_subcort.aseg" : 0, "dmri_dti.fa_subcort.aseg" : 1, "dmri_dti.md_subcort.aseg" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.ld_subcort.aseg" : 3, "dmri_dti.td_subcort.aseg" : 4, "dmri_rsi.n0_subcort.aseg" : 5, "dmri_rsi.nd_subcort.aseg": 6}
-
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
-# {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-tvalues_one = np.zeros((30,7), dtype=float)
-pvalues_one = np.zeros((30,7), dtype=float)
-run_once = 0
-roi_parc = []
-# iterate through folders and build dataframe
-for file in os.listdir(os.path.join(root_dir, ind_var, "tables", "table_coefs")): # iterate through a file list in dir
-    filename = os.fsdecode(file)
-    for x in vars_dict:
-        if "aseg" in filename and run_once == 0:
-            roi_parc = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["dep_var"])
-            roi_parc = roi_parc["dep_var"].values # convert to np array
-            run_once = 1 # only grab ROIs once
-        if filename.startswith(x):
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "t value"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"t value"] # need to slice x:x+1 rather than x
-            tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            df = pd.read_csv(os.path.join(root_dir, ind_var, "tables", "table_coefs", filename), usecols=["parameter_comp", "Pr(>|t|)"])
-            df = df.loc[df['parameter_comp'] == category]
-            temp = df.loc[:,"Pr(>|t|)"] # need to slice x:x+1 rather than x
-            pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = temp[:, np.newaxis] 
-            print(filename)
-                
+atlas = ATLASES["aseg"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over the table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, [ind_var]), atlas, category, workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, str(ind_var) + '_heatmaps_ASEG.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, pvalues_one, save_dir, xlabels)
+jobs.append(heatmap(coefs[0,:,:,T], qvalues[0], save_dir, xlabels))
 
-# partition ordered parcellation ind_var
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "aseg_")
-    i = i + 1
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', ind_var, 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, str(ind_var) + '_ASEG.csv')
\ No newline at end of file
+sig_rois(coefs[0,:,:,T], coefs[0,:,:,P], xlabels, roi_parc, save_dir, str(ind_var) + '_ASEG.csv',
+         qvalues=None if correction is None else qvalues[0], archive=archive)
+
+#%% Render heat maps
+render = True # {False = TABLES ONLY, SKIPS RENDERING SO matplotlib/seaborn ARE NEVER IMPORTED}
+render_workers = 1 # {NUMBER OF PROCESSES FOR RENDERING, 1 = SERIAL, None = ALL CORES (ON macOS/WINDOWS ONLY FROM UNDER if __name__ == "__main__":)}
+book = None # {OR os.path.join(os.getcwd(), 'plots', ind_var, str(ind_var) + '_heatmaps_all.pdf') TO WRITE EVERY HEAT MAP AS A PAGE OF ONE .pdf, PLUS A PAGE INDEX}
+raster = False # {True = FAST RASTER HEAT MAPS, CELLS AND LABELS AS ONE IMAGE, SEE heatmap_render.py}
+if render:
+    failures = render_jobs(jobs, render_workers, book, raster) # every heat map above, failures are summarized rather than stopping the run
+instrument.print_summary() # time, CPU and memory per stage (discover, parse, ..., save), SEE instrument.py
@@ -1,207 +1,94 @@
 #%% Housekeeping
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-import pandas as pd
-import numpy as np
 import os
+from atlases import ATLASES
+from batch_render import plot_job, render_jobs
+import instrument
+from deap_coefs import coef_dirs, load_coefs, T, P
+from correction import correct
 #%% Import t-scores and p-values (DESIKAN)
 root_dir = os.path.join(os.getcwd(),'analyses')
+cache_dir = os.path.join(root_dir, '.coef_cache') # parsed tables are cached here between runs, None to always re-parse
+correction = None # {None = MASK/LIST ON RAW p < 0.05, OR 'bh', 'by', 'bonferroni', 'holm' TO USE CORRECTED q-values}
+family = 'atlas' # {'measure' OR 'atlas', FAMILY OF TESTS TO CORRECT OVER, SEE correction.py}
+jobs = [] # heat maps are queued here and rendered together in the last cell
 
 ind_vars = {"psych_total" : "prodrom_psych_ss_number", "psych_severity" : "prodrom_psych_ss_severity_score"} # pair folders with variables
 
-vars_dict = {"dmri_dti.full.fa.gm_cort.desikan" : 0, "dmri_dti.full.fa.wm_cort.desikan" : 1, "dmri_dti.full.fa.gwc_cort.desikan" : 2,
-             "dmri_dti.full.md.gm_cort.desikan" : 3, "dmri_dti.full.md.wm_cort.desikan" : 4, "dmri_dti.full.md.gwc_cort.desikan" : 5, 
-             "dmri_dti.full.ld.gm_cort.desikan" : 6, "dmri_dti.full.ld.wm_cort.desikan" : 7, "dmri_dti.full.ld.gwc_cort.desikan" : 8, 
-             "dmri_rsi.nd.gm_cort.desikan" : 9, "dmri_rsi.nd.wm_cort.desikan" : 10, "dmri_rsi.nd.gwc_cort.desikan" : 11,  
-             "dmri_rsi.n0.gm_cort.desikan" : 12, "dmri_rsi.n0.wm_cort.desikan" : 13, "dmri_rsi.n0.gwc_cort.desikan" : 14,             
-             "smri_thick_cort.desikan" : 15, "smri_area_cort.desikan" : 16, "smri_vol_cort.desikan" : 17}
-
-df_total = np.zeros((71,18), dtype=float)
-df_severity = np.zeros((71,18), dtype=float)
-total_pvalues = np.zeros((71,18), dtype=float)
-severity_pvalues = np.zeros((71,18), dtype=float)
-
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if filename.startswith(x):
-                if names == "psych_total":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_total[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    total_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "psych_severity":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_severity[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    severity_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
+atlas = ATLASES["desikan"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, cache_dir=cache_dir)
+df_total, df_severity = coefs[0,:,:,T], coefs[1,:,:,T] # views into coefs, no copies
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+total_pvalues, severity_pvalues = qvalues[0], qvalues[1]
 
 # Generate heat maps
-cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
-
-xlabels = ["FA (GM)", "FA (WM)", "FA (GWC)", 
-           "MD (GM)", "MD (WM)", "MD (GWC)", 
-           "LD (GM)", "LD (WM)", "LD (GWC)", 
-           "ND (GM)", "ND (WM)", "ND (GWC)", 
-           "N0 (GM)", "N0 (WM)", "N0 (GWC)", 
-           "Thick", "Area", "Volume"]
-
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(20,15))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-spec = gridspec.GridSpec(ncols=2, nrows=1, figure=fig)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, cbar=True, cbar_ax=ax3)
+xlabels = atlas.xlabels
 
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], figsize=(20,15)))
 
 # Generate masked heat maps
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False, mask=(total_pvalues>0.05))
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, 
-            mask=(severity_pvalues>0.05), cbar=True, cbar_ax=ax3)
-
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps_masked.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], [total_pvalues, severity_pvalues], figsize=(15,10)))
 
 #%% Import t-scores and p-values (DTI ATLAS)
 root_dir = os.path.join(os.getcwd(),'analyses')
+cache_dir = os.path.join(root_dir, '.coef_cache') # parsed tables are cached here between runs, None to always re-parse
+correction = None # {None = MASK/LIST ON RAW p < 0.05, OR 'bh', 'by', 'bonferroni', 'holm' TO USE CORRECTED q-values}
+family = 'atlas' # {'measure' OR 'atlas', FAMILY OF TESTS TO CORRECT OVER, SEE correction.py}
 
 ind_vars = {"psych_total" : "prodrom_psych_ss_number", "psych_severity" : "prodrom_psych_ss_severity_score"} # pair folders with variables
 
-vars_dict = {"dmri_rsi.vol_fiber" : 0, "dmri_dti.fa_fiber.at" : 1, "dmri_dti.md_fiber.at" : 2, 
-             "dmri_dti.ld_fiber.at" : 3, "dmri_dti.td_fiber.at" : 4, "dmri_rsi.n0_fiber.at" : 5, "dmri_rsi.nd_fiber.at": 6}
-
-df_total = np.zeros((42,7), dtype=float)
-df_severity = np.zeros((42,7), dtype=float)
-total_pvalues = np.zeros((42,7), dtype=float)
-severity_pvalues = np.zeros((42,7), dtype=float)
-
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if filename.startswith(x):
-                if names == "psych_total":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_total[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    total_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "psych_severity":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_severity[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    severity_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
+atlas = ATLASES["fiber.at"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
 
-#Generate heat maps
-cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, cache_dir=cache_dir)
+df_total, df_severity = coefs[0,:,:,T], coefs[1,:,:,T] # views into coefs, no copies
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+total_pvalues, severity_pvalues = qvalues[0], qvalues[1]
 
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
-
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(20,15))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-spec = gridspec.GridSpec(ncols=2, nrows=1, figure=fig)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, cbar=True, cbar_ax=ax3)
+#Generate heat maps
+xlabels = atlas.xlabels
 
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps_AT.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], figsize=(20,15)))
 
 #%Generate masked heat maps
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False, mask=(total_pvalues>0.05))
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, 
-            mask=(severity_pvalues>0.05), cbar=True, cbar_ax=ax3)
-
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps_masked_AT.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], [total_pvalues, severity_pvalues], figsize=(15,10)))
 
 #%% Import t-scores and p-values (ASEG)
 root_dir = os.path.join(os.getcwd(),'analyses')
+cache_dir = os.path.join(root_dir, '.coef_cache') # parsed tables are cached here between runs, None to always re-parse
+correction = None # {None = MASK/LIST ON RAW p < 0.05, OR 'bh', 'by', 'bonferroni', 'holm' TO USE CORRECTED q-values}
+family = 'atlas' # {'measure' OR 'atlas', FAMILY OF TESTS TO CORRECT OVER, SEE correction.py}
 
 ind_vars = {"psych_total" : "prodrom_psych_ss_number", "psych_severity" : "prodrom_psych_ss_severity_score"} # pair folders with variables
 
-vars_dict = {"smri_vol_subcort.aseg" : 0, "dmri_dti.fa_subcort.aseg" : 1, "dmri_dti.md_subcort.aseg" : 2, 
-             "dmri_dti.ld_subcort.aseg" : 3, "dmri_dti.td_subcort.aseg" : 4, "dmri_rsi.n0_subcort.aseg" : 5, "dmri_rsi.nd_subcort.aseg": 6}
-
-df_total = np.zeros((30,7), dtype=float)
-df_severity = np.zeros((30,7), dtype=float)
-total_pvalues = np.zeros((30,7), dtype=float)
-severity_pvalues = np.zeros((30,7), dtype=float)
-
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if filename.startswith(x):
-                if names == "psych_total":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_total[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    total_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "psych_severity":
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    df_severity[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    severity_pvalues[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-
-# Generate heat maps
-cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
+atlas = ATLASES["aseg"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
 
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, cache_dir=cache_dir)
+df_total, df_severity = coefs[0,:,:,T], coefs[1,:,:,T] # views into coefs, no copies
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+total_pvalues, severity_pvalues = qvalues[0], qvalues[1]
 
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(20,15))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-spec = gridspec.GridSpec(ncols=2, nrows=1, figure=fig)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, cbar=True, cbar_ax=ax3)
+# Generate heat maps
+xlabels = atlas.xlabels
 
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps_ASEG.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], figsize=(20,15)))
 
 # Generate masked heat maps
-fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-fig.tight_layout()
-ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-ax1.tick_params(labelsize=14, size=0, rotation=45)
-ax2.tick_params(labelsize=14, size=0, rotation=45)
-ax3.tick_params(labelsize=16, size=0, rotation=270)
-sns.heatmap(df_total, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False, mask=(total_pvalues>0.05))
-sns.heatmap(df_severity, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, 
-            mask=(severity_pvalues>0.05), cbar=True, cbar_ax=ax3)
-
 save_dir = os.path.join(os.getcwd(),'plots', 'psychosis', 'psychosis_heatmaps_masked_ASEG.pdf')
-fig.savefig(save_dir, bbox_inches='tight')
+jobs.append(plot_job(save_dir, xlabels, [df_total, df_severity], [total_pvalues, severity_pvalues], figsize=(15,10)))
+
+#%% Render heat maps
+render = True # {False = TABLES ONLY, SKIPS RENDERING SO matplotlib/seaborn ARE NEVER IMPORTED}
+render_workers = 1 # {NUMBER OF PROCESSES FOR RENDERING, 1 = SERIAL, None = ALL CORES (ON macOS/WINDOWS ONLY FROM UNDER if __name__ == "__main__":)}
+book = None # {OR os.path.join(os.getcwd(), 'plots', 'psychosis', 'psychosis_heatmaps_all.pdf') TO WRITE EVERY HEAT MAP AS A PAGE OF ONE .pdf, PLUS A PAGE INDEX}
+raster = False # {True = FAST RASTER HEAT MAPS, CELLS AND LABELS AS ONE IMAGE, SEE heatmap_render.py}
+if render:
+    failures = render_jobs(jobs, render_workers, book, raster) # every heat map above, failures are summarized rather than stopping the run
+instrument.print_summary() # time, CPU and memory per stage (discover, parse, ..., save), SEE instrument.py
@@ -0,0 +1,160 @@
+#%% README
+
+# Per-stage timing and memory instrumentation of the pipeline, replacing the old print(filename) progress lines
+
+# Stages: discover (finding table_coefs files), parse (reading them, or serving them from the cache), assemble
+# (building the coefficient array), correct, render (filling in the figure), save (drawing and writing the figure
+# file) and export (sig_rois lists). Each span records wall time, CPU time (this process plus any worker processes
+# it waited for), peak RSS so far and, where it applies, file and byte counts. A span opened inside a span of the same
+# stage is folded into the outer one (its file and byte counts are added to it), so recursive calls are not timed twice. Spans run in render worker processes
+# are sent back with each job's result.
+
+#     configure(jsonl="run_trace.jsonl")                        # one JSON line per span
+#     configure(summary=True)                                   # table per stage printed at exit
+#     configure(profile=["parse"], profile_dir="profiles")      # cProfile of every parse span -> profiles/parse.prof
+#     configure(trace_memory=["assemble", "correct"])           # tracemalloc peak added to those spans
+# or from the command line of run_studies.py / tables_only.py: --trace FILE --summary --profile STAGE --trace-memory STAGE
+
+#%% Housekeeping
+import atexit
+import contextlib
+import json
+import os
+import sys
+import time
+
+STAGES = ("discover", "parse", "assemble", "correct", "render", "save", "export")
+
+_config = {"jsonl": None, "summary": False, "profile": set(), "profile_dir": ".", "trace_memory": set(), "worker": False}
+_active = {} # stage : counts of its open span
+_totals = {} # stage : aggregated counters for the summary
+_profiles = {} # stage : cProfile.Profile accumulating every span of the stage
+_pending = [] # records of a worker process, waiting to be sent back
+_jsonl = None
+
+#%% Function def
+
+def configure(jsonl=None, summary=False, profile=(), profile_dir=".", trace_memory=()):
+    global _jsonl
+    if _jsonl is not None:
+        _jsonl.close()
+    _jsonl = open(jsonl, 'a') if jsonl else None
+    _config.update(jsonl=jsonl, summary=summary, profile=set(profile), profile_dir=profile_dir, trace_memory=set(trace_memory))
+
+def add_arguments(parser): # the same options on every command-line entry point
+    parser.add_argument("--trace", metavar="FILE", help="append one JSON line per pipeline stage span to FILE")
+    parser.add_argument("--summary", action="store_true", help="print time and memory per stage at the end")
+    parser.add_argument("--profile", nargs="+", default=[], choices=STAGES, metavar="STAGE", help="cProfile these stages into --profile-dir/<stage>.prof")
+    parser.add_argument("--profile-dir", default=".")
+    parser.add_argument("--trace-memory", nargs="+", default=[], choices=STAGES, metavar="STAGE", help="add the tracemalloc peak to spans of these stages")
+
+def configure_args(args):
+    configure(args.trace, args.summary, args.profile, args.profile_dir, args.trace_memory)
+
+def worker_mode(): # inside a pool worker: keep records for the parent instead of writing them
+    global _jsonl
+    _config.update(worker=True, jsonl=None, summary=False)
+    _jsonl = None
+
+def peak_rss(): # bytes, None where resource is unavailable (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    scale = 1 if sys.platform == "darwin" else 1024 # bytes on macOS, KiB on Linux
+    return max(resource.getrusage(who).ru_maxrss for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)) * scale
+
+def cpu_time(): # this process plus the workers it has waited for
+    try:
+        import resource
+    except ImportError:
+        return time.process_time()
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+@contextlib.contextmanager
+def span(stage, **counts): # with span("parse", files=n) as s: ... s["bytes"] += ...
+    if stage in _active: # nested span of the same stage, timed by the outer one
+        outer = _active[stage]
+        try:
+            yield counts
+        finally:
+            for key in ("files", "bytes"):
+                if key in counts:
+                    outer[key] = outer.get(key, 0) + counts[key]
+        return
+    _active[stage] = counts
+    profiler = tracing = None
+    if stage in _config["profile"]:
+        import cProfile
+        profiler = _profiles.setdefault(stage, cProfile.Profile())
+        profiler.enable()
+    if stage in _config["trace_memory"]:
+        import tracemalloc
+        tracing = not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+    start, wall, cpu = time.time(), time.perf_counter(), cpu_time()
+    try:
+        yield counts
+    finally:
+        record = {"stage": stage, "start": start, "wall": time.perf_counter() - wall, "cpu": cpu_time() - cpu, "peak_rss": peak_rss()}
+        if profiler is not None:
+            profiler.disable()
+        if tracing is not None:
+            import tracemalloc
+            record["traced_peak"] = tracemalloc.get_traced_memory()[1]
+            if tracing:
+                tracemalloc.stop()
+        record.update(counts)
+        del _active[stage]
+        emit(record)
+
+def emit(record):
+    if _config["worker"]:
+        _pending.append(record)
+        return
+    total = _totals.setdefault(record["stage"], {"spans": 0, "wall": 0.0, "cpu": 0.0, "files": 0, "bytes": 0, "peak_rss": 0})
+    total["spans"] += 1
+    for key in ("wall", "cpu", "files", "bytes"):
+        total[key] += record.get(key) or 0
+    total["peak_rss"] = max(total["peak_rss"], record.get("peak_rss") or 0)
+    if _jsonl is not None:
+        _jsonl.write(json.dumps(record) + '\n')
+        _jsonl.flush()
+
+def drain(): # records a worker collected since the last call
+    records = list(_pending)
+    _pending.clear()
+    return records
+
+def merge(records): # records sent back by a worker
+    for record in records:
+        emit(dict(record, worker=True))
+
+def summary_table():
+    lines = ["%-10s %6s %10s %10s %8s %12s %10s" % ("stage", "spans", "wall s", "cpu s", "files", "MB read/out", "peak RSS MB")]
+    for stage in sorted(_totals, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+        t = _totals[stage]
+        lines.append("%-10s %6d %10.3f %10.3f %8d %12.1f %10.1f" % (stage, t["spans"], t["wall"], t["cpu"], t["files"], t["bytes"] / 1e6, t["peak_rss"] / 1e6))
+    return '\n'.join(lines)
+
+def print_summary():
+    if _totals:
+        print(summary_table())
+
+def write_profiles():
+    for (stage, profiler) in _profiles.items():
+        os.makedirs(_config["profile_dir"], exist_ok=True)
+        profiler.dump_stats(os.path.join(_config["profile_dir"], stage + '.prof'))
+
+@atexit.register
+def finish():
+    if _config["worker"]:
+        return
+    write_profiles()
+    if _config["summary"]:
+        print_summary()
+    if _jsonl is not None:
+        _jsonl.close()
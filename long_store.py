@@ -0,0 +1,272 @@
+#%% README
+
+# One long-format, column-per-file store of every coefficient row of every study (or of a whole release), with indexes
+# for fast cross-study lookups
+
+# Each row is one (study, ind_var, level, atlas, measure, ROI) cell with its estimate, SE, t, p and q (the p-value
+# corrected as the study asked, p itself without a correction). Cells with no p-value (measures with no file) are left
+# out. The store is a directory of .npy columns, memory-mapped when read:
+#     header.json    - {"rows": n, "categories": {column : [labels]}, "studies": {name : {"correction", "family"}}}
+#     <column>.npy   - uint16/uint32 codes into the labels for study, ind_var, level, atlas, measure and roi,
+#                      float32 for estimate, se, t, p and q
+#     <column>.idx.npy, <column>.off.npy - every categorical column indexed: row ids sorted by code, and where each
+#                      code's run starts, so the rows of a label are one slice
+# A query takes the rows of its most selective indexed predicate from the index, checks the other predicates on just
+# those rows, and only then gathers the columns asked for, so a lookup reads a few pages whatever the size of the store.
+
+#     build_store("results/long", load_spec("studies.yaml"))
+#     store = LongStore("results/long")
+#     rows = store.query(measure="FA (WM)", roi=["superiorfrontallh", "superiorfrontalrh"], q=("<", 0.05))
+#     rows["ind_var"], rows["t"]                                     # decoded labels and float32 values, in row order
+#     store.query(study="reading", abs_t=(">", 3), columns=["ind_var", "measure", "roi", "t"])
+#     python long_store.py build studies.yaml results/long                      # every study of a run_studies spec
+#     python long_store.py build analyses results/long --atlas desikan aseg      # every ind_var folder of a release
+#     python long_store.py query results/long --measure "FA (WM)" --roi superiorfrontallh --where "q<0.05" "abs_t>=2"
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import csv
+import json
+import os
+import re
+import shutil
+import sys
+from atlases import ATLASES, as_atlas
+from deap_coefs import load_coefs, load_levels, T, P, EST, SE
+from correction import correct, METHODS, FAMILIES
+from instrument import span
+from tables_only import parse_category
+
+CATEGORICAL = ("study", "ind_var", "level", "atlas", "measure", "roi")
+NUMERIC = {"estimate": EST, "se": SE, "t": T, "p": P} # q comes from the correction
+COLUMNS = CATEGORICAL + tuple(NUMERIC) + ("q",)
+OPS = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal, "==": np.equal, "!=": np.not_equal}
+
+#%% Function def
+
+class LongStoreWriter: # collects the rows of every study, then writes the columns and indexes in one go
+    def __init__(self, path):
+        self.path = path
+        self.codes = {column: {} for column in CATEGORICAL} # label : code, in order of first appearance
+        self.blocks = [] # ({column : codes or values}, rows)
+        self.studies = {}
+
+    def encode(self, column, labels):
+        codes = self.codes[column]
+        return np.array([codes.setdefault(str(label), len(codes)) for label in labels], dtype=np.int64)
+
+    def add(self, study, atlas, coefs, qvalues, rois, ind_vars, category=None, correction=None, family="atlas"): # one load_study result, ind_vars = folder per panel of one level
+        # category = None, one level, or a list of levels stacked level-major on the ind_var axis as load_study does
+        levels = list(category) if isinstance(category, (list, tuple)) else [category]
+        n_panels, n_rois, n_measures = coefs.shape[:3]
+        if n_panels != len(ind_vars) * len(levels):
+            raise ValueError("%d panels for %d ind_vars x %d levels" % (n_panels, len(ind_vars), len(levels)))
+        per_panel = n_measures * n_rois # rows of one panel, measure-major
+        block = {"study": np.full(n_panels * per_panel, self.encode("study", [study])[0]),
+                 "atlas": np.full(n_panels * per_panel, self.encode("atlas", [atlas.name])[0]),
+                 "ind_var": np.repeat(np.tile(self.encode("ind_var", ind_vars), len(levels)), per_panel),
+                 "level": np.repeat(np.repeat(self.encode("level", [level or '' for level in levels]), len(ind_vars)), per_panel),
+                 "measure": np.tile(np.repeat(self.encode("measure", atlas.xlabels), n_rois), n_panels),
+                 "roi": np.tile(self.encode("roi", rois), n_panels * n_measures)}
+        cells = np.transpose(coefs, (0, 2, 1, 3)).reshape(-1, coefs.shape[-1]) # (panel x measure x ROI) rows
+        block.update((column, cells[:, k].astype(np.float32)) for (column, k) in NUMERIC.items())
+        block["q"] = np.transpose(qvalues, (0, 2, 1)).reshape(-1).astype(np.float32)
+        keep = ~np.isnan(block["p"])
+        self.blocks.append({column: values[keep] for (column, values) in block.items()})
+        self.studies[study] = {"correction": correction, "family": family}
+
+    def close(self): # write into a fresh directory and swap it in, so readers never see half a store
+        tmp = self.path.rstrip('/\\') + '.tmp'
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        with span("export") as counts:
+            rows = sum(len(block["p"]) for block in self.blocks)
+            for column in COLUMNS:
+                values = np.concatenate([block[column] for block in self.blocks]) if self.blocks else np.empty(0)
+                if column in CATEGORICAL:
+                    n = len(self.codes[column])
+                    values = values.astype(np.uint16 if n <= 1 << 16 else np.uint32)
+                    order = np.argsort(values, kind="stable").astype(np.uint32 if rows < 1 << 32 else np.int64) # rows of a code stay in row order
+                    np.save(os.path.join(tmp, column + '.idx.npy'), order)
+                    np.save(os.path.join(tmp, column + '.off.npy'), np.concatenate([[0], np.cumsum(np.bincount(values, minlength=n))]))
+                else:
+                    values = values.astype(np.float32)
+                np.save(os.path.join(tmp, column + '.npy'), values)
+            with open(os.path.join(tmp, 'header.json'), 'w') as f:
+                json.dump({"rows": rows, "categories": {column: list(codes) for (column, codes) in self.codes.items()},
+                           "studies": self.studies}, f)
+            counts["files"] = len(os.listdir(tmp))
+            counts["bytes"] = sum(os.path.getsize(os.path.join(tmp, name)) for name in os.listdir(tmp))
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(tmp, self.path)
+        return rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+
+class LongStore:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        self.categories = {column: np.array(labels, dtype=str) for (column, labels) in self.header["categories"].items()}
+        self._codes = {column: {label: k for (k, label) in enumerate(labels)} for (column, labels) in self.header["categories"].items()}
+        self._arrays = {}
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def array(self, name): # a column (or its index) memory-mapped on first use
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, name + '.npy'), mmap_mode='r')
+        return self._arrays[name]
+
+    def labels(self, column): # every label a categorical column takes, e.g. store.labels("roi")
+        return list(self.header["categories"][column])
+
+    def codes_of(self, column, labels):
+        labels = [labels] if isinstance(labels, str) else labels
+        return np.array([self._codes[column][label] for label in labels if label in self._codes[column]], dtype=np.int64)
+
+    def index_rows(self, column, codes): # row ids holding any of the codes, ascending
+        order, offsets = self.array(column + '.idx'), self.array(column + '.off')
+        rows = [order[offsets[c]:offsets[c + 1]] for c in codes]
+        return np.sort(np.concatenate(rows)) if len(rows) > 1 else np.asarray(rows[0] if rows else np.empty(0, np.uint32))
+
+    def query(self, columns=COLUMNS, **where): # {column : values} of the matching rows; column=label(s) for categoricals, column=(op, value) for numbers
+        # numbers: estimate, se, t, p, q, or abs_<number> for the absolute value; op one of < <= > >= == !=
+        for column in where:
+            if column not in COLUMNS and not (column.startswith('abs_') and column[4:] in COLUMNS):
+                raise ValueError("unknown column %r, expected one of %s" % (column, ", ".join(COLUMNS)))
+        codes = {column: self.codes_of(column, labels) for (column, labels) in where.items() if column in CATEGORICAL}
+        if codes:
+            offsets = {column: self.array(column + '.off') for column in codes}
+            size = lambda column: sum(int(offsets[column][c + 1] - offsets[column][c]) for c in codes[column])
+            first = min(codes, key=size) # most selective index first, the rest are checked on its rows only
+            rows = self.index_rows(first, codes[first])
+            for column in codes:
+                if column != first and len(rows):
+                    rows = rows[np.isin(self.array(column)[rows], codes[column])]
+        else:
+            rows = np.arange(len(self))
+        for (column, condition) in where.items():
+            if column in CATEGORICAL or not len(rows):
+                continue
+            op, value = condition
+            if op not in OPS:
+                raise ValueError("unknown operator %r, expected one of %s" % (op, " ".join(OPS)))
+            values = self.array(column[4:])[rows] if column.startswith('abs_') else self.array(column)[rows]
+            rows = rows[OPS[op](np.abs(values) if column.startswith('abs_') else values, value)] # NaN never passes
+        return {column: self.categories[column][self.array(column)[rows]] if column in CATEGORICAL else np.asarray(self.array(column)[rows])
+                for column in columns}
+
+def build_store(path, spec, only=None): # every study of a run_studies spec (or those named in only), returns the rows written
+    from run_studies import spec_atlas, study_settings
+    from tables_only import load_study
+    memo = {}
+    with LongStoreWriter(path) as writer:
+        for study in spec["studies"]:
+            if only is not None and study.get("name") not in only:
+                continue
+            s = study_settings(spec, study)
+            atlases = [as_atlas(spec_atlas(a)) for a in s["atlases"]]
+            for (atlas, coefs, rois, q) in load_study(s["root_dir"], s["ind_vars"], atlases, s["category"], s["correction"],
+                                                      s["family"], s["workers"], s["cache_dir"], memo):
+                writer.add(s["name"], atlas, coefs, q, rois, list(s["ind_vars"]), s["category"], s["correction"], s["family"])
+    return len(LongStore(path))
+
+def load_chunk(dirs, atlases, category, workers, cache_dir): # [(coefs, rois)] per atlas, levels stacked level-major
+    loaded = []
+    for atlas in atlases:
+        if isinstance(category, (list, tuple)):
+            coefs, rois = load_levels(dirs, atlas, category, workers, cache_dir)
+            loaded.append((coefs.reshape((-1,) + coefs.shape[2:]), rois))
+        else:
+            loaded.append(load_coefs(dirs, atlas, category, workers, cache_dir))
+    return loaded
+
+def build_release(path, root_dir, atlases, category=None, correction=None, family="atlas", workers=1, cache_dir=None, chunk=256): # every ind_var folder under root_dir as one study, chunk folders loaded at a time
+    # returns (rows written, {ind_var : error} for folders left out, e.g. categorical ones built without a category, which load_coefs refuses)
+    from phenome_scan import discover_ind_vars
+    if correction is not None and family == "tensor":
+        raise ValueError("a 'tensor' family pools every ind_var, which a release loaded in chunks cannot do")
+    atlases = [as_atlas(atlas) for atlas in atlases]
+    found = list(discover_ind_vars(root_dir))
+    study = os.path.basename(root_dir.rstrip('/\\').split('::')[0]) or root_dir
+    skipped = {}
+    with LongStoreWriter(path) as writer:
+        for start in range(0, len(found), chunk):
+            part = found[start:start + chunk]
+            try:
+                parts = [(part, load_chunk([d for (name, d) in part], atlases, category, workers, cache_dir))]
+            except (ValueError, KeyError, FileNotFoundError): # one odd folder, load the chunk folder by folder to find it
+                parts = []
+                for item in part:
+                    try:
+                        parts.append(([item], load_chunk([item[1]], atlases, category, 1, cache_dir)))
+                    except (ValueError, KeyError, FileNotFoundError) as err:
+                        skipped[item[0]] = "%s: %s" % (type(err).__name__, err)
+            for (items, loaded) in parts:
+                qvalues = correct([coefs[...,P] for (coefs, rois) in loaded], correction, family) # per ind_var, so chunks do not change it
+                for (atlas, (coefs, rois), q) in zip(atlases, loaded, qvalues):
+                    writer.add(study, atlas, coefs, q, rois, [name for (name, d) in items], category, correction, family)
+    return len(LongStore(path)), skipped
+
+def parse_where(text): # "q<0.05", "abs_t>=3" -> (column, (op, value))
+    match = re.fullmatch(r'\s*(\w+)\s*(<=|>=|==|!=|<|>)\s*(\S+)\s*', text)
+    if match is None:
+        raise ValueError("cannot read %r, write e.g. q<0.05 or abs_t>=3" % text)
+    return match.group(1), (match.group(2), float(match.group(3)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or query the long-format store of every coefficient row")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="write a store from a study spec, or from every ind_var folder of a release")
+    build.add_argument("source", help="study spec (.yaml/.yml, .toml, .json), or a dir / archive of analysis folders")
+    build.add_argument("path", help="dir the store is written to, replacing an older one")
+    build.add_argument("--only", nargs="+", help="names of the spec studies to include")
+    build.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES), help="atlases of a release")
+    build.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp for a release")
+    build.add_argument("--correction", choices=METHODS, help="q column of a release")
+    build.add_argument("--family", default="atlas", choices=FAMILIES)
+    build.add_argument("--workers", type=int, default=1, help="processes for parsing, 0 = all cores")
+    build.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    query = commands.add_parser("query", help="print the matching rows as csv")
+    query.add_argument("path")
+    for column in CATEGORICAL:
+        query.add_argument("--" + column.replace('_', '-'), nargs="+", help="keep rows with any of these %s labels" % column)
+    query.add_argument("--where", nargs="+", default=[], help="numeric conditions, e.g. q<0.05 abs_t>=3")
+    query.add_argument("--columns", nargs="+", default=list(COLUMNS), choices=COLUMNS)
+    query.add_argument("--out", help="csv file to write instead of printing")
+    args = parser.parse_args(argv)
+    if args.command == "build":
+        if args.source.lower().endswith(('.yaml', '.yml', '.toml', '.json')):
+            from run_studies import load_spec
+            rows = build_store(args.path, load_spec(args.source), args.only)
+        else:
+            category = parse_category(args.category)
+            rows, skipped = build_release(args.path, args.source, args.atlas, category, args.correction, args.family, args.workers or None, args.cache_dir)
+            for (name, error) in skipped.items():
+                print("skipped %s (%s)" % (name, error))
+        print("%d rows written to %s" % (rows, args.path))
+        return
+    where = {column: getattr(args, column) for column in CATEGORICAL if getattr(args, column) is not None}
+    where.update(parse_where(text) for text in args.where)
+    rows = LongStore(args.path).query(args.columns, **where)
+    f = open(args.out, 'w', newline='') if args.out else sys.stdout
+    try:
+        writer = csv.writer(f)
+        writer.writerow(args.columns)
+        writer.writerows(zip(*(rows[column].astype(str) for column in args.columns))) # float32 printed at its own precision
+    finally:
+        if args.out:
+            f.close()
+
+if __name__ == "__main__":
+    main()
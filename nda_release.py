@@ -0,0 +1,287 @@
+#%% README
+
+# The NDA release table (nda2.0.2.Rds, or any export of it to .csv / .tsv / .txt) converted once into a column-per-file
+# store, then loaded a few columns and only the rows that pass the filters at a time
+
+# Conversion streams the release in chunks of rows (an .Rds is read whole by pyreadr, the only time it is, and then
+# written in the same chunks). Every column becomes one flat file: float64 for numeric columns (missing = NaN), int32
+# codes into the column's labels for everything else (missing = -1, labels in <k>.labels.json). Each chunk is a row
+# group whose min/max per column is kept in zones.npy, so a filter can skip groups that cannot match.
+# Loading evaluates the filters group by group on the filter columns alone, then gathers only the rows that passed
+# from the columns asked for, which are memory-mapped, so the rest of the release is never read.
+
+# Filters are {column : label, [labels] or ("!=", label)} for text columns and {column : (op, value), number or
+# [numbers]} for numeric ones (op one of < <= > >= == !=, as in long_store.py); missing values never pass. BASELINE_QC is the subset the R scripts take:
+#     eventname == "baseline_year_1_arm_1", mrif_score normal or a normal variant, fsqc_qc == "accept"
+
+#     convert("nda2.0.2.Rds", "nda2.0.2")                                   # once, needs pyreadr for .Rds
+#     release = NDARelease("nda2.0.2")
+#     data = release.load(["src_subject_id", "prodrom_psych_ss_number", "prodrom_psych_ss_severity_score",
+#                          "nihtbx_cryst_agecorrected"], BASELINE_QC)        # pandas DataFrame, text columns categorical
+#     data = release.load(["src_subject_id", "ksads_ptsd_raw_754_p:ksads_ptsd_raw_770_p"], BASELINE_QC)  # a:b = column range as in dplyr::select
+#     python nda_release.py convert nda2.0.2.Rds nda2.0.2
+#     python nda_release.py select nda2.0.2 plots/psychosis/subjects.csv --columns src_subject_id prodrom_psych_ss_number --baseline-qc
+# The csv written by select can stand in for readRDS + select + filter in the R scripts: data_subset <- read_csv(...)
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import json
+import os
+import re
+import shutil
+from instrument import span
+from long_store import OPS
+
+BASELINE = {"eventname": "baseline_year_1_arm_1"}
+QC = {"mrif_score": ["No abnormal findings", "Normal anatomical variant of no clinical significance"], "fsqc_qc": "accept"}
+BASELINE_QC = dict(BASELINE, **QC)
+KINDS = {"num": ("f8", np.float64), "cat": ("i4", np.int32)} # kind : (file extension, dtype)
+
+#%% Function def
+
+class ReleaseWriter: # appends row groups to one file per column, header and zones written on close
+    def __init__(self, path, kinds): # kinds = {column : 'num' or 'cat'} in column order
+        self.path = path
+        self.tmp = path.rstrip('/\\') + '.tmp'
+        shutil.rmtree(self.tmp, ignore_errors=True)
+        os.makedirs(self.tmp)
+        self.columns = list(kinds)
+        self.kinds = [kinds[column] for column in self.columns]
+        self.labels = [{} if kind == "cat" else None for kind in self.kinds] # label : code per text column
+        self.groups = [0] # row where each group starts
+        self.zones = [] # (column x 2) min/max per group
+
+    def file(self, k):
+        return os.path.join(self.tmp, "%05d.%s" % (k, KINDS[self.kinds[k]][0]))
+
+    def encode(self, k, values): # int32 codes of one chunk of a text column, new labels added in order of appearance
+        import pandas as pd
+        local, uniques = pd.factorize(values, use_na_sentinel=True) # missing -> -1
+        labels = self.labels[k]
+        mapping = np.array([labels.setdefault(str(label), len(labels)) for label in uniques] + [-1], dtype=np.int32)
+        return mapping[local] # local -1 picks the trailing -1
+
+    def add(self, frame): # one chunk of rows as a DataFrame with (at least) every column
+        import pandas as pd
+        zones = np.full((len(self.columns), 2), np.nan)
+        for (k, column) in enumerate(self.columns):
+            if self.kinds[k] == "num":
+                values = pd.to_numeric(frame[column], errors='coerce').to_numpy(np.float64)
+                present = values[~np.isnan(values)]
+            else:
+                values = self.encode(k, frame[column])
+                present = values[values >= 0]
+            if len(present):
+                zones[k] = present.min(), present.max()
+            with open(self.file(k), 'ab') as f:
+                f.write(values.tobytes())
+        self.zones.append(zones)
+        self.groups.append(self.groups[-1] + len(frame))
+
+    def close(self): # header last, then the finished store swapped in for an older one
+        for (k, labels) in enumerate(self.labels):
+            if labels is not None:
+                with open(os.path.join(self.tmp, "%05d.labels.json" % k), 'w') as f:
+                    json.dump(list(labels), f)
+        np.save(os.path.join(self.tmp, 'zones.npy'), np.stack(self.zones, axis=1) if self.zones else np.empty((len(self.columns), 0, 2)))
+        with open(os.path.join(self.tmp, 'header.json'), 'w') as f:
+            json.dump({"rows": self.groups[-1], "columns": self.columns, "kinds": self.kinds, "groups": self.groups}, f)
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.replace(self.tmp, self.path)
+        return self.groups[-1]
+
+def text_options(src, descriptions=False): # read_csv options for a delimited export, NDA .txt files are tab separated
+    return {"sep": ',' if src.lower().endswith('.csv') else '\t', "skiprows": [1] if descriptions else None, "low_memory": False}
+
+def csv_kinds(src, chunk=50000, descriptions=False): # first pass: a column is numeric only if every value in it parses as a number
+    import pandas as pd
+    kinds = None
+    for frame in pd.read_csv(src, dtype=str, chunksize=chunk, **text_options(src, descriptions)):
+        if kinds is None:
+            kinds = dict.fromkeys(frame.columns, "num")
+        numeric = [column for (column, kind) in kinds.items() if kind == "num"]
+        parsed = frame[numeric].apply(pd.to_numeric, errors='coerce')
+        for column in np.asarray(numeric)[(parsed.isna() & frame[numeric].notna()).any().to_numpy()]:
+            kinds[column] = "cat"
+    return kinds or {}
+
+def convert(src, path, chunk=50000, descriptions=False): # .Rds (with pyreadr) or a .csv / .tsv / .txt export -> store at path, returns rows
+    # descriptions = skip the second line of an NDA .txt file, which describes each column
+    import pandas as pd
+    with span("parse", files=1, bytes=os.path.getsize(src)):
+        if src.lower().endswith('.rds'):
+            try:
+                import pyreadr
+            except ImportError:
+                raise ImportError("reading .Rds needs pyreadr (pip install pyreadr), or export the release from R with write.csv and convert that") from None
+            frame = pyreadr.read_r(src)[None]
+            kinds = {column: "num" if (pd.api.types.is_numeric_dtype(dtype) or pd.api.types.is_bool_dtype(dtype)) else "cat"
+                     for (column, dtype) in frame.dtypes.items()}
+            chunks = (frame.iloc[start:start + chunk] for start in range(0, len(frame), chunk))
+        else:
+            kinds = csv_kinds(src, chunk, descriptions)
+            chunks = pd.read_csv(src, dtype=str, chunksize=chunk, **text_options(src, descriptions))
+    with span("export") as counts:
+        writer = ReleaseWriter(path, kinds)
+        for frame in chunks:
+            writer.add(frame)
+        rows = writer.close()
+        counts["files"] = len(os.listdir(path))
+    return rows
+
+class NDARelease:
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'header.json')) as f:
+            self.header = json.load(f)
+        self.columns = self.header["columns"]
+        self.positions = {column: k for (k, column) in enumerate(self.columns)}
+        self.groups = self.header["groups"]
+        self.zones = np.load(os.path.join(path, 'zones.npy'), mmap_mode='r')
+        self._labels = {}
+        self._arrays = {}
+
+    def __len__(self):
+        return self.header["rows"]
+
+    def kind(self, column):
+        return self.header["kinds"][self.position(column)]
+
+    def position(self, column):
+        try:
+            return self.positions[column]
+        except KeyError:
+            raise KeyError("no column %r in the release at %s" % (column, self.path)) from None
+
+    def select(self, columns): # names and "first:last" ranges (in release column order) -> column names
+        names = []
+        for column in columns:
+            if ':' in column:
+                first, last = column.split(':', 1)
+                names += self.columns[self.position(first):self.position(last) + 1]
+            else:
+                self.position(column)
+                names.append(column)
+        return names
+
+    def labels(self, column): # every label of a text column, in code order
+        k = self.position(column)
+        if k not in self._labels:
+            with open(os.path.join(self.path, "%05d.labels.json" % k)) as f:
+                self._labels[k] = json.load(f)
+        return self._labels[k]
+
+    def array(self, column): # whole column memory-mapped, codes for a text column
+        k = self.position(column)
+        if k not in self._arrays:
+            ext, dtype = KINDS[self.header["kinds"][k]]
+            path = os.path.join(self.path, "%05d.%s" % (k, ext))
+            self._arrays[k] = np.memmap(path, dtype=dtype, mode='r', shape=(len(self),)) if len(self) else np.empty(0, dtype)
+        return self._arrays[k]
+
+    def number(self, column, value): # a filter value for a numeric column as a float, or a clear error
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError("%s is a numeric column, %r is not a number" % (column, value)) from None
+
+    def condition(self, column, condition): # (test on values, test on a group's [min, max]) of one filter
+        op, value = condition if isinstance(condition, tuple) and len(condition) == 2 and condition[0] in OPS else (None, condition)
+        if op is not None and op not in OPS:
+            raise ValueError("unknown operator %r, expected one of %s" % (op, " ".join(OPS)))
+        if self.kind(column) == "cat":
+            if op not in (None, "==", "!="):
+                raise ValueError("%s is a text column, compare it with == or != only" % column)
+            wanted = [value] if isinstance(value, str) else list(value)
+            if op == "!=":
+                wanted = [label for label in self.labels(column) if label not in wanted]
+            index = {label: code for (code, label) in enumerate(self.labels(column))}
+            codes = np.array([index[label] for label in wanted if label in index], dtype=np.int32)
+            return (lambda values: np.isin(values, codes)), (lambda lo, hi: bool(((codes >= lo) & (codes <= hi)).any()))
+        if op is None and isinstance(value, (list, tuple)): # any of several numbers
+            numbers = np.array([self.number(column, v) for v in value])
+            return (lambda values: np.isin(values, numbers)), (lambda lo, hi: bool(((numbers >= lo) & (numbers <= hi)).any()))
+        op, value = op or "==", self.number(column, value)
+        may_match = {"<": lambda lo, hi: lo < value, "<=": lambda lo, hi: lo <= value, ">": lambda lo, hi: hi > value,
+                     ">=": lambda lo, hi: hi >= value, "==": lambda lo, hi: lo <= value <= hi, "!=": lambda lo, hi: not lo == hi == value}[op]
+        return (lambda values: OPS[op](values, value) & ~np.isnan(values)), may_match # NaN never passes, not even !=
+
+    def rows(self, where): # ids of the rows passing every filter, one row group at a time
+        tests = [(self.position(column), column) + self.condition(column, condition) for (column, condition) in where.items()]
+        found = []
+        with span("discover"):
+            for (g, (start, stop)) in enumerate(zip(self.groups[:-1], self.groups[1:])):
+                if any(np.isnan(self.zones[k, g, 0]) or not may_match(*self.zones[k, g]) for (k, column, test, may_match) in tests):
+                    continue # zone map rules the whole group out
+                mask = np.ones(stop - start, bool)
+                for (k, column, test, may_match) in tests:
+                    mask &= test(self.array(column)[start:stop])
+                    if not mask.any():
+                        break
+                found.append(np.nonzero(mask)[0] + start)
+        return np.concatenate(found) if found else np.empty(0, np.int64)
+
+    def load(self, columns, where=None): # DataFrame of the given columns (or a:b ranges) for the rows passing where
+        import pandas as pd
+        names = self.select(columns)
+        rows = None if not where else self.rows(where)
+        data = {}
+        with span("assemble") as counts:
+            for column in names:
+                values = self.array(column) if rows is None else self.array(column)[rows]
+                if self.kind(column) == "cat":
+                    data[column] = pd.Categorical.from_codes(np.asarray(values), categories=self.labels(column))
+                else:
+                    data[column] = np.array(values)
+            counts["files"] = len(names)
+        return pd.DataFrame(data, columns=names)
+
+def parse_filter(text): # "eventname=baseline_year_1_arm_1", "fsqc_qc!=reject" or "interview_age>=108" -> (column, op, value text)
+    match = re.fullmatch(r'\s*([^<>=!\s]+)\s*(<=|>=|==|!=|=|<|>)\s*(.*?)\s*', text)
+    if match is None or not match.group(3):
+        raise ValueError("cannot read %r, write e.g. fsqc_qc=accept or interview_age>=108" % text)
+    column, op, value = match.groups()
+    return column, "==" if op == "=" else op, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the NDA release table once, then load only the columns and rows needed")
+    commands = parser.add_subparsers(dest="command", required=True)
+    conv = commands.add_parser("convert", help="write the column store of an .Rds / .csv / .tsv / .txt release")
+    conv.add_argument("src")
+    conv.add_argument("path", help="dir the store is written to, replacing an older one")
+    conv.add_argument("--chunk", type=int, default=50000, help="rows per group")
+    conv.add_argument("--descriptions", action="store_true", help="the second line describes the columns (NDA .txt files)")
+    sel = commands.add_parser("select", help="write the chosen columns of the rows passing the filters to a csv")
+    sel.add_argument("path")
+    sel.add_argument("out")
+    sel.add_argument("--columns", nargs="+", required=True, help="column names, or first:last ranges")
+    sel.add_argument("--where", nargs="+", default=[], help="filters, e.g. eventname=baseline_year_1_arm_1 interview_age>=108 (repeat a text column to allow several labels)")
+    sel.add_argument("--baseline-qc", action="store_true", help="baseline visit, normal MRI findings and passed FreeSurfer QC, as the R scripts filter")
+    args = parser.parse_args(argv)
+    if args.command == "convert":
+        rows = convert(args.src, args.path, args.chunk, args.descriptions)
+        print("%d rows written to %s" % (rows, args.path))
+        return
+    release = NDARelease(args.path)
+    where = dict(BASELINE_QC) if args.baseline_qc else {}
+    try:
+        for (column, op, value) in map(parse_filter, args.where):
+            if release.kind(column) == "num":
+                where[column] = (op, release.number(column, value))
+            elif op == "==" and column in where and not isinstance(where[column], tuple): # several labels of one text column
+                where[column] = ([where[column]] if isinstance(where[column], str) else list(where[column])) + [value]
+            else:
+                where[column] = value if op == "==" else (op, value)
+        data = release.load(args.columns, where)
+    except (KeyError, ValueError) as err: # unknown column, or a filter that does not fit its column
+        parser.error(str(err).strip('"'))
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    data.to_csv(args.out, index=False)
+    print("%d rows x %d columns written to %s" % (len(data), data.shape[1], args.out))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#%% README
+
+# Permutation p-values for the similarity of every pair of ROI t-maps (see tmap_similarity.py), or of significance masks
+
+# A batch of ROI-label permutations is drawn as one (permutations x ROI) index matrix. Permuting the ROIs of every
+# standardized map at once turns the whole null for all pairs into one batched matrix product per batch, and only
+# the exceedance counts are kept, so memory is bounded by the batch size however many permutations are run.
+#     'pearson' / 'spearman' - correlation of the t-maps, two-sided: |null r| >= |observed r|
+#     'dice'                 - overlap 2|A and B| / (|A| + |B|) of boolean masks (e.g. q < alpha), one-sided: null >= observed
+# p = (exceedances + 1) / (permutations + 1). Batches are seeded from one SeedSequence in batch order, so the p-values
+# depend only on seed, permutations and batch size, not on how many workers ran them. Permuting ROI labels treats
+# ROIs as exchangeable, i.e. it ignores spatial autocorrelation between neighbouring regions.
+
+#     maps, labels = tmaps(coefs, ["psych_total", "psych_severity"], atlas.xlabels)
+#     observed, pvalues = permutation_test(maps, "pearson", n_perm=10000, workers=None)
+#     observed, pvalues = permutation_test(coefs[...,P].transpose(0, 2, 1).reshape(-1, n_rois) < 0.05, "dice")
+# or python tmap_similarity.py ... --permutations 10000 --workers 0
+
+#%% Housekeeping
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tmap_similarity import standardize, METHODS
+
+STATISTICS = METHODS + ("dice",)
+
+#%% Function def
+
+def permutation_indices(n_rois, n_perm, rng): # (n_perm x n_rois) matrix, each row one shuffle of the ROI axis
+    return rng.permuted(np.tile(np.arange(n_rois), (n_perm, 1)), axis=1)
+
+def prepare(maps, statistic): # rows whose dot products give the statistic (NaN rows for maps that cannot be compared), and the per-row sizes dice needs
+    if statistic not in STATISTICS:
+        raise ValueError("unknown statistic %r, expected one of %s" % (statistic, ", ".join(STATISTICS)))
+    if statistic == "dice":
+        x = np.asarray(maps, dtype=bool).astype(float)
+        return x, x.sum(axis=1)
+    return standardize(maps, statistic), None
+
+def statistic_of(dots, sizes): # dot products (... x maps x maps) -> statistic
+    if sizes is None:
+        return np.clip(dots, -1, 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return 2 * dots / (sizes[:, None] + sizes[None, :])
+
+def exceedances(x, sizes, observed, perms): # how often each pair's null statistic reaches the observed one over a batch of permutations
+    null = statistic_of(x[:, perms].transpose(1, 0, 2) @ x.T, sizes) # (batch x maps x maps), row map permuted
+    tol = 1e-9 # equal statistics computed in a different order must still count as ties
+    if sizes is None:
+        return (np.abs(null) >= np.abs(observed) - tol).sum(axis=0)
+    return (null >= observed - tol).sum(axis=0)
+
+def batch_exceedances(args): # one seeded batch, for the process pool
+    x, sizes, observed, n_perm, seed = args
+    perms = permutation_indices(x.shape[1], n_perm, np.random.default_rng(seed))
+    return exceedances(x, sizes, observed, perms)
+
+def permutation_test(maps, statistic="pearson", n_perm=10000, seed=0, batch=500, workers=1): # (observed, p-values), both (maps x maps)
+    # maps = (maps x ROI) t-values (boolean masks for 'dice'), workers = processes, None = all cores
+    x, sizes = prepare(maps, statistic)
+    observed = statistic_of(x @ x.T, sizes) # NaN for maps with too few values, or two empty masks
+    x = np.nan_to_num(x)
+    sizes_per_batch = [min(batch, n_perm - start) for start in range(0, n_perm, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes_per_batch))
+    work = [(x, sizes, observed, n, s) for (n, s) in zip(sizes_per_batch, seeds)]
+    if workers == 1 or len(work) < 2:
+        counts = sum(map(batch_exceedances, work))
+    else:
+        workers = min(workers or os.cpu_count() or 1, len(work))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            counts = sum(pool.map(batch_exceedances, work))
+    pvalues = (counts + 1) / (n_perm + 1)
+    pvalues[np.isnan(observed)] = np.nan
+    return observed, pvalues
@@ -0,0 +1,155 @@
+#%% README
+
+# Phenome-wide scan: every ind_var folder under analyses/ screened against the imaging measures, in constant memory
+
+# Folders are found lazily and each ind_var goes through load -> correct -> summarize on its own, so only one ind_var's
+# arrays (or one per worker) are ever held however many folders there are. Every ind_var gives one summary row per
+# atlas, written out as soon as it is made, to <out_dir>/<atlas>_scan.csv:
+#     ind_var, level, tests, significant, max_abs_t, <one count of significant ROIs per measure column>, top, error
+# where top lists the strongest significant cells as "ROI (measure) t" and error holds the last line of the traceback
+# of an ind_var that could not be loaded (the scan carries on), e.g. a categorical folder scanned without --category,
+# whose levels are never counted as extra ROIs. Correction families are taken within one ind_var:
+# 'measure' and 'atlas' as in correction.py, 'study' (and 'tensor') across the atlases of the scan.
+# With workers > 1 at most two folders per worker are in flight at a time, more are discovered only as those finish,
+# and the rows are written in the order the ind_vars finish rather than in folder order.
+
+#     for row in scan("analyses", ["desikan", "aseg"], correction="bh"): ...
+#     python phenome_scan.py analyses plots/scan --atlas desikan fiber.at aseg --correction bh --cache-dir analyses/.coef_cache
+#     python phenome_scan.py analyses plots/scan --category exposuresone exposurestwo+ --workers 8
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import csv
+import os
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import instrument
+from atlases import ATLASES, as_atlas
+from coef_archive import isdir, join_source, subdirs
+from deap_coefs import load_coefs, load_levels, T, P
+from correction import correct, METHODS, FAMILIES
+from tables_only import parse_category
+
+SCAN_COLUMNS = ["ind_var", "level", "tests", "significant", "max_abs_t"]
+
+#%% Function def
+
+def discover_ind_vars(root_dir): # yields (name, table_coefs dir) for <folder>/<var>/tables/table_coefs, or <folder>/tables/table_coefs
+    for folder in subdirs(root_dir): # root_dir may be an archive (see coef_archive.py)
+        direct = join_source(root_dir, folder, "tables", "table_coefs")
+        if isdir(direct):
+            yield folder, direct
+            continue
+        found = [var for var in subdirs(join_source(root_dir, folder)) if isdir(join_source(root_dir, folder, var, "tables", "table_coefs"))]
+        for var in found:
+            yield folder if len(found) == 1 else folder + '/' + var, join_source(root_dir, folder, var, "tables", "table_coefs")
+
+def summarize(name, level, atlas, coefs, qvalues, rois, alpha=0.05, top=5): # one summary row of a (1 x ROI x measure x stat) array
+    t, q = coefs[0,:,:,T], qvalues[0]
+    hits = q < alpha # NaN never passes
+    row = {"ind_var": name, "level": level or '', "tests": int(np.count_nonzero(~np.isnan(q))), "significant": int(hits.sum()),
+           "max_abs_t": float(np.nanmax(np.abs(t))) if not np.isnan(t).all() else ''}
+    row.update(zip(atlas.xlabels, hits.sum(axis=0).tolist()))
+    rows, cols = np.nonzero(hits)
+    order = np.argsort(-np.abs(t[rows, cols]), kind="stable")[:top]
+    row["top"] = '; '.join("%s (%s) %.3f" % (rois[r], atlas.xlabels[c], t[r, c]) for (r, c) in zip(rows[order], cols[order]))
+    row["error"] = ''
+    return row
+
+def scan_one(item, atlases, category=None, correction=None, family="atlas", alpha=0.05, cache_dir=None, top=5): # [row per level and atlas] of one ind_var
+    name, directory = item
+    levels = list(category) if isinstance(category, (list, tuple)) else [category]
+    try:
+        if isinstance(category, (list, tuple)): # every level from one parse per file
+            loaded = [load_levels([directory], atlas, levels, 1, cache_dir) for atlas in atlases]
+        else:
+            loaded = [(coefs[None], rois) for (coefs, rois) in (load_coefs([directory], atlas, category, 1, cache_dir) for atlas in atlases)]
+        rows = []
+        for (k, level) in enumerate(levels):
+            qvalues = correct([coefs[k][...,P] for (coefs, rois) in loaded], correction, family)
+            rows += [summarize(name, level, atlas, coefs[k], q, rois, alpha, top) for (atlas, (coefs, rois), q) in zip(atlases, loaded, qvalues)]
+        return rows
+    except Exception:
+        error = traceback.format_exc().strip().splitlines()[-1]
+        return [dict({column: '' for column in SCAN_COLUMNS}, ind_var=name, level=level or '', error=error) for level in levels for atlas in atlases]
+
+def scan_pooled(args): # scan_one in a pool worker, with the spans it timed
+    return scan_one(*args), instrument.drain()
+
+def scan_window(work, workers): # (rows, spans) of every task in work as they finish, with at most 2 tasks per worker submitted at once
+    window = 2 * (workers or os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=instrument.worker_mode)
+    pending = set()
+    try:
+        for args in work: # folders are discovered only as the window has room for them
+            pending.add(pool.submit(scan_pooled, args))
+            while len(pending) >= window:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+def scan(root_dir, atlases, category=None, correction=None, family="atlas", alpha=0.05, cache_dir=None, top=5, workers=1):
+    # yields (atlas, row) for every ind_var folder under root_dir, category = factor level or list of levels
+    atlases = [as_atlas(atlas) for atlas in atlases]
+    work = ((item, atlases, category, correction, family, alpha, cache_dir, top) for item in discover_ind_vars(root_dir))
+    if workers == 1:
+        results = ((scan_one(*args), []) for args in work)
+    else: # rows come back in the order the ind_vars finish; only a bounded window of folders and finished rows is queued, never the arrays
+        results = scan_window(work, workers)
+    try:
+        for (rows, spans) in results:
+            instrument.merge(spans)
+            for (k, row) in enumerate(rows): # level by level, every atlas within a level
+                yield atlases[k % len(atlases)], row
+    finally:
+        results.close() # a scan stopped early shuts the pool down and cancels what is still queued
+
+def write_scan(root_dir, out_dir, atlases, category=None, correction=None, family="atlas", alpha=0.05, cache_dir=None, top=5, workers=1): # one csv per atlas, returns rows written per atlas
+    atlases = [as_atlas(atlas) for atlas in atlases]
+    os.makedirs(out_dir, exist_ok=True)
+    files, writers, counts = [], {}, {}
+    try:
+        for atlas in atlases:
+            f = open(os.path.join(out_dir, atlas.name + '_scan.csv'), 'w', newline='')
+            files.append(f)
+            writers[atlas.name] = csv.DictWriter(f, SCAN_COLUMNS + list(atlas.xlabels) + ["top", "error"], restval='')
+            writers[atlas.name].writeheader()
+            counts[atlas.name] = 0
+        for (atlas, row) in scan(root_dir, atlases, category, correction, family, alpha, cache_dir, top, workers):
+            writers[atlas.name].writerow(row)
+            counts[atlas.name] += 1
+    finally:
+        for f in files:
+            f.close()
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarize every ind_var folder under root_dir, one row per ind_var and atlas")
+    parser.add_argument("root_dir", help="dir of analysis folders (analyses)")
+    parser.add_argument("out_dir", help="dir the <atlas>_scan.csv files are written to")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES))
+    parser.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp for categorical ind_vars")
+    parser.add_argument("--correction", choices=METHODS, help="count corrected q-values below alpha instead of raw p-values")
+    parser.add_argument("--family", default="atlas", choices=FAMILIES)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--top", type=int, default=5, help="strongest significant cells listed per row")
+    parser.add_argument("--workers", type=int, default=1, help="ind_vars scanned in parallel, 0 = all cores")
+    parser.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure_args(args)
+    category = parse_category(args.category)
+    counts = write_scan(args.root_dir, args.out_dir, args.atlas, category, args.correction, args.family, args.alpha,
+                        args.cache_dir, args.top, args.workers or None)
+    for (atlas, n) in counts.items():
+        print("%s: %d rows written to %s" % (atlas, n, os.path.join(args.out_dir, atlas + '_scan.csv')))
+
+if __name__ == "__main__":
+    main()
@@ -18,220 +18,99 @@
 # Specify each custom input whereever there are curly brackets with capslock text
 
 #%% Housekeeping
-import seaborn as sns
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
 import os
-import csv
-from itertools import zip_longest
+from atlases import ATLASES
+from deap_coefs import coef_dirs, load_coefs, T, P
+from roi_lists import sig_rois
+from batch_render import plot_job, render_jobs
+import instrument
+from correction import correct
 
 #%% Function def
 
-def substr_after(s, delim): # partition finds the matchand splits the string into a tuple of [0/1/2] = before/match/after, s = string, delim = 
-    return s.partition(delim)[2] # return everything afterwards
-
-def sig_rois(tvalues, pvalues, columns, rois, filepath, filename): # inputs: columns = list of structural parameter names, rois = list of parcellations
-    output = [[] for i in range(len(columns))] # initialize list of lists
-    #
-    for (i,row) in enumerate(tvalues):
-        for (j,value) in enumerate(row):
-            if pvalues[i,j] < 0.05:
-                string = rois[i] + ', ' + str(round(tvalues[i,j],5)) + ', ' + str(round(pvalues[i,j],5))
-                output[j].append(string)
-        
-    export_data = zip_longest(*output, fillvalue = '') # transpose to vertical columns
-    with open(os.path.join(filepath, filename), 'w', encoding="ISO-8859-1", newline='') as csvfile:
-      wr = csv.writer(csvfile)
-      wr.writerow((columns))
-      wr.writerows(export_data)
-      
-def heatmap(t1, t2, p1, p2, save_dir, xlabels, mask):
-    cmap = sns.diverging_palette(220, 20, sep=20, as_cmap=True)
-    fig, [ax1, ax2] = plt.subplots(1, 2, sharey=True, figsize=(15,10))
-    fig.tight_layout()
-    ax3 = fig.add_axes([1, 0.0275, 0.05, 0.95]) # add new axes for cbar [horizontal, vertical, width, height]
-    ax1.tick_params(labelsize=14, size=0, rotation=45)
-    ax2.tick_params(labelsize=14, size=0, rotation=45)
-    ax3.tick_params(labelsize=16, size=0, rotation=270)
-    if mask == True:
-        sns.heatmap(t1, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False, mask=(p1>0.05))
-        sns.heatmap(t2, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, 
-                mask=(p2>0.05), cbar=True, cbar_ax=ax3)
-    else:
-        sns.heatmap(t1, cmap=cmap, vmin=-4, vmax=4, cbar=False, ax=ax1, xticklabels=xlabels, yticklabels=False)
-        sns.heatmap(t2, cmap=cmap, vmin=-4, vmax=4, ax=ax2, xticklabels=xlabels, yticklabels=False, cbar=True, cbar_ax=ax3)
-    
-    fig.savefig(save_dir, bbox_inches='tight')
+def heatmap(t1, t2, p1, p2, save_dir, xlabels, mask): # plot job for render_jobs
+    return plot_job(save_dir, xlabels, [t1, t2], [p1, p2] if mask == True else None)
     
 #%% Import t-scores and p-values (DESIKAN)
 root_dir = os.path.join(os.getcwd(),'analyses') # {ENTER DIR OF ANALYSIS FOLDERS}
+workers = 1 # {NUMBER OF PROCESSES FOR PARSING .CSV FILES, None = ALL CORES, 1 = SERIAL}
+correction = None # {None = MASK/LIST ON RAW p < 0.05, OR 'bh', 'by', 'bonferroni', 'holm' TO USE CORRECTED q-values}
+family = 'atlas' # {'measure' OR 'atlas', FAMILY OF TESTS TO CORRECT OVER, SEE correction.py}
+jobs = [] # heat maps are queued here and rendered together in the last cell
+archive = None # {OR os.path.join(os.getcwd(), 'plots', 'reading', 'lists.zip') TO WRITE EVERY LIST INTO ONE .zip}
 
 ind_vars = {"reading_hours" : "sports_activity_ss_read_hours_p", "reading_years" : "sports_activity_ss_read_years_p"} # {ENTER FOLDER NAME : VAR NAME}
 
-vars_dict = {"dmri_dti.full.fa.gm_cort.desikan" : 0, "dmri_dti.full.fa.wm_cort.desikan" : 1, "dmri_dti.full.fa.gwc_cort.desikan" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.full.md.gm_cort.desikan" : 3, "dmri_dti.full.md.wm_cort.desikan" : 4, "dmri_dti.full.md.gwc_cort.desikan" : 5, 
-             "dmri_dti.full.ld.gm_cort.desikan" : 6, "dmri_dti.full.ld.wm_cort.desikan" : 7, "dmri_dti.full.ld.gwc_cort.desikan" : 8, 
-             "dmri_rsi.nd.gm_cort.desikan" : 9, "dmri_rsi.nd.wm_cort.desikan" : 10, "dmri_rsi.nd.gwc_cort.desikan" : 11,  
-             "dmri_rsi.n0.gm_cort.desikan" : 12, "dmri_rsi.n0.wm_cort.desikan" : 13, "dmri_rsi.n0.gwc_cort.desikan" : 14,             
-             "smri_thick_cort.desikan" : 15, "smri_area_cort.desikan" : 16, "smri_vol_cort.desikan" : 17}
-
-xlabels = ["FA (GM)", "FA (WM)", "FA (GWC)", # {CHANGE THESE TO MATCH DEP VAR NAMES}
-           "MD (GM)", "MD (WM)", "MD (GWC)", 
-           "LD (GM)", "LD (WM)", "LD (GWC)", 
-           "ND (GM)", "ND (WM)", "ND (GWC)", 
-           "N0 (GM)", "N0 (WM)", "N0 (GWC)", 
-           "Thick", "Area", "Volume"]
-
-tvalues_one = np.zeros((71,18), dtype=float) # {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-tvalues_two = np.zeros((71,18), dtype=float)
-pvalues_one = np.zeros((71,18), dtype=float)
-pvalues_two = np.zeros((71,18), dtype=float)
-run_once = 0
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if "desikan" in filename and run_once == 0:
-                roi_parc = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["dep_var"])
-                roi_parc = roi_parc["dep_var"].values # convert to np array
-                run_once = 1 # only grab ROIs once
-            if filename.startswith(x):
-                if names == "reading_hours": # {CHANGE THIS TO FOLDER FOR FIRST IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "reading_years": # {CHANGE THIS TO FOLDER FOR SECOND IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                
+atlas = ATLASES["desikan"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, workers=workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
+
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=False)
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=False))
 # Generate masked heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps_masked.pdf')  # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=True)
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=True))
 
-# partition ordered parcellation names
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "desikan_")
-    i = i + 1
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, 'reading_hours.csv')
-output = sig_rois(tvalues_two, pvalues_two, xlabels, roi_parc, save_dir, 'reading_years.csv')
+sig_rois(coefs[...,T], coefs[...,P], xlabels, roi_parc, save_dir, ['reading_hours.csv', 'reading_years.csv'],
+         qvalues=None if correction is None else qvalues, archive=archive) # one list per ind_var
 
 #%% Import t-scores and p-values (DTI ATLAS)
 root_dir = os.path.join(os.getcwd(),'analyses') # {ENTER DIR OF ANALYSIS FOLDERS}
 
 ind_vars = {"reading_hours" : "sports_activity_ss_read_hours_p", "reading_years" : "sports_activity_ss_read_years_p"} # {ENTER FOLDER NAME : VAR NAME}
 
-vars_dict = {"dmri_rsi.vol_fiber" : 0, "dmri_dti.fa_fiber.at" : 1, "dmri_dti.md_fiber.at" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.ld_fiber.at" : 3, "dmri_dti.td_fiber.at" : 4, "dmri_rsi.n0_fiber.at" : 5, "dmri_rsi.nd_fiber.at": 6}
-
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
-# {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-tvalues_one = np.zeros((42,7), dtype=float)
-tvalues_two = np.zeros((42,7), dtype=float)
-pvalues_one = np.zeros((42,7), dtype=float)
-pvalues_two = np.zeros((42,7), dtype=float)
-run_once = 0
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if "fiber.at" in filename and run_once == 0:
-                roi_parc = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["dep_var"])
-                roi_parc = roi_parc["dep_var"].values # convert to np array
-                run_once = 1 # only grab ROIs once
-            if filename.startswith(x):
-                if names == "reading_hours": # {CHANGE THIS TO FOLDER FOR FIRST IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "reading_years": # {CHANGE THIS TO FOLDER FOR SECOND IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
+atlas = ATLASES["fiber.at"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, workers=workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
 
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps_AT.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=False)
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=False))
 # Generate masked heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps_masked_AT.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=True)
-# partition ordered parcellation names
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "fiber.at_")
-    i = i + 1
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=True))
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, 'reading_hours_AT.csv')
-output = sig_rois(tvalues_two, pvalues_two, xlabels, roi_parc, save_dir, 'reading_years_AT.csv')
+sig_rois(coefs[...,T], coefs[...,P], xlabels, roi_parc, save_dir, ['reading_hours_AT.csv', 'reading_years_AT.csv'],
+         qvalues=None if correction is None else qvalues, archive=archive) # one list per ind_var
 
 #%% Import t-scores and p-values (ASEG)
 root_dir = os.path.join(os.getcwd(),'analyses')
 ind_vars = {"reading_hours" : "sports_activity_ss_read_hours_p", "reading_years" : "sports_activity_ss_read_years_p"} # {ENTER FOLDER NAME : VAR NAME}
 
-vars_dict = {"smri_vol_subcort.aseg" : 0, "dmri_dti.fa_subcort.aseg" : 1, "dmri_dti.md_subcort.aseg" : 2, # {ENTER ANY NUMBER OF DEP VARS BELOW WITH INCREMENTAL INTEGERS}
-             "dmri_dti.ld_subcort.aseg" : 3, "dmri_dti.td_subcort.aseg" : 4, "dmri_rsi.n0_subcort.aseg" : 5, "dmri_rsi.nd_subcort.aseg": 6}
-
-xlabels = ["Vol", "FA", "MD", "LD", "TD", "N0", "ND"]
-# {MAKE SURE # OF COLUMNS MATCH # OF DEP VARS BELOW}
-tvalues_one = np.zeros((30,7), dtype=float)
-tvalues_two = np.zeros((30,7), dtype=float)
-pvalues_one = np.zeros((30,7), dtype=float)
-pvalues_two = np.zeros((30,7), dtype=float)
-run_once = 0
-# iterate through folders and build dataframe
-for names in ind_vars:
-    for file in os.listdir(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs")): # iterate through a file list in dir
-        filename = os.fsdecode(file)
-        for x in vars_dict:
-            if "aseg" in filename and run_once == 0:
-                roi_parc = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["dep_var"])
-                roi_parc = roi_parc["dep_var"].values # convert to np array
-                run_once = 1 # only grab ROIs once
-            if filename.startswith(x):
-                if names == "reading_hours": # {CHANGE THIS TO FOLDER FOR FIRST IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values # need to slice x:x+1 rather than x
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_one[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
-                if names == "reading_years": # {CHANGE THIS TO FOLDER FOR SECOND IND VAR}
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["t value"])
-                    tvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values
-                    df = pd.read_csv(os.path.join(root_dir, names, ind_vars[names], "tables", "table_coefs", filename), usecols=["Pr(>|t|)"])
-                    pvalues_two[:,vars_dict[x]:(vars_dict[x] + 1)] = df.values 
-                    print(filename)
+atlas = ATLASES["aseg"] # {OR Atlas(NAME, {DEP VAR PREFIX : COLUMN}, XLABELS, ROI PREFIX) FOR A CUSTOM SET OF DEP VARS, SEE atlases.py}
+xlabels = atlas.xlabels
+
+# single pass over each table_coefs folder fills one (ind_var x ROI x measure x stat) array
+coefs, roi_parc = load_coefs(coef_dirs(root_dir, ind_vars), atlas, workers=workers)
+qvalues = correct(coefs[...,P], correction, family) # raw p-values when correction is None
 
 # Generate heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps_ASEG.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=False)
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=False))
 # Generate masked heat maps
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'reading_heatmaps_masked_ASEG.pdf') # {ENTER SAVE DIR HERE}
-heatmap(tvalues_one, tvalues_two, pvalues_one, pvalues_two, save_dir, xlabels, mask=True)
+jobs.append(heatmap(coefs[0,:,:,T], coefs[1,:,:,T], qvalues[0], qvalues[1], save_dir, xlabels, mask=True))
 
-# partition ordered parcellation names
-i = 0 
-for value in roi_parc:
-    roi_parc[i] = substr_after(roi_parc[i], "aseg_")
-    i = i + 1
 # output .csv files with significant ROIs
 save_dir = os.path.join(os.getcwd(),'plots', 'reading', 'lists')  # {ENTER SAVE DIR HERE}
-output = sig_rois(tvalues_one, pvalues_one, xlabels, roi_parc, save_dir, 'reading_hours_ASEG.csv')
-output = sig_rois(tvalues_two, pvalues_two, xlabels, roi_parc, save_dir, 'reading_years_ASEG.csv')
\ No newline at end of file
+sig_rois(coefs[...,T], coefs[...,P], xlabels, roi_parc, save_dir, ['reading_hours_ASEG.csv', 'reading_years_ASEG.csv'],
+         qvalues=None if correction is None else qvalues, archive=archive) # one list per ind_var
+
+#%% Render heat maps
+render = True # {False = TABLES ONLY, SKIPS RENDERING SO matplotlib/seaborn ARE NEVER IMPORTED}
+render_workers = 1 # {NUMBER OF PROCESSES FOR RENDERING, 1 = SERIAL, None = ALL CORES (ON macOS/WINDOWS ONLY FROM UNDER if __name__ == "__main__":)}
+book = None # {OR os.path.join(os.getcwd(), 'plots', 'reading', 'reading_heatmaps_all.pdf') TO WRITE EVERY HEAT MAP AS A PAGE OF ONE .pdf, PLUS A PAGE INDEX}
+raster = False # {True = FAST RASTER HEAT MAPS, CELLS AND LABELS AS ONE IMAGE, SEE heatmap_render.py}
+if render:
+    failures = render_jobs(jobs, render_workers, book, raster) # every heat map above, failures are summarized rather than stopping the run
+instrument.print_summary() # time, CPU and memory per stage (discover, parse, ..., save), SEE instrument.py
@@ -0,0 +1,154 @@
+#%% README
+
+# Compact on-disk store of (ind_var x ROI x measure x stat) results for phenome-wide scans, one directory per atlas
+
+# t, p, estimate and SE of every ind_var are kept as float32 in one flat file (coefs.f32) that is memory-mapped rather
+# than read, so only the pages a heatmap or list actually touches become resident. A small header.json holds the
+# atlas name, measure prefixes, column labels, ROI labels and the ind_var name of each row:
+#     {"atlas": name, "measures": [...], "xlabels": [...], "suffix": "_AT", "rois": [...], "stats": STATS,
+#      "dtype": "float32", "ind_vars": [...]}
+# New ind_vars are appended to the end of the file, a chunk of folders at a time (see store_study), so the whole
+# release never has to be loaded at once. The header is rewritten after the data, and rows beyond the header's count
+# (left by an interrupted append) are cut off on the next append, so the store is never read half-written.
+
+#     store = ResultStore("results/desikan", "desikan")          # opened, or created empty for the atlas
+#     store_study("results", "analyses", ind_vars, ["desikan"], chunk=200)
+#     k = store.index("reading_hours")
+#     jobs.append(plot_job(save_dir, store.xlabels, [store.coefs[k,:,:,T]]))            # zero-copy float32 views
+#     sig_rois(store.coefs[k,:,:,T], store.coefs[k,:,:,P], store.xlabels, store.rois, save_dir, "reading_hours.csv")
+#     python result_store.py analyses results --ind-var reading_hours=sports_activity_ss_read_hours_p --atlas desikan aseg
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import json
+import os
+from atlases import ATLASES, as_atlas
+from deap_coefs import coef_dirs, load_coefs, load_levels, STATS
+from tables_only import panel_names, parse_category, parse_ind_vars
+
+#%% Function def
+
+class ResultStore:
+    def __init__(self, path, atlas=None): # atlas is only needed to create a new store
+        self.path = path
+        self.header_path = os.path.join(path, 'header.json')
+        self.data_path = os.path.join(path, 'coefs.f32')
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                self.header = json.load(f)
+        elif atlas is None:
+            raise FileNotFoundError("no result store at %s, give an atlas to create one" % path)
+        else:
+            atlas = as_atlas(atlas)
+            self.header = {"atlas": atlas.name, "measures": list(atlas.measures), "xlabels": list(atlas.xlabels),
+                           "suffix": atlas.suffix, "rois": None, "stats": STATS, "dtype": "float32", "ind_vars": []}
+        self._positions = {name: k for (k, name) in enumerate(self.header["ind_vars"])}
+        self._coefs = None
+
+    @property
+    def ind_vars(self):
+        return self.header["ind_vars"]
+
+    @property
+    def rois(self):
+        return self.header["rois"]
+
+    @property
+    def xlabels(self):
+        return self.header["xlabels"]
+
+    def __len__(self):
+        return len(self.ind_vars)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def row_shape(self):
+        return (len(self.rois or []), len(self.header["measures"]), len(STATS))
+
+    @property
+    def coefs(self): # read-only (ind_var x ROI x measure x stat) float32 memmap, index the last axis with T/P/EST/SE
+        if self._coefs is None:
+            if len(self) == 0:
+                return np.empty((0,) + self.row_shape(), np.float32)
+            self._coefs = np.memmap(self.data_path, dtype=np.float32, mode='r', shape=(len(self),) + self.row_shape())
+        return self._coefs
+
+    def index(self, name):
+        return self._positions[name]
+
+    def __getitem__(self, name): # (ROI x measure x stat) view of one ind_var
+        return self.coefs[self.index(name)]
+
+    def append(self, names, coefs, rois): # add the rows of a load_coefs array, named one per ind_var
+        coefs = np.asarray(coefs)
+        if len(names) != len(coefs):
+            raise ValueError("%d names for %d ind_vars" % (len(names), len(coefs)))
+        repeated = [name for name in names if name in self._positions or list(names).count(name) > 1]
+        if repeated:
+            raise ValueError("ind_vars already in the store or repeated: %s" % sorted(set(repeated)))
+        rois = [str(roi) for roi in rois]
+        if self.rois is not None and rois != self.rois:
+            raise ValueError("ROI labels differ from the ones already stored for %s" % self.header["atlas"])
+        shape = (len(rois), len(self.header["measures"]), len(STATS))
+        if coefs.shape[1:] != shape:
+            raise ValueError("rows of shape %s do not fit a store of %s" % (coefs.shape[1:], shape))
+        self.header["rois"] = rois
+        os.makedirs(self.path, exist_ok=True)
+        self._coefs = None # let go of the old map before the file grows
+        row_bytes = int(np.prod(self.row_shape())) * 4
+        with open(self.data_path, 'ab') as f:
+            f.truncate(len(self) * row_bytes) # drop rows an interrupted append left past the header
+            f.write(np.ascontiguousarray(coefs, dtype=np.float32).tobytes())
+        self.header["ind_vars"] = self.ind_vars + list(names)
+        self._positions.update((name, len(self._positions) + k) for (k, name) in enumerate(names))
+        tmp = self.header_path + '.tmp'
+        with open(tmp, 'w') as f: # write then rename so an interrupted append never leaves a half-written header
+            json.dump(self.header, f)
+        os.replace(tmp, self.header_path)
+
+def store_study(store_dir, root_dir, ind_vars, atlases, category=None, workers=1, cache_dir=None, chunk=256): # appends every ind_var not yet stored, chunk folders at a time, returns {atlas : rows added}
+    # ind_vars = {folder : var} or [folder]; rows are named as panel_names names them, one per folder and level
+    levels = category if isinstance(category, (list, tuple)) else [category]
+    row_names = lambda folders, level: panel_names(folders, [level] if isinstance(category, (list, tuple)) else level)
+    added = {}
+    for atlas in map(as_atlas, atlases):
+        store = ResultStore(os.path.join(store_dir, atlas.name), atlas)
+        added[atlas.name] = 0
+        todo = [folder for folder in ind_vars if any(row_names([folder], level)[0] not in store for level in levels)]
+        for start in range(0, len(todo), chunk):
+            part = todo[start:start + chunk]
+            if isinstance(ind_vars, dict):
+                part = {folder: ind_vars[folder] for folder in part}
+            if isinstance(category, (list, tuple)): # every level from one parse per file
+                coefs, rois = load_levels(coef_dirs(root_dir, part), atlas, levels, workers, cache_dir)
+            else:
+                coefs, rois = load_coefs(coef_dirs(root_dir, part), atlas, category, workers, cache_dir)
+                coefs = coefs[None]
+            for (k, level) in enumerate(levels):
+                names = row_names(part, level)
+                new = [j for (j, name) in enumerate(names) if name not in store]
+                store.append([names[j] for j in new], coefs[k][new], rois)
+            added[atlas.name] += len(part)
+    return added
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Append the results of many ind_vars to memory-mapped per-atlas stores")
+    parser.add_argument("root_dir", help="dir of analysis folders (analyses)")
+    parser.add_argument("store_dir", help="one store per atlas is kept in <store_dir>/<atlas>")
+    parser.add_argument("--ind-var", action="append", required=True, help="folder=var, or a folder holding tables directly (repeatable)")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES))
+    parser.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp for a categorical ind_var")
+    parser.add_argument("--workers", type=int, default=1, help="processes for parsing, 0 = all cores")
+    parser.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    parser.add_argument("--chunk", type=int, default=256, help="ind_vars loaded per append")
+    args = parser.parse_args(argv)
+    category = parse_category(args.category)
+    added = store_study(args.store_dir, args.root_dir, parse_ind_vars(args.ind_var), args.atlas, category,
+                        args.workers or None, args.cache_dir, args.chunk)
+    for (atlas, n) in added.items():
+        print("%s: %d ind_vars added" % (atlas, n))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#%% README
+
+# Tabulated lists of significantly affected ROIs, written to plots/<custom folder name>/lists
+
+# One column per structural parameter, each listing "ROI, t, p" for every ROI with p < alpha, top-aligned and padded
+# with blanks. Given corrected q-values (see correction.py) the cells read "ROI, t, p, q" and q < alpha is used instead.
+# Significant cells are found with a single boolean mask, formatted as whole string arrays, and scattered into a padded
+# (rows x columns) block that the csv writer consumes row by row.
+# Given archive = path of a .zip, every list is written into that one archive instead of a .csv per file under filepath;
+# writing a list that is already in the archive replaces it. All lists of one call (one per ind_var for a 3-D array) go in
+# as a batch, so the archive is opened, and if needed rewritten, once per call rather than once per list.
+# Writing is timed as an export span (see instrument.py).
+
+#%% Housekeeping
+import numpy as np
+import os
+import csv
+import io
+import zipfile
+from instrument import span
+
+#%% Function def
+
+def format_cells(rois, rows, cols, *values): # "ROI, t, p[, q]" for every (row, col) hit, rounded to 5 decimals like round()
+    cells = np.asarray(rois, dtype=str)[rows]
+    for v in values:
+        cells = np.char.add(np.char.add(cells, ', '), np.round(v[rows, cols], 5).astype(str))
+    return cells
+
+def sig_table(tvalues, pvalues, rois, alpha=0.05, qvalues=None): # padded (max hits x columns) array of cells, '' where a column has run out
+    values = (tvalues, pvalues) if qvalues is None else (tvalues, pvalues, qvalues)
+    cols, rows = np.nonzero(values[-1].T < alpha) # column-major so each column's hits stay in ROI order, NaN never passes
+    counts = np.bincount(cols, minlength=tvalues.shape[1])
+    starts = np.cumsum(counts) - counts
+    table = np.full((counts.max() if len(cols) else 0, tvalues.shape[1]), '', dtype=object)
+    table[np.arange(len(cols)) - starts[cols], cols] = format_cells(rois, rows, cols, *values)
+    return table
+
+def write_table(csvfile, columns, table):
+    wr = csv.writer(csvfile)
+    wr.writerow(columns)
+    wr.writerows(table)
+
+def list_text(tvalues, pvalues, columns, rois, alpha=0.05, qvalues=None): # csv text of one list, for the archive path
+    text = io.StringIO(newline='')
+    write_table(text, columns, sig_table(tvalues, pvalues, rois, alpha, qvalues))
+    return text.getvalue()
+
+def archive_csvs(archive, lists): # add a batch of lists {name : csv text} to a .zip in one pass, replacing older copies rather than duplicating entries
+    if os.path.exists(archive):
+        with zipfile.ZipFile(archive) as zf:
+            stale = not set(lists).isdisjoint(zf.namelist())
+        if stale: # zip members cannot be overwritten in place, copy the others and the batch into a fresh archive once
+            tmp = archive + '.tmp'
+            with zipfile.ZipFile(archive) as src, zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as dst:
+                for info in src.infolist():
+                    if info.filename not in lists:
+                        dst.writestr(info, src.read(info))
+                for (name, text) in lists.items():
+                    dst.writestr(name, text.encode("ISO-8859-1"))
+            os.replace(tmp, archive)
+            return
+    else:
+        os.makedirs(os.path.dirname(archive) or '.', exist_ok=True)
+    with zipfile.ZipFile(archive, 'a', zipfile.ZIP_DEFLATED) as zf:
+        for (name, text) in lists.items():
+            zf.writestr(name, text.encode("ISO-8859-1"))
+
+def sig_rois(tvalues, pvalues, columns, rois, filepath, filename, alpha=0.05, qvalues=None, archive=None): # inputs: columns = list of structural parameter names, rois = list of parcellations, qvalues = corrected p-values to threshold on instead, archive = .zip to write into instead of filepath
+    with span("export") as counts: # one span for a whole array
+        if np.ndim(tvalues) != 3: # one (ROI x measure) list, filename = its .csv name
+            tvalues, pvalues, filename = tvalues[None], pvalues[None], [filename]
+            qvalues = None if qvalues is None else qvalues[None]
+        if archive is not None: # the whole batch goes into the archive in one open
+            lists = {name: list_text(tvalues[k], pvalues[k], columns, rois, alpha, None if qvalues is None else qvalues[k])
+                     for (k, name) in enumerate(filename)}
+            archive_csvs(archive, lists)
+            counts.update(files=len(lists), bytes=sum(len(text) for text in lists.values()))
+            return
+        os.makedirs(filepath, exist_ok=True)
+        for (k, name) in enumerate(filename): # rows streamed straight to the file, no csv text held in memory
+            path = os.path.join(filepath, name)
+            with open(path, 'w', encoding="ISO-8859-1", newline='') as csvfile:
+                write_table(csvfile, columns, sig_table(tvalues[k], pvalues[k], rois, alpha, None if qvalues is None else qvalues[k]))
+            counts["files"] = counts.get("files", 0) + 1
+            counts["bytes"] = counts.get("bytes", 0) + os.path.getsize(path)
@@ -0,0 +1,228 @@
+#%% README
+
+# Declarative batch runner: every study in a YAML/TOML/JSON spec, in one process
+
+# Replaces editing the {ENTER ...} placeholders of one script per study. All studies share one import cost, one
+# coefficient cache and one in-memory copy of any tables several of them read, and all heatmaps go through a single
+# render_jobs() call, so the render pool is started once for the whole run.
+
+#     python run_studies.py studies.yaml                      # everything in the spec
+#     python run_studies.py studies.yaml --only reading ptsd  # a subset of studies
+#     python run_studies.py studies.yaml --tables-only        # lists only, matplotlib is never imported
+#     python run_studies.py studies.yaml --incremental        # only outputs whose tables or settings changed
+#     python run_studies.py studies.yaml --watch 5            # poll every 5 s and rebuild what changed
+#     python run_studies.py studies.yaml --summary --trace run.jsonl   # time / memory per stage, see instrument.py
+
+# Incremental runs keep a build manifest (see build_graph.py): each heatmap and list is rebuilt only if it is missing
+# or the content of one of its table_coefs files, or a setting it depends on, changed since it was last written.
+# A list depends on the tables of its own ind_var folder (of every atlas for a 'study' family, of every folder for
+# 'tensor'), a heatmap on those of every panel it draws.
+# Heatmaps that fail to render are not recorded, so they are retried on the next run; a book is always rebuilt in full.
+
+# Spec layout (see studies.example.yaml). Top-level keys are defaults for every study, and each study can override
+# any of them except the run-level render settings:
+#     root_dir: analyses                # dir of analysis folders
+#     plots_dir: plots                  # a study writes to <plots_dir>/<name> unless it gives out
+#     cache_dir: analyses/.coef_cache   # parsed table cache (coef_cache.py), omit to always re-parse
+#     workers: 1                        # processes for parsing, null = all cores
+#     atlases: [desikan, fiber.at, aseg]   # registered names, or {name, vars, xlabels, roi_prefix, suffix} for a custom one
+#     correction: null                  # or bh / by / bonferroni / holm, with family: measure / atlas / study / tensor
+#     alpha: 0.05
+#     heatmaps: true                    # <name>_heatmaps<suffix>.pdf and <name>_heatmaps_masked<suffix>.pdf, or one
+#                                       # unmasked | masked <name>_heatmaps<suffix>.pdf for a single-panel study
+#     figsize: [15, 10]
+#     lists: true                       # lists/<folder>[_<level>]<suffix>.csv, archive: true puts them in lists.zip
+#     render_workers: null, raster: false, book: null   # run-level only, see batch_render.py
+#     studies:
+#       - name: affected
+#         ind_vars: [affected]          # {folder : var} or [folder], as in coef_dirs
+#         category: affectedYes         # factor level, or a list of levels shown side by side
+
+#%% Housekeeping
+import argparse
+import instrument
+import json
+import os
+import time
+import traceback
+from atlases import Atlas, as_atlas
+from deap_coefs import coef_dirs, list_coefs, T, P
+from roi_lists import archive_csvs, list_text, sig_rois
+from batch_render import plot_job, render_jobs
+from tables_only import load_study, panel_names
+from build_graph import BuildState
+
+DEFAULTS = {"root_dir": "analyses", "plots_dir": "plots", "cache_dir": None, "workers": 1,
+            "atlases": ["desikan", "fiber.at", "aseg"], "correction": None, "family": "atlas", "alpha": 0.05,
+            "heatmaps": True, "figsize": [15, 10], "lists": True, "archive": False}
+RUN_KEYS = {"render_workers": None, "raster": False, "book": None} # one render_jobs call for the whole spec
+STUDY_KEYS = {"name", "ind_vars", "category", "out"}
+
+#%% Function def
+
+def load_spec(path): # .json, .toml (tomllib) or .yaml/.yml (PyYAML, only needed for YAML specs)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path) as f:
+            return json.load(f)
+    if ext == '.toml':
+        import tomllib
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    if ext in ('.yaml', '.yml'):
+        import yaml
+        with open(path) as f:
+            return yaml.safe_load(f)
+    raise ValueError("unknown spec format %r, expected .json, .toml, .yaml or .yml" % ext)
+
+def spec_atlas(entry): # registered name, or a custom atlas written out in the spec
+    if isinstance(entry, str):
+        return entry
+    return Atlas(entry["name"], entry["vars"], entry.get("xlabels"), entry.get("roi_prefix"), entry.get("suffix", ''))
+
+def study_settings(spec, study): # defaults < top level of the spec < the study itself
+    if "name" not in study or "ind_vars" not in study:
+        raise ValueError("every study needs a name and ind_vars, got %s" % sorted(study))
+    unknown = set(study) - set(DEFAULTS) - STUDY_KEYS
+    if unknown:
+        raise ValueError("study %s: unknown keys %s" % (study["name"], sorted(unknown)))
+    settings = dict(DEFAULTS, **{k: v for (k, v) in spec.items() if k in DEFAULTS})
+    settings.update(study)
+    settings.setdefault("category", None)
+    settings.setdefault("out", os.path.join(settings["plots_dir"], study["name"]))
+    return settings
+
+def study_outputs(s, atlas, raster=False): # [(output, kind, panel, params)] for every file one atlas of a study produces
+    names = panel_names(s["ind_vars"], s["category"])
+    base = {"ind_vars": s["ind_vars"], "category": s["category"], "atlas": atlas.name, "xlabels": atlas.xlabels}
+    corrected = {"correction": s["correction"], "family": s["family"], "alpha": s["alpha"]}
+    outputs = []
+    if s["lists"]:
+        for (k, name) in enumerate(names):
+            filename = name + atlas.suffix + '.csv'
+            output = os.path.join(s["out"], 'lists.zip') + '::' + filename if s["archive"] else os.path.join(s["out"], 'lists', filename)
+            outputs.append((output, 'list', k, dict(base, **corrected)))
+    if s["heatmaps"]:
+        figure = dict(base, figsize=s["figsize"], raster=raster)
+        stem = os.path.join(s["out"], s["name"] + '_heatmaps')
+        if len(names) == 1: # single panel: unmasked | masked in one figure, as in heatmaps_general.py
+            outputs.append((stem + atlas.suffix + '.pdf', 'paired', 0, dict(figure, **corrected)))
+        else:
+            outputs.append((stem + atlas.suffix + '.pdf', 'heatmap', None, figure))
+            outputs.append((stem + '_masked' + atlas.suffix + '.pdf', 'masked', None, dict(figure, **corrected)))
+    return outputs
+
+def make_output(output, kind, panel, s, atlas, coefs, rois, q, batch=None): # writes a list, or returns the plot job of a heatmap; batch = {archive : {name : csv text}} collecting archived lists to write together
+    xlabels, tvalues = atlas.xlabels, coefs[...,T]
+    if kind == 'list':
+        if '::' in output:
+            archive, filename = output.split('::', 1)
+            save_dir = None
+            if batch is not None:
+                with instrument.span("export"):
+                    batch.setdefault(archive, {})[filename] = list_text(tvalues[panel], coefs[panel,:,:,P], xlabels, rois, s["alpha"],
+                                                                         None if s["correction"] is None else q[panel])
+                return None
+        else:
+            archive = None
+            save_dir, filename = os.path.split(output)
+        sig_rois(tvalues[panel], coefs[panel,:,:,P], xlabels, rois, save_dir, filename, s["alpha"],
+                 qvalues=None if s["correction"] is None else q[panel], archive=archive)
+        return None
+    if kind == 'paired':
+        return plot_job(output, xlabels, [tvalues[panel], tvalues[panel]], [None, q[panel]], s["figsize"])
+    return plot_job(output, xlabels, list(tvalues), list(q) if kind == 'masked' else None, s["figsize"])
+
+def study_inputs(s, atlas, panel=None): # every table_coefs file the atlas reads for this study, or for one panel's ind_var folder only
+    directories = coef_dirs(s["root_dir"], s["ind_vars"])
+    if panel is not None:
+        directories = [directories[panel % len(directories)]] # panels are level-major, one per folder within a level (see panel_names)
+    return [os.path.join(directory, filename) for directory in directories for (filename, column) in list_coefs(directory, atlas)]
+
+def run_study(spec, study, memo=None, build=None, run=RUN_KEYS): # writes the lists of one study, returns (heatmap jobs, {output : key} to record once rendered)
+    s = study_settings(spec, study)
+    atlases = [as_atlas(spec_atlas(a)) for a in s["atlases"]]
+    plan = [(atlas, study_outputs(s, atlas, run["raster"])) for atlas in atlases]
+    keys = {}
+    if build is not None: # only outputs that are missing or whose inputs / parameters changed
+        inputs = {atlas.name: build.digests(study_inputs(s, atlas)) for atlas in atlases}
+        pooled = {path: digest for digests in inputs.values() for (path, digest) in digests.items()}
+        for (atlas, outputs) in plan:
+            for (output, kind, panel, params) in outputs:
+                family = s["family"] if "correction" in params and s["correction"] is not None else None
+                digests = pooled if family in ("study", "tensor") else inputs[atlas.name]
+                if kind == 'list' and family != "tensor": # a list reads only its own ind_var folder, unless the family pools every ind_var
+                    digests = {path: digests[path] for a in (atlases if family == "study" else [atlas]) for path in study_inputs(s, a, panel)}
+                keys[output] = build.key(digests, params)
+        in_book = lambda kind: kind != 'list' and run["book"] is not None # a book is always rebuilt in full
+        plan = [(atlas, [o for o in outputs if build.stale(o[0], keys[o[0]]) or in_book(o[1])]) for (atlas, outputs) in plan]
+        if not any(outputs for (atlas, outputs) in plan):
+            return [], {}
+    jobs, pending, n_lists, batch = [], {}, 0, {}
+    for ((_, outputs), (atlas, coefs, rois, q)) in zip(plan, load_study(s["root_dir"], s["ind_vars"], atlases, s["category"],
+                                                                            s["correction"], s["family"], s["workers"], s["cache_dir"], memo)):
+        for (output, kind, panel, params) in outputs:
+            job = make_output(output, kind, panel, s, atlas, coefs, rois, q, batch)
+            if job is None:
+                n_lists += 1
+                if build is not None:
+                    build.record(output, keys[output])
+            else:
+                jobs.append(job)
+                pending[output] = keys.get(output)
+    for (archive, lists) in batch.items(): # each archive is opened, and rewritten if needed, once per study
+        with instrument.span("export", files=len(lists), bytes=sum(len(text) for text in lists.values())):
+            archive_csvs(archive, lists)
+    print("study %s: %d lists written, %d heatmaps queued" % (s["name"], n_lists, len(jobs)))
+    return jobs, pending
+
+def run_spec(spec, only=None, render=True, build=None): # every study (or those named in only), returns the render failures
+    run = dict(RUN_KEYS, **{k: v for (k, v) in spec.items() if k in RUN_KEYS})
+    unknown = set(spec) - set(DEFAULTS) - set(RUN_KEYS) - {"studies"}
+    if unknown:
+        raise ValueError("unknown spec keys %s" % sorted(unknown))
+    memo = {} # (table dirs, atlas, level or tuple of levels) : loaded array, shared by every study
+    jobs, pending = [], {}
+    for study in spec["studies"]:
+        if only is None or study.get("name") in only:
+            (study_jobs, study_pending) = run_study(spec, study, memo, build, run)
+            jobs += study_jobs
+            pending.update(study_pending)
+    failures = render_jobs(jobs, run["render_workers"], run["book"], run["raster"]) if render and jobs else []
+    if build is not None:
+        if render:
+            failed = {path for (path, error) in failures}
+            for (output, key) in pending.items():
+                if output not in failed:
+                    build.record(output, key)
+        build.save()
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every study of a spec in one process")
+    parser.add_argument("spec", help="study spec, .yaml/.yml, .toml or .json")
+    parser.add_argument("--only", nargs="+", help="names of the studies to run")
+    parser.add_argument("--tables-only", action="store_true", help="write the lists, skip the heatmaps")
+    parser.add_argument("--incremental", action="store_true", help="only rebuild outputs whose tables or parameters changed")
+    parser.add_argument("--watch", type=float, metavar="SECONDS", help="keep polling the tables and rebuild what changed (implies --incremental)")
+    parser.add_argument("--manifest", help="build manifest, default <plots_dir>/.build_manifest.json")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure_args(args)
+    build = None
+    if args.incremental or args.watch:
+        spec = load_spec(args.spec)
+        build = BuildState(args.manifest or os.path.join(spec.get("plots_dir", DEFAULTS["plots_dir"]), '.build_manifest.json'))
+    while True:
+        try:
+            failures = run_spec(load_spec(args.spec), args.only, not args.tables_only, build) # spec re-read, edits to it count as changes too
+        except Exception: # e.g. a table caught halfway through being rewritten, the next poll picks it up
+            if args.watch is None:
+                raise
+            traceback.print_exc()
+        if args.watch is None:
+            raise SystemExit(1 if failures else 0)
+        time.sleep(args.watch)
+
+if __name__ == "__main__":
+    main()
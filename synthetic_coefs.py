@@ -0,0 +1,78 @@
+#%% README
+
+# Synthetic DEAPext output for benchmarks and for trying the scripts without ABCD data
+
+# Writes analyses/<folder>/<var>/tables/table_coefs trees with one .csv per dep var of each atlas (see atlases.py),
+# laid out like the DEAPext.R tables: a row-name column, then dep_var, parameter_comp, Estimate, Std. Error, t value
+# and Pr(>|t|), one row per ROI and factor level. t-values are standard normal with a small share of ROIs shifted to
+# look like effects, and p-values are the matching two-sided normal p-values, so masks and lists are non-trivial.
+
+#     ind_vars = write_tree("analyses", n_ind_vars=2)                                      # continuous ind_vars
+#     ind_vars = write_tree("analyses", n_ind_vars=1000, levels=["exposuresone", "exposurestwo+"])   # categorical
+#     python synthetic_coefs.py analyses --ind-vars 1000 --levels exposuresone exposurestwo+
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import math
+import os
+from atlases import ATLASES, as_atlas
+
+N_ROIS = {"desikan": 71, "fiber.at": 42, "aseg": 30, "destrieux": 148} # ROIs per atlas in the ABCD release
+
+#%% Function def
+
+def table_stem(prefix, roi_prefix): # complete a dep var prefix so the ROI marker follows it, e.g. "dmri_rsi.vol_fiber" -> "dmri_rsi.vol_fiber.at"
+    marker = roi_prefix.rstrip('_')
+    for k in range(len(marker), 0, -1):
+        if prefix.endswith(marker[:k]):
+            return prefix + marker[k:]
+    return prefix + '.' + marker
+
+def pvalues_normal(t): # two-sided p-values of standard normal scores
+    erfc = np.frompyfunc(math.erfc, 1, 1)
+    return erfc(np.abs(t) / math.sqrt(2)).astype(float)
+
+def coef_table(dep_vars, levels, rng, effect_share=0.1, effect_size=3.0): # csv text of one table_coefs file
+    n = len(dep_vars) * len(levels)
+    t = rng.standard_normal(n)
+    shifted = rng.random(n) < effect_share
+    t[shifted] += np.where(rng.random(shifted.sum()) < 0.5, -effect_size, effect_size)
+    se = rng.uniform(0.01, 0.1, n)
+    p = pvalues_normal(t)
+    lines = ['"","dep_var","parameter_comp","Estimate","Std. Error","t value","Pr(>|t|)"']
+    rows = [(dep_var, level) for dep_var in dep_vars for level in levels]
+    for (k, (dep_var, level)) in enumerate(rows):
+        lines.append('"%d","%s","%s",%.8g,%.8g,%.8g,%.8g' % (k + 1, dep_var, level, t[k] * se[k], se[k], t[k], p[k]))
+    return '\n'.join(lines) + '\n'
+
+def write_tree(root_dir, n_ind_vars=2, levels=None, atlases=("desikan", "fiber.at", "aseg"), n_rois=None, seed=0):
+    # levels = factor levels of a categorical ind_var (parameter_comp), None = continuous (parameter_comp = var name)
+    # returns {folder : var} for coef_dirs / load_coefs
+    rng = np.random.default_rng(seed)
+    n_rois = dict(N_ROIS, **(n_rois or {}))
+    ind_vars = {"synth_%04d" % i: "synth_var_%04d" % i for i in range(n_ind_vars)}
+    for (folder, var) in ind_vars.items():
+        directory = os.path.join(root_dir, folder, var, "tables", "table_coefs")
+        os.makedirs(directory, exist_ok=True)
+        for atlas in map(as_atlas, atlases):
+            for prefix in atlas.measures:
+                stem = table_stem(prefix, atlas.roi_prefix or atlas.name)
+                dep_vars = ["%s_roi%03d" % (stem, r) for r in range(n_rois[atlas.name])]
+                with open(os.path.join(directory, stem + '.csv'), 'w') as f:
+                    f.write(coef_table(dep_vars, levels or [var], rng))
+    return ind_vars
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic DEAPext table_coefs trees")
+    parser.add_argument("root_dir", help="dir of analysis folders to write into")
+    parser.add_argument("--ind-vars", type=int, default=2, help="number of ind_var folders")
+    parser.add_argument("--levels", nargs="+", help="factor levels of a categorical ind_var (default continuous)")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    ind_vars = write_tree(args.root_dir, args.ind_vars, args.levels, args.atlas, seed=args.seed)
+    print("wrote %d ind_vars to %s" % (len(ind_vars), args.root_dir))
+
+if __name__ == "__main__":
+    main()
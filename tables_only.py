@@ -0,0 +1,103 @@
+#%% README
+
+# Tables-only entry point: the lists/*.csv of significantly affected ROIs for one study, without ever importing
+# matplotlib or seaborn (pandas is only loaded if a table actually has to be parsed), for launching from a scheduler
+
+# Lists are named like the scripts name them, <folder><atlas suffix>.csv (e.g. reading_hours_AT.csv), or
+# <folder>_<level><atlas suffix>.csv when several factor levels are compared, and with
+# --arrays the (ind_var x ROI x measure x stat) coefficient array, q-values and ROI labels of each atlas are kept in
+# <atlas>_coefs.npz next to them.
+
+#     python tables_only.py analyses plots/reading/lists --ind-var reading_hours=sports_activity_ss_read_hours_p \
+#         --ind-var reading_years=sports_activity_ss_read_years_p --atlas desikan fiber.at aseg
+#     python tables_only.py analyses plots/affected/lists --ind-var affected --category affectedYes --correction bh
+#     python tables_only.py analyses plots/ptsd/lists --ind-var ptsd_categorized=exposures --category exposuresone exposurestwo+
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import instrument
+import os
+from atlases import ATLASES, as_atlas
+from deap_coefs import coef_dirs, load_coefs, load_levels, T, P
+from roi_lists import sig_rois
+from correction import correct, METHODS, FAMILIES
+
+#%% Function def
+
+def load_study(root_dir, ind_vars, atlases, category=None, correction=None, family="atlas", workers=1, cache_dir=None, memo=None): # [(atlas, coefs, rois, qvalues)] per atlas
+    # category = one factor level, or a list of levels stacked on the ind_var axis (every folder at the first level, then the next ...)
+    # memo = dict shared between studies so tables read by several of them are only loaded once
+    atlases = [as_atlas(atlas) for atlas in atlases]
+    directories = coef_dirs(root_dir, ind_vars)
+    levels = tuple(category) if isinstance(category, (list, tuple)) else category
+    loaded = []
+    for atlas in atlases:
+        key = (tuple(directories), atlas.name, levels)
+        if memo is not None and key in memo:
+            loaded.append(memo[key])
+            continue
+        if isinstance(levels, tuple): # every level pivoted out of one parse per file, level-major on the ind_var axis
+            coefs, rois = load_levels(directories, atlas, levels, workers, cache_dir)
+            result = (coefs.reshape((-1,) + coefs.shape[2:]), rois)
+        else:
+            result = load_coefs(directories, atlas, levels, workers, cache_dir)
+        if memo is not None:
+            memo[key] = result
+        loaded.append(result)
+    qvalues = correct([coefs[...,P] for (coefs, rois) in loaded], correction, family) # one family can span every atlas ('study')
+    return [(atlas, coefs, rois, q) for (atlas, (coefs, rois), q) in zip(atlases, loaded, qvalues)]
+
+def panel_names(ind_vars, category=None): # one name per ind_var axis entry of load_study, e.g. "ptsd_categorized_exposuresone"
+    if isinstance(category, (list, tuple)):
+        return [folder + '_' + level for level in category for folder in ind_vars]
+    return list(ind_vars)
+
+def write_lists(root_dir, ind_vars, atlases, save_dir, category=None, correction=None, family="atlas", alpha=0.05,
+                workers=1, cache_dir=None, archive=None, arrays=False): # ind_vars = {folder : var} or [folder], returns the list names written
+    written = []
+    for (atlas, coefs, rois, q) in load_study(root_dir, ind_vars, atlases, category, correction, family, workers, cache_dir):
+        names = [name + atlas.suffix + '.csv' for name in panel_names(ind_vars, category)]
+        sig_rois(coefs[...,T], coefs[...,P], atlas.xlabels, rois, save_dir, names, alpha,
+                 qvalues=None if correction is None else q, archive=archive)
+        if arrays:
+            os.makedirs(save_dir, exist_ok=True)
+            np.savez(os.path.join(save_dir, atlas.name + '_coefs.npz'), coefs=coefs, qvalues=q, rois=rois, xlabels=atlas.xlabels)
+        written += names
+    return written
+
+def parse_ind_vars(items): # "folder=var" pairs -> {folder : var}, bare folders -> [folder]
+    pairs = [item.split('=', 1) for item in items]
+    if all(len(pair) == 2 for pair in pairs):
+        return dict(pairs)
+    if any(len(pair) == 2 for pair in pairs):
+        raise ValueError("give every --ind-var as folder=var, or every one as a bare folder")
+    return list(items)
+
+def parse_category(levels): # --category values -> None, one factor level, or a list of levels shown side by side
+    return levels[0] if levels and len(levels) == 1 else levels
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write the lists of significant ROIs for one study without plotting")
+    parser.add_argument("root_dir", help="dir of analysis folders (analyses)")
+    parser.add_argument("save_dir", help="dir the lists are written to (plots/<study>/lists)")
+    parser.add_argument("--ind-var", action="append", required=True, help="folder=var, or a folder holding tables directly (repeatable)")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES))
+    parser.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp to compare for a categorical ind_var")
+    parser.add_argument("--correction", choices=METHODS, help="threshold corrected q-values instead of raw p-values")
+    parser.add_argument("--family", default="atlas", choices=FAMILIES)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=1, help="processes for parsing, 0 = all cores")
+    parser.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    parser.add_argument("--archive", help="write the lists into this .zip instead of save_dir")
+    parser.add_argument("--arrays", action="store_true", help="also save each atlas's coefficient array as .npz")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure_args(args)
+    category = parse_category(args.category)
+    written = write_lists(args.root_dir, parse_ind_vars(args.ind_var), args.atlas, args.save_dir, category,
+                          args.correction, args.family, args.alpha, args.workers or None, args.cache_dir, args.archive, args.arrays)
+    print("wrote %d lists to %s" % (len(written), args.archive or args.save_dir))
+
+if __name__ == "__main__":
+    main()
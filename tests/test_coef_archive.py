@@ -0,0 +1,29 @@
+import os
+import zipfile
+import numpy as np
+from coef_archive import join_source, listdir, split_source
+from deap_coefs import coef_dirs, load_coefs
+from synthetic_coefs import write_tree
+
+def test_join_split_round_trip():
+    path = join_source("deap.zip::analyses", "affected", "tables", "table_coefs")
+    assert path == "deap.zip::analyses/affected/tables/table_coefs"
+    assert split_source(path) == ("deap.zip", "analyses/affected/tables/table_coefs")
+    assert split_source("analyses") == (None, "analyses")
+
+def test_zip_matches_directory(tmp_path):
+    root = str(tmp_path / "analyses")
+    ind_vars = write_tree(root, n_ind_vars=2, atlases=("aseg",), n_rois={"aseg": 5})
+    archive = str(tmp_path / "deap.zip")
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for (directory, _, files) in os.walk(root):
+            for name in files:
+                path = os.path.join(directory, name)
+                zf.write(path, os.path.relpath(path, str(tmp_path)))
+    directories = coef_dirs(archive + "::analyses", ind_vars)
+    assert sorted(listdir(directories[0])) == sorted(os.listdir(coef_dirs(root, ind_vars)[0]))
+    coefs, rois = load_coefs(directories, "aseg")
+    expected, expected_rois = load_coefs(coef_dirs(root, ind_vars), "aseg")
+    assert coefs.shape[:2] == (2, 5)
+    np.testing.assert_array_equal(rois, expected_rois)
+    np.testing.assert_array_equal(coefs, expected)
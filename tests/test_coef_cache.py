@@ -0,0 +1,35 @@
+import os
+import numpy as np
+import coef_cache
+from coef_cache import cached_coefs
+from deap_coefs import T
+
+HEADER = '"","dep_var","parameter_comp","Estimate","Std. Error","t value","Pr(>|t|)"\n'
+
+def write_table(path, t): # one-row table_coefs file with the given t value
+    with open(path, 'w') as f:
+        f.write(HEADER + '"1","x_roi001","var",0.1,0.05,%g,0.5\n' % t)
+
+def test_reparsed_after_change(tmp_path, monkeypatch):
+    parsed = []
+    parse = coef_cache.parse_hashed
+    monkeypatch.setattr(coef_cache, "parse_hashed", lambda path: parsed.append(path) or parse(path))
+    path, cache_dir = str(tmp_path / "x.csv"), str(tmp_path / "cache")
+    write_table(path, 2.0)
+    assert cached_coefs([path], cache_dir)[0][2][0, T] == 2.0
+    assert cached_coefs([path], cache_dir)[0][2][0, T] == 2.0
+    assert len(parsed) == 1 # second run served from the cache
+    st = os.stat(path)
+    write_table(path, 3.0) # same size, new contents and mtime
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cached_coefs([path], cache_dir)[0][2][0, T] == 3.0
+    assert len(parsed) == 2
+
+def test_touch_keeps_parse(tmp_path, monkeypatch):
+    path, cache_dir = str(tmp_path / "x.csv"), str(tmp_path / "cache")
+    write_table(path, 2.0)
+    first = cached_coefs([path], cache_dir)[0]
+    monkeypatch.setattr(coef_cache, "parse_hashed", None) # any re-parse would fail
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9)) # new mtime, same contents
+    np.testing.assert_array_equal(cached_coefs([path], cache_dir)[0][2], first[2])
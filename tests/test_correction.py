@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from correction import adjust_rows, correct
+
+P = [0.01, 0.04, 0.03, 0.005, 0.2] # unsorted, so the adjusted values have to be put back in cell order
+
+# reference values as given by R's p.adjust(P, method)
+REFERENCE = {
+    "bh": [0.025, 0.05, 0.05, 0.025, 0.2],
+    "by": [0.025 * 137 / 60, 0.05 * 137 / 60, 0.05 * 137 / 60, 0.025 * 137 / 60, 0.2 * 137 / 60], # harmonic number c(5) = 137/60
+    "bonferroni": [0.05, 0.2, 0.15, 0.025, 1.0],
+    "holm": [0.04, 0.09, 0.09, 0.025, 0.2],
+}
+
+@pytest.mark.parametrize("method", sorted(REFERENCE))
+def test_reference_values(method):
+    np.testing.assert_allclose(adjust_rows([P], method)[0], REFERENCE[method])
+
+@pytest.mark.parametrize("method", sorted(REFERENCE))
+def test_nan_left_out_of_family(method):
+    q = adjust_rows([P[:2] + [np.nan] + P[2:]], method)[0]
+    assert np.isnan(q[2])
+    np.testing.assert_allclose(np.delete(q, 2), REFERENCE[method])
+
+def test_families_of_one_array():
+    p = np.array(P * 4).reshape(1, 5, 4, order="F") # (ind_var x ROI x measure), every measure column holds P
+    np.testing.assert_allclose(correct(p, "bh", "measure")[0], np.array([REFERENCE["bh"]] * 4).T)
+    np.testing.assert_allclose(correct(p, "bonferroni", "atlas"), np.minimum(p * 20, 1))
+
+def test_no_method_returns_pvalues():
+    p = np.array(P)
+    assert correct(p, None) is p
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        adjust_rows([P], "fdr")
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+from deap_coefs import coef_dirs, load_coefs, pivot_levels, select_level
+from synthetic_coefs import write_tree
+
+def parsed_table(levels): # (dep_var, parameter_comp, rows x stats) of two ROIs, rows interleaved by level as DEAPext writes them
+    dep_var = np.array(["roi_a", "roi_b"]).repeat(len(levels))
+    level = np.array(levels * 2)
+    stats = np.arange(len(dep_var) * 4, dtype=float).reshape(-1, 4)
+    return dep_var, level, stats
+
+def test_pivot_two_levels():
+    dep_var, level, stats = parsed_table(["one", "two"])
+    labels, pivoted = pivot_levels((dep_var, level, stats), ["two", "one"])
+    assert list(labels) == ["roi_a", "roi_b"]
+    assert pivoted.shape == (2, 2, 4)
+    np.testing.assert_array_equal(pivoted[0], stats[[1, 3]]) # asked-for order, not file order
+    np.testing.assert_array_equal(pivoted[1], stats[[0, 2]])
+
+def test_pivot_missing_level_is_nan():
+    labels, pivoted = pivot_levels(parsed_table(["one", "two"]), ["one", "three"])
+    assert list(labels) == ["roi_a", "roi_b"]
+    assert not np.isnan(pivoted[0]).any()
+    assert np.isnan(pivoted[1]).all()
+
+def test_pivot_uneven_levels():
+    dep_var, level, stats = parsed_table(["one", "two"])
+    with pytest.raises(ValueError):
+        pivot_levels((dep_var[:3], level[:3], stats[:3]), ["one", "two"])
+
+def test_select_level_needs_category():
+    parsed = parsed_table(["one", "two"])
+    with pytest.raises(ValueError, match="one, two"):
+        select_level(parsed)
+    dep_var, stats = select_level(parsed, "two")
+    assert list(dep_var) == ["roi_a", "roi_b"]
+    np.testing.assert_array_equal(stats, parsed[2][[1, 3]])
+    dep_var, stats = select_level(parsed_table(["one"])) # a single level needs no category
+    assert len(dep_var) == 2
+
+def test_load_coefs_rejects_levels_as_rois(tmp_path):
+    ind_vars = write_tree(str(tmp_path), n_ind_vars=1, levels=["one", "two"], atlases=("aseg",), n_rois={"aseg": 5})
+    with pytest.raises(ValueError, match="pass category"):
+        load_coefs(coef_dirs(str(tmp_path), ind_vars), "aseg")
+    coefs, rois = load_coefs(coef_dirs(str(tmp_path), ind_vars), "aseg", "one")
+    assert coefs.shape[1] == len(rois) == 5
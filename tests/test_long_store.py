@@ -0,0 +1,15 @@
+import os
+from long_store import LongStore, build_release
+from synthetic_coefs import write_tree
+
+def test_release_skips_categorical_folder_without_category(tmp_path):
+    root = str(tmp_path / "analyses")
+    write_tree(root, n_ind_vars=1, atlases=("aseg",), n_rois={"aseg": 5}) # continuous synth_0000
+    write_tree(str(tmp_path / "levels"), n_ind_vars=1, levels=["one", "two"], atlases=("aseg",), n_rois={"aseg": 5})
+    os.rename(str(tmp_path / "levels" / "synth_0000"), os.path.join(root, "categorical"))
+    rows, skipped = build_release(str(tmp_path / "store"), root, ["aseg"])
+    assert list(skipped) == ["categorical"] and "factor levels" in skipped["categorical"]
+    assert rows == 5 * 7
+    store = LongStore(str(tmp_path / "store"))
+    assert list(store.labels("ind_var")) == ["synth_0000"]
+    assert len(store.query(roi=store.labels("roi")[0])["t"]) == 7 # one row per measure, not one per level
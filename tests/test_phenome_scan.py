@@ -0,0 +1,19 @@
+import os
+from phenome_scan import scan
+from synthetic_coefs import write_tree
+
+def test_categorical_folder_without_category_is_an_error(tmp_path):
+    root = str(tmp_path / "analyses")
+    write_tree(root, n_ind_vars=1, atlases=("aseg",), n_rois={"aseg": 5}) # continuous synth_0000
+    write_tree(str(tmp_path / "levels"), n_ind_vars=1, levels=["one", "two"], atlases=("aseg",), n_rois={"aseg": 5})
+    os.rename(str(tmp_path / "levels" / "synth_0000"), os.path.join(root, "categorical"))
+    rows = {row["ind_var"]: row for (atlas, row) in scan(root, ["aseg"])}
+    assert rows["synth_0000"]["error"] == ''
+    assert rows["synth_0000"]["tests"] == 5 * 7 # every ROI of every aseg measure, counted once
+    assert "factor levels" in rows["categorical"]["error"]
+    assert rows["categorical"]["tests"] == '' # not summarized
+
+def test_categorical_folder_with_category(tmp_path):
+    write_tree(str(tmp_path), n_ind_vars=1, levels=["one", "two"], atlases=("aseg",), n_rois={"aseg": 5})
+    (atlas, row), = scan(str(tmp_path), ["aseg"], category="two")
+    assert row["error"] == '' and row["level"] == "two" and row["tests"] == 5 * 7
@@ -0,0 +1,106 @@
+#%% README
+
+# Robustness of a study's findings over a whole vector of p cut-offs and correction methods, from one load of the tables
+
+# The (ind_var x ROI x measure) p-values are corrected once per method and stacked to (method x ind_var x ROI x measure),
+# then compared against every threshold in one broadcast, (method x ind_var x ROI x measure x threshold). From that:
+#     <atlas>_survival.csv - one row per cell that survives the loosest threshold under some method: ind_var, measure,
+#                            ROI, t, p, then per method the strictest threshold the cell still survives ('' = none)
+#     <atlas>_sweep.csv    - one row per ind_var x method x measure: number of ROIs surviving each threshold
+# 'none' thresholds the raw p-values, the others are the methods of correction.py, each over the same family.
+
+#     strictest, counts = sweep(qstack, [0.05, 0.01, 0.001])      # qstack = correction_stack(...)[k] for atlas k
+#     python threshold_sweep.py analyses plots/reading/sweep --ind-var reading_hours=sports_activity_ss_read_hours_p \
+#         --ind-var reading_years=sports_activity_ss_read_years_p --corrections none bh holm --thresholds 0.05 0.01 0.005 0.001
+#     python threshold_sweep.py analyses plots/ptsd/sweep --ind-var ptsd_categorized=exposures --category exposuresone exposurestwo+
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import csv
+import instrument
+import os
+from atlases import ATLASES
+from deap_coefs import T, P
+from correction import correct, METHODS, FAMILIES
+from instrument import span
+from tables_only import load_study, panel_names, parse_category, parse_ind_vars
+
+CORRECTIONS = ("none",) + METHODS
+THRESHOLDS = (0.05, 0.01, 0.005, 0.001, 0.0001)
+
+#%% Function def
+
+def correction_stack(pvalues, corrections=("none", "bh"), family="atlas"): # per atlas, (method x ind_var x ROI x measure) q-values, pvalues = list of per-atlas p arrays
+    for method in corrections:
+        if method not in CORRECTIONS:
+            raise ValueError("unknown correction %r, expected one of %s" % (method, ", ".join(CORRECTIONS)))
+    per_method = [correct(pvalues, None if method == "none" else method, family) for method in corrections] # a family can span the atlases
+    return [np.stack([q[k] for q in per_method]) for k in range(len(pvalues))]
+
+def sweep(qstack, thresholds=THRESHOLDS): # (strictest threshold per cell, NaN if none; ROIs surviving each threshold), thresholds in any order
+    thresholds = np.sort(np.asarray(thresholds, dtype=float)) # strictest first
+    survives = qstack[..., None] < thresholds # same test as the lists (p < alpha), NaN survives nothing
+    first = survives.argmax(axis=-1) # survival is monotone in the threshold, so the first hit is the strictest one
+    strictest = np.where(survives.any(axis=-1), thresholds[first], np.nan)
+    counts = survives.sum(axis=-3) # over ROIs: (method x ind_var x measure x threshold)
+    return strictest, counts
+
+def format_threshold(x):
+    return '' if np.isnan(x) else '%g' % x
+
+def write_sweep(root_dir, ind_vars, atlases, save_dir, category=None, corrections=("none", "bh"), family="atlas",
+                thresholds=THRESHOLDS, workers=1, cache_dir=None): # two csvs per atlas, returns the files written
+    loaded = load_study(root_dir, ind_vars, atlases, category, None, workers=workers, cache_dir=cache_dir)
+    qstacks = correction_stack([coefs[...,P] for (atlas, coefs, rois, q) in loaded], corrections, family)
+    loosest_first = sorted(thresholds, reverse=True) # column order of the sweep table, counts come strictest first
+    names = panel_names(ind_vars, category)
+    os.makedirs(save_dir, exist_ok=True)
+    written = []
+    for ((atlas, coefs, rois, q), qstack) in zip(loaded, qstacks):
+        strictest, counts = sweep(qstack, thresholds)
+        with span("export") as counted:
+            path = os.path.join(save_dir, atlas.name + '_survival.csv')
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["ind_var", "measure", "roi", "t", "p"] + list(corrections))
+                k_, r_, m_ = np.nonzero(~np.isnan(strictest).all(axis=0)) # cells surviving under some method
+                for (k, m, r) in sorted(zip(k_, m_, r_)): # by ind_var, then measure as the lists are laid out
+                    writer.writerow([names[k], atlas.xlabels[m], rois[r], round(coefs[k,r,m,T], 5), round(coefs[k,r,m,P], 5)]
+                                    + [format_threshold(x) for x in strictest[:,k,r,m]])
+            written.append(path)
+            path = os.path.join(save_dir, atlas.name + '_sweep.csv')
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(["ind_var", "correction", "measure"] + ['%g' % x for x in loosest_first])
+                for (k, name) in enumerate(names):
+                    for (c, method) in enumerate(corrections):
+                        for (m, label) in enumerate(atlas.xlabels):
+                            writer.writerow([name, method, label] + list(counts[c,k,m,::-1]))
+            written.append(path)
+            counted["files"] = 2
+            counted["bytes"] = sum(os.path.getsize(p) for p in written[-2:])
+    return written
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep p cut-offs and corrections over one study and tabulate which ROIs survive")
+    parser.add_argument("root_dir", help="dir of analysis folders (analyses)")
+    parser.add_argument("save_dir", help="dir the <atlas>_survival.csv and <atlas>_sweep.csv files are written to")
+    parser.add_argument("--ind-var", action="append", required=True, help="folder=var, or a folder holding tables directly (repeatable)")
+    parser.add_argument("--atlas", nargs="+", default=["desikan", "fiber.at", "aseg"], choices=sorted(ATLASES))
+    parser.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp to compare for a categorical ind_var")
+    parser.add_argument("--corrections", nargs="+", default=["none", "bh"], choices=CORRECTIONS)
+    parser.add_argument("--family", default="atlas", choices=FAMILIES)
+    parser.add_argument("--thresholds", nargs="+", type=float, default=list(THRESHOLDS))
+    parser.add_argument("--workers", type=int, default=1, help="processes for parsing, 0 = all cores")
+    parser.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    instrument.add_arguments(parser)
+    args = parser.parse_args(argv)
+    instrument.configure_args(args)
+    category = parse_category(args.category)
+    written = write_sweep(args.root_dir, parse_ind_vars(args.ind_var), args.atlas, args.save_dir, category, args.corrections,
+                          args.family, args.thresholds, args.workers or None, args.cache_dir)
+    print("wrote %d tables to %s" % (len(written), args.save_dir))
+
+if __name__ == "__main__":
+    main()
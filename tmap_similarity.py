@@ -0,0 +1,151 @@
+#%% README
+
+# Similarity between every pair of ROI t-maps, across ind_vars and measures (e.g. FA WM vs NODDI GM), as one matrix
+
+# Every (ind_var, measure) column of a coefficient array is one t-map over the atlas ROIs. Maps are standardized once
+# (ranked first for Spearman) and scaled so that the correlation of two maps is their dot product; the whole matrix is
+# then a matrix product, taken chunk rows at a time so very large sets can go into a float32 memmap instead of RAM.
+# Missing cells are mean-imputed, i.e. they add nothing to either map; a map with fewer than two values is all NaN.
+
+#     maps, labels = tmaps(coefs, ["psych_total", "psych_severity"], atlas.xlabels)
+#     matrix = similarity(maps, "spearman")
+#     render_similarity(matrix, labels, "plots/psychosis_similarity.pdf")
+#     python tmap_similarity.py analyses plots/reading/similarity --ind-var reading_hours=sports_activity_ss_read_hours_p \
+#         --ind-var reading_years=sports_activity_ss_read_years_p --atlas desikan --method spearman --plot
+#     python tmap_similarity.py --store results/desikan plots/scan/similarity --chunk 2048   # every ind_var of a result store
+#     python tmap_similarity.py analyses plots/psychosis/similarity --ind-var psych_total=prodrom_psych_ss_number \
+#         --ind-var psych_severity=prodrom_psych_ss_severity_score --permutations 10000 --workers 0   # with p-values, see permutation_null.py
+
+#%% Housekeeping
+import numpy as np
+import argparse
+import os
+from atlases import ATLASES
+from deap_coefs import T
+from tables_only import load_study, panel_names, parse_category, parse_ind_vars
+
+METHODS = ("pearson", "spearman")
+
+#%% Function def
+
+def tmaps(coefs, names, xlabels): # (maps x ROI) t-values of every ind_var x measure, with "ind_var: measure" labels
+    t = np.asarray(coefs[...,T])
+    maps = np.transpose(t, (0, 2, 1)).reshape(-1, t.shape[1])
+    labels = ["%s: %s" % (name, label) for name in names for label in xlabels]
+    return maps, labels
+
+def rank_rows(x): # average ranks within each row (ties share their mean rank), NaN stays NaN
+    x = np.asarray(x, dtype=float)
+    n = x.shape[1]
+    order = np.argsort(x, axis=1, kind="stable") # NaN sorted to the end
+    s = np.take_along_axis(x, order, axis=1)
+    new = np.ones(x.shape, bool)
+    new[:, 1:] = s[:, 1:] != s[:, :-1] # NaN != NaN, so NaN never tie
+    last = np.ones(x.shape, bool)
+    last[:, :-1] = new[:, 1:]
+    cols = np.arange(n)
+    start = np.maximum.accumulate(np.where(new, cols, 0), axis=1)
+    end = np.minimum.accumulate(np.where(last, cols, n - 1)[:, ::-1], axis=1)[:, ::-1]
+    ranks = np.empty_like(x)
+    np.put_along_axis(ranks, order, (start + end) / 2 + 1, axis=1)
+    ranks[np.isnan(x)] = np.nan
+    return ranks
+
+def standardize(maps, method="pearson"): # rows scaled so that row . row = correlation, NaN -> 0
+    if method not in METHODS:
+        raise ValueError("unknown method %r, expected one of %s" % (method, ", ".join(METHODS)))
+    x = rank_rows(maps) if method == "spearman" else np.asarray(maps, dtype=float)
+    valid = ~np.isnan(x)
+    count = valid.sum(axis=1, keepdims=True)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centred = np.where(valid, x - np.nansum(x, axis=1, keepdims=True) / count, 0)
+        z = centred / np.sqrt((centred ** 2).sum(axis=1, keepdims=True))
+    z[(count < 2).ravel()] = np.nan # too few values to correlate
+    return z
+
+def similarity(maps, method="pearson", chunk=None, out=None): # (maps x maps) correlation matrix, chunk = rows per product, out = preallocated (e.g. memmap) result
+    z = standardize(maps, method)
+    n = len(z)
+    if out is None:
+        out = np.empty((n, n), np.float32)
+    chunk = chunk or n or 1
+    zt = np.ascontiguousarray(z.T)
+    for start in range(0, n, chunk):
+        out[start:start + chunk] = np.clip(z[start:start + chunk] @ zt, -1, 1) # rounding can overshoot |r| = 1
+    return out
+
+def render_similarity(matrix, labels, save_path, figsize=(12,10), max_labels=80): # similarity matrix as a diverging heatmap, labels only while they stay legible
+    from matplotlib.figure import Figure
+    from heatmap_render import diverging_cmap
+    fig = Figure(figsize=figsize)
+    ax = fig.subplots()
+    image = ax.imshow(matrix, cmap=diverging_cmap(), vmin=-1, vmax=1, interpolation='nearest')
+    if len(labels) <= max_labels:
+        ax.set_xticks(np.arange(len(labels)))
+        ax.set_xticklabels(labels, rotation=90, fontsize=6)
+        ax.set_yticks(np.arange(len(labels)))
+        ax.set_yticklabels(labels, fontsize=6)
+    else:
+        ax.set_xticks([])
+        ax.set_yticks([])
+    for spine in ax.spines.values():
+        spine.set_visible(False)
+    cbar = fig.colorbar(image, ax=ax)
+    cbar.outline.set_linewidth(0)
+    directory = os.path.dirname(save_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    fig.savefig(save_path, bbox_inches='tight')
+    return fig
+
+def store_maps(path): # every t-map of a result store (see result_store.py)
+    from result_store import ResultStore
+    store = ResultStore(path)
+    return tmaps(store.coefs, store.ind_vars, store.xlabels)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Correlate every pair of ROI t-maps across ind_vars and measures")
+    parser.add_argument("root_dir", nargs="?", help="dir of analysis folders (analyses), not needed with --store")
+    parser.add_argument("out", help="output prefix: <out>.npz holds the matrix and labels, <out>.pdf the plot")
+    parser.add_argument("--ind-var", action="append", help="folder=var, or a folder holding tables directly (repeatable)")
+    parser.add_argument("--atlas", default="desikan", choices=sorted(ATLASES), help="maps are compared within one atlas, whose ROIs they share")
+    parser.add_argument("--category", nargs="+", help="factor level(s) of parameter_comp for a categorical ind_var")
+    parser.add_argument("--store", help="take the maps from a result store instead of the tables")
+    parser.add_argument("--method", default="pearson", choices=METHODS)
+    parser.add_argument("--chunk", type=int, help="rows per matrix product, limits the temporary memory")
+    parser.add_argument("--memmap", action="store_true", help="build the matrix in <out>.f32 on disk instead of in memory")
+    parser.add_argument("--plot", action="store_true", help="also render the matrix to <out>.pdf")
+    parser.add_argument("--cache-dir", help="keep parsed tables in this cache between runs")
+    parser.add_argument("--permutations", type=int, default=0, help="ROI-label permutations for p-values of every pair, kept as pvalues in <out>.npz")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="processes for the permutations, 0 = all cores")
+    args = parser.parse_args(argv)
+    if args.store:
+        maps, labels = store_maps(args.store)
+    else:
+        if not (args.root_dir and args.ind_var):
+            parser.error("give root_dir and --ind-var, or --store")
+        ind_vars = parse_ind_vars(args.ind_var)
+        category = parse_category(args.category)
+        [(atlas, coefs, rois, q)] = load_study(args.root_dir, ind_vars, [args.atlas], category, cache_dir=args.cache_dir)
+        maps, labels = tmaps(coefs, panel_names(ind_vars, category), atlas.xlabels)
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    out = np.memmap(args.out + '.f32', dtype=np.float32, mode='w+', shape=(len(maps), len(maps))) if args.memmap else None
+    matrix = similarity(maps, args.method, args.chunk, out)
+    arrays = {"labels": np.array(labels, dtype=str)}
+    if args.memmap:
+        matrix.flush()
+    else:
+        arrays["similarity"] = matrix
+    if args.permutations:
+        from permutation_null import permutation_test
+        arrays["pvalues"] = permutation_test(maps, args.method, args.permutations, args.seed, workers=args.workers or None)[1]
+    np.savez(args.out + '.npz', **arrays)
+    if args.plot:
+        render_similarity(matrix, labels, args.out + '.pdf')
+    print("%d x %d %s similarity matrix written to %s" % (len(maps), len(maps), args.method, args.out + ('.f32' if args.memmap else '.npz')))
+
+if __name__ == "__main__":
+    main()